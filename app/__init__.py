@@ -2,6 +2,8 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 import os, config
 from flask_migrate import Migrate
+from .database import configure_engine, migration_include_name
+from .monitoring import instrument_app
 
 # создание экземпляра приложения
 app = Flask(__name__)
@@ -9,7 +11,10 @@ app.config.from_object(os.environ.get('FLASK_ENV') or 'config.DevelopementConfig
 
 # инициализирует расширения
 db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+migrate = Migrate(app, db, render_as_batch=True, include_name=migration_include_name)
+with app.app_context():
+    configure_engine(db.engine, app.config.get('SQLITE_PRAGMAS'))
+    instrument_app(app, db.engine)
 
 # import views
 from . import views
@@ -0,0 +1,43 @@
+from sqlalchemy import event
+
+
+def sqlite_pragma_statements(pragmas):
+    """ Returns the PRAGMA statements for a dict of pragma names and values. """
+    return [f'PRAGMA {name}={value}' for name, value in pragmas.items()]
+
+
+def configure_engine(engine, pragmas):
+    """ Sets up the engine so that every pooled SQLite connection has the
+    given pragmas applied once, when it is first opened.  Other databases
+    are left alone.
+    """
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+    statements = sqlite_pragma_statements(pragmas)
+
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+
+
+# Monthly partitions of the data table are named data_pYYYYMM and are
+# created at run time (see partitions.py), not by migrations.
+PARTITION_PREFIX = 'data_p'
+
+
+def is_partition_name(name):
+    """ Returns True if name is a data partition table or one of its indexes. """
+    for prefix in (PARTITION_PREFIX, 'ix_' + PARTITION_PREFIX):
+        if name.startswith(prefix) and name[len(prefix):len(prefix) + 6].isdigit():
+            return True
+    return False
+
+
+def migration_include_name(name, type_, parent_names):
+    """ Keeps the run time partition tables out of migration autogenerate. """
+    if type_ in ('table', 'index') and name:
+        return not is_partition_name(name)
+    return True
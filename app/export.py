@@ -0,0 +1,80 @@
+import csv
+import io
+import json
+
+from app import db
+from .payloads import reading_of
+from .partitions import data_tables
+from .queries import source_range_query
+
+EXPORT_COLUMNS = ['_id', 'statusmod', 'data', 'posted_at', 'device_id']
+# posted_at as the data table stores it.
+STORED_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def iter_data_batches(start, finish, device_id=None, batch_size=1000):
+    """ Yields lists of at most batch_size Data rows (as plain tuples in
+    EXPORT_COLUMNS order, with packed payloads decoded into data) for the
+    given range.  The data table and then each overlapping partition are read
+    in turn.
+    The rows come from a streaming cursor on a connection of its own, read
+    with fetchmany, so only one batch is held in memory at a time.
+    """
+    tables = data_tables(start, finish)
+    with db.engine.connect() as conn:
+        for table in tables:
+            query = source_range_query(table, start, finish, device_id)
+            result = conn.execution_options(stream_results=True).execute(query).mappings()
+            while True:
+                rows = result.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [(row['_id'], row['statusmod'],
+                        reading_of(row['data'], row['payload'], row['layout_id']),
+                        row['posted_at'], row['device_id']) for row in rows]
+
+
+def ndjson_lines(batches):
+    """ Yields one chunk of newline delimited JSON per batch of rows. """
+    for rows in batches:
+        lines = []
+        for row in rows:
+            record = dict(zip(EXPORT_COLUMNS, row))
+            record['posted_at'] = record['posted_at'].isoformat()
+            lines.append(json.dumps(record))
+        yield '\n'.join(lines) + '\n'
+
+
+def csv_lines(batches):
+    """ Yields a header line and then one chunk of CSV per batch of rows.
+    The data column holds the JSON text of the reading.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue()
+    for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        for _id, statusmod, data, posted_at, device_id in rows:
+            writer.writerow([_id, statusmod, json.dumps(data),
+                             posted_at.isoformat(), device_id])
+        yield buffer.getvalue()
+
+
+def table_rows_json(batches):
+    """ Yields a JSON array of every row, one chunk per batch, each row being
+    the list of its EXPORT_COLUMNS as the data table holds them: data as
+    JSON text and posted_at in the stored format.  This is what
+    /get_data_by_postdate returned before it took a date range.
+    """
+    yield '['
+    separator = ''
+    for rows in batches:
+        if rows:
+            yield separator + ','.join(
+                json.dumps([_id, statusmod, json.dumps(data),
+                            posted_at.strftime(STORED_DATETIME_FORMAT), device_id])
+                for _id, statusmod, data, posted_at, device_id in rows)
+            separator = ','
+    yield ']\n'
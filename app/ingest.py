@@ -0,0 +1,123 @@
+import datetime
+import json
+import time
+
+from app import db
+from .fastschema import ROW_FIELDS, load_rows
+from .models import Data
+from .partitions import insert_data, insert_partitioned, partitioning_enabled
+from .payloads import layout_id, pack_row
+from .rollups import aggregate_columns, merge_rollups, update_rollups
+
+
+class IngestError(Exception):
+    """ Raised when a request body cannot be parsed into a list of records. """
+    pass
+
+
+def parse_records(body, mimetype):
+    """ Returns a list of records from a request body.
+    The body is either a JSON array of objects or NDJSON (one object per line,
+    blank lines ignored).  NDJSON is used when the mimetype says so or when the
+    body does not start with '['.
+    Raises IngestError if the body cannot be parsed.
+    """
+    text = body.decode('utf-8') if isinstance(body, bytes) else body
+    text = text.strip()
+    if not text:
+        return []
+    if mimetype != 'application/x-ndjson' and text.startswith('['):
+        try:
+            records = json.loads(text)
+        except ValueError as err:
+            raise IngestError(f'Invalid JSON: {err}')
+        if not isinstance(records, list):
+            raise IngestError('JSON body must be an array of records')
+        return records
+    records = []
+    for line_no, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError as err:
+            raise IngestError(f'Invalid JSON on line {line_no}: {err}')
+    return records
+
+
+def validate_records(records):
+    """ Validates every record in the batch.
+    Returns (rows, errors) where rows is a list of tuples in ROW_FIELDS
+    order, ready for insert_rows, and errors maps the index of each rejected
+    record to its error messages, as DataRowSchema would give them (see
+    fastschema.py).
+    """
+    return load_rows(records)
+
+
+def insert_rows(rows):
+    """ Inserts the validated rows with a single executemany, merges them into
+    the rollups and commits once.  Rows are tuples in ROW_FIELDS order,
+    optionally followed by posted_at (now when left out).  Readings that fit
+    the payload layout of their device type are stored packed, and with
+    DATA_PARTITIONING set rows go to the partition for their month.
+    Returns the number of rows written.
+    """
+    if rows:
+        now = datetime.datetime.utcnow()
+        rows = [row if len(row) > len(ROW_FIELDS) else row + (now,) for row in rows]
+        params = [pack_row(row) for row in rows]
+        if partitioning_enabled():
+            insert_partitioned(params)
+        else:
+            insert_data(Data.__table__, params)
+        update_rollups(rows)
+    db.session.commit()
+    return len(rows)
+
+
+def insert_packed(device_id, layout, buffer, posted_at, stride=None, offset=0):
+    """ Inserts readings of one device that arrive already packed in the
+    payload layout of its type, laid out in buffer as for
+    PayloadLayout.records (for example whole radio frames, with stride 32
+    and offset the header size).  The records are stored as they are and
+    decoded once, column by column, for the rollups, so no dict is built
+    per reading.  posted_at is a datetime for every record or a list with
+    one per record.  Runs in the caller's transaction.
+    Returns the number of rows.  Raises ValueError if a record does not
+    decode.
+    """
+    columns = layout.unpack_columns(buffer, stride, offset)
+    payloads = layout.records(buffer, stride, offset)
+    if not payloads:
+        return 0
+    times = [posted_at] * len(payloads) if isinstance(posted_at, datetime.datetime) else posted_at
+    stored_id = layout_id(layout)
+    params = [(None, None, device_id, when, payload, stored_id)
+              for payload, when in zip(payloads, times)]
+    if partitioning_enabled():
+        insert_partitioned(params)
+    else:
+        insert_data(Data.__table__, params)
+    merge_rollups(aggregate_columns(device_id, posted_at,
+                                    {name: columns[name] for name in layout.numeric_names}))
+    return len(params)
+
+
+def ingest_records(records):
+    """ Validates and stores a batch of Data records in one transaction.
+    Invalid records are skipped and reported, valid ones are inserted.
+    Returns a dict suitable for a JSON response.
+    """
+    start = time.perf_counter()
+    rows, errors = validate_records(records)
+    inserted = insert_rows(rows)
+    elapsed = time.perf_counter() - start
+    return {
+        'received': len(records),
+        'inserted': inserted,
+        'errors': errors,
+        'seconds': round(elapsed, 6),
+        'rows_per_second': round(inserted / elapsed, 1) if elapsed > 0 else None,
+    }
@@ -9,6 +9,8 @@ class  Devicetype(db.Model):
     __tablename__ = 'types_of_devices'
     _id = db.Column(db.Integer(), primary_key=True)
     name = db.Column(db.String(256), nullable=False)
+    # Optional [[name, struct code], ...] list, see payloads.PayloadLayout.
+    payload_layout = db.Column(db.JSON(), nullable=True)
     device = db.relationship('Device', backref='devicetype')
 
 
@@ -23,11 +25,27 @@ class Device(db.Model):
 
 class Data(db.Model):
     __tablename__ = 'data'
+    # Date range queries filter on posted_at, optionally for one device.
+    __table_args__ = (
+        db.Index('ix_data_device_id_posted_at', 'device_id', 'posted_at'),
+        db.Index('ix_data_posted_at', 'posted_at'),
+    )
     _id = db.Column(db.Integer(), primary_key=True)
     statusmod = db.Column(db.String(256), db.ForeignKey('statusmodels.name'))
-    data = db.Column(db.JSON(), nullable=False)
+    # Readings are stored either as JSON in data or, when the device type
+    # declares a payload layout, packed into payload with the id of the
+    # layout used in layout_id (see payloads.py).
+    data = db.Column(db.JSON(none_as_null=True), nullable=True)
     posted_at = db.Column(db.DateTime(), default=datetime.utcnow, nullable = False)
     device_id = db.Column(db.Integer(), db.ForeignKey('devices._id'))
+    payload = db.Column(db.LargeBinary(), nullable=True)
+    layout_id = db.Column(db.Integer(), db.ForeignKey('payload_layouts._id'), nullable=True)
+
+    @property
+    def reading(self):
+        """ The reading as a dict, decoded from payload on access. """
+        from .payloads import reading_of
+        return reading_of(self.data, self.payload, self.layout_id)
 
 
         
@@ -37,13 +55,57 @@ class Statusmodel(db.Model):
     data = db.relationship('Data', backref='status')
 
 
-class DataSchema(Schema):
+class DataLayout(db.Model):
+    """ A payload layout that Data rows have been packed with.  Rows are
+    added, never changed, so a packed row is decoded with the layout it was
+    stored with even after its device type's layout is edited or removed.
+    fields is the layout as JSON text (see payloads.PayloadLayout.definition).
+    """
+    __tablename__ = 'payload_layouts'
+    _id = db.Column(db.Integer(), primary_key=True)
+    fields = db.Column(db.Text(), nullable=False, unique=True)
+
+
+class DataPartition(db.Model):
+    """ One monthly partition table of Data, holding rows with
+    start <= posted_at < finish (see partitions.py).
+    """
+    __tablename__ = 'data_partitions'
+    name = db.Column(db.String(64), primary_key=True)
+    start = db.Column(db.DateTime(), nullable=False, index=True)
+    finish = db.Column(db.DateTime(), nullable=False)
+
+
+class Rollup(db.Model):
+    """ Aggregates of one numeric field of Data.data for one device over one
+    time bucket.  resolution is the bucket length in seconds (see rollups.py).
+    """
+    __tablename__ = 'data_rollups'
+    resolution = db.Column(db.Integer(), primary_key=True)
+    device_id = db.Column(db.Integer(), primary_key=True)
+    field = db.Column(db.String(64), primary_key=True)
+    bucket = db.Column(db.DateTime(), primary_key=True)
+    count = db.Column(db.Integer(), nullable=False)
+    sum = db.Column(db.Float(), nullable=False)
+    min = db.Column(db.Float(), nullable=False)
+    max = db.Column(db.Float(), nullable=False)
+
+
+class DataRowSchema(Schema):
+    """ Validates a Data record and loads it as a plain dict.  Used by the
+    bulk ingest path where building one ORM object per row is not wanted.
+    """
     _id = fields.Integer(dump_only=True)
     statusmod = fields.String()
-    data = fields.Raw()
+    data = fields.Raw(required=True)
     posted_at = fields.DateTime(dump_only=True)
     device_id = fields.Integer()
 
+
+class DataSchema(DataRowSchema):
+    data = fields.Function(lambda obj: obj.reading, deserialize=lambda value: value,
+                           required=True)
+
     @post_load
     def make_data(self, data, **kwargs):
         return Data(**data)
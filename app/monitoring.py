@@ -0,0 +1,98 @@
+import sys
+import time
+
+from flask import current_app, g, request
+from sqlalchemy import event
+
+from .nrf905.metrics import REGISTRY, Counter, Gauge, Histogram
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Time taken to answer each request.',
+    labelnames=['method', 'endpoint', 'status'])
+DB_QUERY_SECONDS = Histogram(
+    'db_query_duration_seconds', 'Time taken by each SQL statement.',
+    labelnames=['statement'])
+DB_QUERY_ERRORS = Counter(
+    'db_query_errors_total', 'SQL statements that raised an error.', labelnames=['statement'])
+
+
+def write_behind_stat(name):
+    # Imported here as the write-behind buffer needs the app to exist.
+    from .writebehind import write_behind
+    return write_behind.stats()[name]
+
+
+WRITE_BEHIND_DEPTH = Gauge(
+    'write_behind_queue_rows', 'Rows waiting in the write-behind buffer.',
+    function=lambda: write_behind_stat('queue_depth'))
+WRITE_BEHIND_REJECTED = Counter(
+    'write_behind_rejected_rows_total', 'Rows refused because the write-behind buffer was full.',
+    function=lambda: write_behind_stat('rejected_rows'))
+WRITE_BEHIND_FLUSHED = Counter(
+    'write_behind_flushed_rows_total', 'Rows written by the write-behind buffer.',
+    function=lambda: write_behind_stat('flushed_rows'))
+WRITE_BEHIND_FAILED = Counter(
+    'write_behind_failed_rows_total', 'Rows the write-behind buffer failed to write.',
+    function=lambda: write_behind_stat('failed_rows'))
+
+STATEMENT_KINDS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE')
+
+
+def statement_kind(statement):
+    """ First keyword of a SQL statement, for use as a label. """
+    word = statement.lstrip()[:6].upper()
+    return word if word in STATEMENT_KINDS else 'OTHER'
+
+
+def instrument_app(app, engine):
+    """ Times every request of app and every statement run by engine. """
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            REQUEST_SECONDS.labels(request.method, endpoint, str(response.status_code)) \
+                .observe(time.perf_counter() - started)
+        return response
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def observe_query(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_started'].pop()
+        DB_QUERY_SECONDS.labels(statement_kind(statement)).observe(time.perf_counter() - started)
+
+    @event.listens_for(engine, 'handle_error')
+    def count_query_error(context):
+        stack = context.connection.info.get('query_started') if context.connection else None
+        if stack:
+            stack.pop()
+        DB_QUERY_ERRORS.labels(statement_kind(context.statement or '')).inc()
+
+
+def render_metrics():
+    """ Returns the app's metrics in the Prometheus text format.  If the radio
+    stack runs in this process under its own top level name (nrf905.*) its
+    metrics are in a registry of their own and are added too.  Otherwise
+    the radio metrics of the radio ingest service are read from its
+    RADIO_INGEST_METRICS_SOCKET, and left out if it is not running.
+    """
+    text = REGISTRY.render()
+    radio_metrics = sys.modules.get('nrf905.metrics')
+    if radio_metrics is not None and radio_metrics.REGISTRY is not REGISTRY:
+        return text + radio_metrics.REGISTRY.render()
+    path = current_app.config.get('RADIO_INGEST_METRICS_SOCKET')
+    if path:
+        from .radio_ingest import read_socket
+        try:
+            text += read_socket(path, timeout=0.5).decode()
+        except OSError:
+            pass
+    return text
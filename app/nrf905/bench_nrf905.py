@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+""" Measures the overhead of the nRF905 driver on the simulated pigpio backend.
+
+Reports SPI transactions per second through Nrf905Spi, received frames
+per second through Nrf905Hardware (DR callback, mode switches, payload read
+and buffering) and sustained transmit bytes per second for a multi-frame
+message, together with the number of pigpio calls each one costs.
+The per-call round trip to pigpiod is modelled by --round-trip-us; about
+100us is typical for pigpiod on a Pi over the local socket.
+
+Run from the app directory:
+
+    python -m nrf905.bench_nrf905 --round-trip-us 0 100
+"""
+
+import argparse
+import json
+import time
+
+from nrf905.fragments import fragment_data_size
+from nrf905.nrf905_hardware import Nrf905Hardware
+from nrf905.nrf905_spi import Nrf905Spi
+from nrf905.pigpio_sim import SimulatedNrf905, SimulatedPi
+
+
+def bench_spi(round_trip_us, count):
+    pi = SimulatedPi(round_trip_us=round_trip_us)
+    spi = Nrf905Spi(pi, 0)
+    calls = pi.calls
+    start = time.perf_counter()
+    for _ in range(count):
+        spi.configuration_register_read(pi, refresh=True)
+    elapsed = time.perf_counter() - start
+    result = {
+        'transactions_per_second': round(count / elapsed, 1),
+        'pigpio_calls_per_transaction': (pi.calls - calls) / count,
+    }
+    spi.close(pi)
+    pi.stop()
+    return result
+
+
+def bench_receive(round_trip_us, count):
+    pi = SimulatedPi(round_trip_us=round_trip_us)
+    radio = pi.radio(0)
+    hardware = Nrf905Hardware(pi)
+    hardware.open()
+    hardware.receive(0x12345678)
+    payload = bytes(range(32))
+    received = 0
+    calls = pi.calls
+    start = time.perf_counter()
+    for _ in range(count):
+        radio.inject(payload)
+        pi.wait_idle()
+        received += len(hardware.get_receive_data()) // 32
+    elapsed = time.perf_counter() - start
+    result = {
+        'frames_per_second': round(count / elapsed, 1),
+        'pigpio_calls_per_frame': (pi.calls - calls) / count,
+        'frames_received': received,
+        'frames_dropped': radio.frames_dropped,
+    }
+    hardware.term()
+    return result
+
+
+def bench_transmit(round_trip_us, count, airtime_us):
+    pi = SimulatedPi({0: SimulatedNrf905(airtime_us=airtime_us)}, round_trip_us=round_trip_us)
+    radio = pi.radio(0)
+    hardware = Nrf905Hardware(pi)
+    hardware.open()
+    data = bytes(fragment_data_size() * count)
+    calls = pi.calls
+    start = time.perf_counter()
+    hardware.transmit(data)
+    elapsed = time.perf_counter() - start
+    result = {
+        'bytes_per_second': round(len(data) / elapsed, 1),
+        'frames_per_second': round(radio.frames_sent / elapsed, 1),
+        'pigpio_calls_per_frame': (pi.calls - calls) / radio.frames_sent,
+    }
+    hardware.term()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--round-trip-us', type=int, nargs='+', default=[0, 100])
+    parser.add_argument('--count', type=int, default=2000)
+    parser.add_argument('--airtime-us', type=int, default=0,
+                        help='simulated time on air of each transmitted frame')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = {}
+    for round_trip_us in args.round_trip_us:
+        results[round_trip_us] = {
+            'spi': bench_spi(round_trip_us, args.count),
+            'receive': bench_receive(round_trip_us, args.count),
+            'transmit': bench_transmit(round_trip_us, args.count, args.airtime_us),
+        }
+        spi = results[round_trip_us]['spi']
+        receive = results[round_trip_us]['receive']
+        transmit = results[round_trip_us]['transmit']
+        print(f"round trip {round_trip_us:>5}us  "
+              f"SPI {spi['transactions_per_second']:>10} transactions/s "
+              f"({spi['pigpio_calls_per_transaction']:.1f} calls)  "
+              f"RX {receive['frames_per_second']:>10} frames/s "
+              f"({receive['pigpio_calls_per_frame']:.1f} calls)  "
+              f"TX {transmit['bytes_per_second']:>10} bytes/s "
+              f"({transmit['pigpio_calls_per_frame']:.1f} calls)")
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
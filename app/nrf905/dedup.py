@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+""" A bounded cache of recently seen keys, for dropping repeated frames and
+messages.
+
+The same data can arrive more than once: the nRF905 resends a frame for as
+long as TRX_CE is held with AUTO_RETRAN set, senders without acknowledgements
+often send each reading a few times, and overlapping receivers hear the same
+transmission.  Keep a key for each thing delivered (for example the source
+address and a hash of the data) and drop anything whose key was seen within
+ttl seconds.
+"""
+
+import collections
+import time
+
+
+class DedupCache:
+    """ Keys seen in the last ttl seconds, at most max_entries of them.
+
+    A key expires ttl seconds after it was first seen; seeing it again does
+    not extend that, so a value that really is repeated (a reading that has
+    not changed) gets through once per ttl.  Keys are kept in the order they
+    were added, which is also the order they expire in, so lookups, adds and
+    expiry are all O(1).  When full the oldest key is evicted.
+    """
+
+    def __init__(self, ttl=2.0, max_entries=4096, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.__clock = clock
+        self.__keys = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.__keys)
+
+    def __contains__(self, key):
+        """ True if key is held, that is it had not expired at the last
+        expire() or seen().  Counts neither a hit nor a miss.
+        """
+        return key in self.__keys
+
+    def seen(self, key, now=None):
+        """ Returns True, counting a hit, if key was added within ttl
+        seconds.  Otherwise adds it and returns False, counting a miss.
+        """
+        if now is None:
+            now = self.__clock()
+        self.expire(now)
+        if key in self.__keys:
+            self.hits += 1
+            return True
+        self.misses += 1
+        self.add(key, now)
+        return False
+
+    def add(self, key, now=None):
+        """ Adds key, or restarts its ttl if it is already there. """
+        if now is None:
+            now = self.__clock()
+        if key in self.__keys:
+            del self.__keys[key]
+        elif len(self.__keys) >= self.max_entries:
+            self.__keys.popitem(last=False)
+            self.evicted += 1
+        self.__keys[key] = now
+
+    def expire(self, now=None):
+        """ Removes the keys added more than ttl seconds ago. """
+        if now is None:
+            now = self.__clock()
+        limit = now - self.ttl
+        keys = self.__keys
+        while keys:
+            key, added = next(iter(keys.items()))
+            if added > limit:
+                break
+            del keys[key]
+
+    def clear(self):
+        self.__keys.clear()
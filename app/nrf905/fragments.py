@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+""" Splits messages longer than one ShockBurst payload into frames and puts
+them back together.
+
+Every frame is a full payload (32 bytes by default) and starts with an 8 byte
+header:
+
+    bytes 0-3   source, the sender's own RX address, LSB first.  The nRF905
+                does not pass on who sent a frame so the sender says.
+    byte 4      message id, 0 to 255, chosen by the sender
+    bytes 5-6   fragment index, LSB first
+    byte 7      bit 7 set on the last fragment, bits 0-6 the number of data
+                bytes in this frame
+
+The rest of the frame is data, padded with zeros.
+"""
+
+import collections
+import struct
+import time
+from nrf905.dedup import DedupCache
+
+HEADER = struct.Struct('<IBHB')
+HEADER_SIZE = HEADER.size
+FRAME_SIZE = 32
+LAST_FRAGMENT = 0x80
+LENGTH_MASK = 0x7f
+MAX_FRAGMENTS = 0x10000
+
+Message = collections.namedtuple('Message', ['source', 'message_id', 'data', 'tick'],
+                                 defaults=[None])
+Message.__doc__ = """ A reassembled message.  tick is the pigpio tick at which its first
+    frame arrived, or None if not known.
+"""
+
+
+def fragment_data_size(frame_size=FRAME_SIZE):
+    return frame_size - HEADER_SIZE
+
+
+def fragment_count(length, frame_size=FRAME_SIZE):
+    """ Number of frames needed for length bytes of data.  An empty message
+    still takes one frame.
+    """
+    size = fragment_data_size(frame_size)
+    return max(1, (length + size - 1) // size)
+
+
+def fragment(data, message_id, source=0, frame_size=FRAME_SIZE):
+    """ Returns an iterator over the frames for data.  The same bytearray is
+    reused for every frame, so each one must be sent (or copied) before
+    asking for the next.
+    Raises ValueError if data needs more than MAX_FRAGMENTS frames.
+    """
+    if not isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data)
+    data = memoryview(data).cast('B')
+    count = fragment_count(len(data), frame_size)
+    if count > MAX_FRAGMENTS:
+        raise ValueError("data too long for one message")
+    return _frames(data, source & 0xffffffff, message_id & 0xff, count, frame_size)
+
+
+def _frames(data, source, message_id, count, frame_size):
+    size = fragment_data_size(frame_size)
+    frame = bytearray(frame_size)
+    for index in range(count):
+        chunk = data[index * size:(index + 1) * size]
+        length = len(chunk)
+        info = length | (LAST_FRAGMENT if index == count - 1 else 0)
+        HEADER.pack_into(frame, 0, source, message_id, index, info)
+        frame[HEADER_SIZE:HEADER_SIZE + length] = chunk
+        if length < size:
+            frame[HEADER_SIZE + length:] = bytes(size - length)
+        yield frame
+
+
+def parse_header(frame):
+    """ Returns (source, message_id, index, last, length) from the header of
+    frame.
+    """
+    source, message_id, index, info = HEADER.unpack_from(frame)
+    return source, message_id, index, bool(info & LAST_FRAGMENT), info & LENGTH_MASK
+
+
+class _Partial:
+    """ A message that is still missing fragments. """
+
+    __slots__ = ('data', 'seen', 'received', 'count', 'updated', 'tick')
+
+    def __init__(self, now, tick):
+        self.data = bytearray()
+        self.seen = bytearray()  # 1 for each fragment index received.
+        self.received = 0
+        self.count = None  # Known once the last fragment arrives.
+        self.updated = now
+        self.tick = tick
+
+
+class Reassembler:
+    """ Rebuilds messages from frames made by fragment().
+
+    Partial messages are kept in one dict keyed by (source, message id), so
+    each frame costs one lookup however many senders are talking.  Each
+    fragment's data is copied once, straight into its place in the message.
+    A partial message that gets no new fragment for timeout seconds is
+    evicted, as is the least recently updated one when max_pending are
+    waiting.  Messages longer than max_message_size are dropped.  A message
+    is returned once; repeats of it within completed_ttl seconds are ignored
+    (the last max_completed messages are remembered).  A sender reuses a
+    message id after 256 messages, under 2 seconds at full rate with 32
+    byte frames, so completed_ttl must stay well below that.
+    """
+
+    def __init__(self, timeout=2.0, max_pending=1024, max_message_size=0x10000,
+                 frame_size=FRAME_SIZE, clock=time.monotonic, max_completed=4096,
+                 completed_ttl=0.5):
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.max_message_size = max_message_size
+        self.__size = fragment_data_size(frame_size)
+        self.__clock = clock
+        # Kept in order of last update, oldest first.
+        self.__pending = collections.OrderedDict()
+        self.__completed = DedupCache(completed_ttl, max_completed, clock)
+        self.messages = 0
+        self.evicted = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.__pending)
+
+    def add(self, frame, now=None, tick=None):
+        """ Adds a received frame, which arrived at pigpio tick.  Returns the
+        Message it completes, or None.
+        """
+        if now is None:
+            now = self.__clock()
+        self.expire(now)
+        source, message_id, index, last, length = parse_header(frame)
+        if length > self.__size:
+            self.dropped += 1
+            return None
+        key = (source, message_id)
+        if key in self.__completed:
+            return None
+        data = memoryview(frame)[HEADER_SIZE:HEADER_SIZE + length]
+        partial = self.__pending.get(key)
+        if partial is None:
+            if index == 0 and last:
+                # Single frame message, the common case.
+                return self.__complete(key, bytes(data), now, tick)
+            if len(self.__pending) >= self.max_pending:
+                self.__pending.popitem(last=False)
+                self.evicted += 1
+            partial = self.__pending[key] = _Partial(now, tick)
+        else:
+            self.__pending.move_to_end(key)
+            partial.updated = now
+        if partial.count is not None and (index >= partial.count
+                                          or (last and index != partial.count - 1)):
+            # Past the end, or a second last fragment: not part of this one.
+            self.dropped += 1
+            return None
+        offset = index * self.__size
+        if offset + length > self.max_message_size:
+            del self.__pending[key]
+            self.dropped += 1
+            return None
+        if index >= len(partial.seen):
+            partial.seen.extend(bytes(index + 1 - len(partial.seen)))
+        if partial.seen[index]:
+            return None
+        partial.seen[index] = 1
+        partial.received += 1
+        if len(partial.data) < offset + length:
+            partial.data.extend(bytes(offset + length - len(partial.data)))
+        partial.data[offset:offset + length] = data
+        if last:
+            partial.count = index + 1
+            # Anything sent past the last fragment was not part of it.
+            del partial.data[offset + length:]
+            if len(partial.seen) > partial.count:
+                partial.received -= sum(partial.seen[partial.count:])
+                del partial.seen[partial.count:]
+        if partial.received == partial.count:
+            del self.__pending[key]
+            return self.__complete(key, bytes(partial.data), now, partial.tick)
+        return None
+
+    def __complete(self, key, data, now, tick):
+        self.__completed.add(key, now)
+        self.messages += 1
+        return Message(key[0], key[1], data, tick)
+
+    def expire(self, now=None):
+        """ Evicts partial messages with no new fragment for timeout seconds. """
+        if now is None:
+            now = self.__clock()
+        limit = now - self.timeout
+        pending = self.__pending
+        while pending:
+            key, partial = next(iter(pending.items()))
+            if partial.updated > limit:
+                break
+            del pending[key]
+            self.evicted += 1
+        self.__completed.expire(now)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import collections
+import threading
+
+Frame = collections.namedtuple('Frame', ['data', 'tick', 'sequence'])
+Frame.__doc__ = """ A received frame.
+    data -- memoryview of the payload inside the ring buffer.
+    tick -- pigpio tick (microseconds) of the DR edge.
+    sequence -- number of the frame, counting dropped frames too, so a gap
+        in the sequence shows where frames were lost.
+"""
+
+
+class FrameRingBuffer:
+    """ Bounded FIFO of received payloads held in one preallocated bytearray.
+
+    put() is called on the pigpio callback thread and copies the payload into
+    the next free slot with a single slice assignment; nothing is allocated
+    per byte or per frame.  When all slots are full the new frame is dropped
+    and counted in overflows.
+
+    get() hands out a Frame whose data is a memoryview of the slot.  The slot
+    stays reserved until the next get() or release(), so the view must not
+    be used after that (copy it with bytes() to keep it).
+    """
+
+    def __init__(self, capacity=64, frame_size=32):
+        self.capacity = capacity
+        self.frame_size = frame_size
+        self.__buffer = bytearray(capacity * frame_size)
+        self.__view = memoryview(self.__buffer)
+        self.__lengths = [0] * capacity
+        self.__ticks = [0] * capacity
+        self.__sequences = [0] * capacity
+        self.__head = 0  # Next slot to write.
+        self.__tail = 0  # Next slot to read.
+        self.__count = 0  # Slots written and not yet released.
+        self.__held = False  # True while a handed out frame holds the tail slot.
+        self.__sequence = 0
+        self.overflows = 0
+        self.__condition = threading.Condition()
+
+    def put(self, data, tick=0):
+        """ Copies a payload into the buffer.  Returns False if the buffer
+        was full and the frame was dropped.
+        """
+        length = min(len(data), self.frame_size)
+        with self.__condition:
+            sequence = self.__sequence
+            self.__sequence += 1
+            if self.__count == self.capacity:
+                self.overflows += 1
+                return False
+            slot = self.__head
+            offset = slot * self.frame_size
+            self.__buffer[offset:offset + length] = data[:length]
+            self.__lengths[slot] = length
+            self.__ticks[slot] = tick
+            self.__sequences[slot] = sequence
+            self.__head = (slot + 1) % self.capacity
+            self.__count += 1
+            self.__condition.notify()
+        return True
+
+    def get(self, timeout=0):
+        """ Releases the previous frame and returns the oldest waiting one, or
+        None if none arrives within timeout seconds (None waits forever).
+        """
+        with self.__condition:
+            self.__release()
+            if self.__count == 0:
+                if timeout == 0 or not self.__condition.wait_for(lambda: self.__count > 0, timeout):
+                    return None
+            slot = self.__tail
+            offset = slot * self.frame_size
+            self.__held = True
+            return Frame(self.__view[offset:offset + self.__lengths[slot]],
+                         self.__ticks[slot], self.__sequences[slot])
+
+    def release(self):
+        """ Frees the slot of the last frame returned by get(). """
+        with self.__condition:
+            self.__release()
+
+    def __release(self):
+        if self.__held:
+            self.__held = False
+            self.__tail = (self.__tail + 1) % self.capacity
+            self.__count -= 1
+
+    def clear(self):
+        with self.__condition:
+            self.__head = self.__tail = self.__count = 0
+            self.__held = False
+
+    def __len__(self):
+        """ Number of frames waiting, not counting one handed out by get(). """
+        return self.__count - (1 if self.__held else 0)
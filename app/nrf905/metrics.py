@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+""" Counters, gauges and fixed-bucket histograms in the Prometheus text
+format, without any dependencies.
+
+Updates are plain integer and float additions with no lock, so the cost on
+the hot paths is a bisect and an increment.  Under the GIL a concurrent
+update can very rarely be lost, which is fine for monitoring.
+
+    SPI_SECONDS = Histogram('nrf905_spi_transfer_seconds', 'SPI transactions.',
+                            LATENCY_BUCKETS)
+    SPI_SECONDS.observe(0.0002)
+    print(REGISTRY.render())
+"""
+
+import bisect
+import math
+import threading
+
+# Seconds, from 10us (one GPIO write on the Pi) to 10s (a slow DB query).
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                   0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Registry:
+    """ The metrics to render.  Metrics add themselves when created. """
+
+    def __init__(self):
+        self.__metrics = {}
+        self.__lock = threading.Lock()
+
+    def register(self, metric):
+        with self.__lock:
+            if metric.name in self.__metrics:
+                raise ValueError(f"metric {metric.name} already registered")
+            self.__metrics[metric.name] = metric
+
+    def get(self, name):
+        return self.__metrics.get(name)
+
+    def render(self):
+        """ Returns every metric in the Prometheus text format. """
+        lines = []
+        for metric in list(self.__metrics.values()):
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    body = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                                     .replace('"', '\\"').replace('\n', '\\n'))
+                    for name, value in pairs)
+    return '{' + body + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """ Base of the metric types.  With labelnames, labels() returns the
+    child holding the values for one set of label values; without, the
+    metric's own methods update its only child.
+    """
+
+    type = 'untyped'
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.__children = {}
+        self.__lock = threading.Lock()
+        self._child = None if self.labelnames else self.labels()
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values):
+        child = self.__children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self.__lock:
+                child = self.__children.setdefault(values, self._new_child())
+        return child
+
+    def samples(self):
+        result = []
+        for values, child in sorted(self.__children.items()):
+            result.extend(self._child_samples(values, child))
+        return result
+
+
+class _Value:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    """ A count that only goes up.  With function, the value is read from
+    function() at render time instead, for a count kept elsewhere.
+    """
+
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY, function=None):
+        self.function = function
+        super().__init__(name, help, labelnames, registry)
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._child.value += amount
+
+    @property
+    def value(self):
+        return self._child.value
+
+    def _child_samples(self, values, child):
+        if self.function is not None and not self.labelnames:
+            child.value = self.function()
+        return [f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}']
+
+
+class Gauge(Counter):
+    """ A value that goes up and down, or is read from function() as for
+    Counter.
+    """
+
+    type = 'gauge'
+
+    def set(self, value):
+        self._child.value = value
+
+
+class _Buckets:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    """ Counts of observed values in fixed buckets, given as the upper bound
+    of each.  A +Inf bucket is added.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS, labelnames=(), registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, registry)
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value):
+        self._child.observe(value)
+
+    @property
+    def count(self):
+        return self._child.count
+
+    def _child_samples(self, values, child):
+        result = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), child.counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, [('le', _format_value(bound))])
+            result.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labelnames, values)
+        result.append(f'{self.name}_sum{labels} {_format_value(child.sum)}')
+        result.append(f'{self.name}_count{labels} {child.count}')
+        return result
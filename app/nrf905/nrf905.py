@@ -1,3 +1,6 @@
+import threading
+
+
 class Nrf905:
     """ The interface to control a nRF905 device.  This class does all the
     parameter checking and state checking.  The actual byte bashing is done in
@@ -8,7 +11,13 @@ class Nrf905:
     This means that the state has to be considered.
     """
 
-    def __init__(self):
+    def __init__(self, hardware=None):
+        """ hardware is an Nrf905Hardware to drive.  Without one the calls
+        that would reach the hardware only print what they would do.
+        """
+        self.__hardware = hardware
+        self.__receive_thread = None
+        self.__receiving = False
         self.__is_open = False
         self.__is_transmitter = False
         self.__default_pins = []
@@ -34,7 +43,7 @@ class Nrf905:
             raise StateError("SPI bus NOT set. Device in use.")
         else:
             if bus == 0 or bus == 1:
-                self.__spi_bus = 0
+                self.__spi_bus = bus
                 print("SPI bus set", bus)
             else:
                 raise ValueError("Bus out of range")
@@ -86,6 +95,7 @@ class Nrf905:
                 if not self.__is_transmitter:
                     raise StateError("open as receiver")
         else:
+            self.__frequency = frequency
             if callback:
                 print("open as receiver:", frequency, callback)
                 self.__callback = callback
@@ -115,12 +125,38 @@ class Nrf905:
     def __hw_configure(self):
         """ Uses member variables directly """
         print("__hw_configure")
+        if self.__hardware is not None:
+            self.__hardware.open()
+            self.__hardware.set_frequency(self.__frequency)
+            if not self.__is_transmitter:
+                self.__hardware.receive(self.__address)
+                self.__receiving = True
+                self.__receive_thread = threading.Thread(
+                    target=self.__hw_receive_loop, name='nrf905-receive', daemon=True)
+                self.__receive_thread.start()
+
+    def __hw_receive_loop(self):
+        """ Passes each complete message to the callback.  Runs on its own
+        thread so a slow callback does not hold up the pigpio callbacks.
+        """
+        while self.__receiving:
+            message = self.__hardware.get_message(timeout=0.1)
+            if message is not None:
+                self.__callback(message.data)
 
     def __hw_write(self, data):
         print("__hw_write", data)
+        if self.__hardware is not None:
+            self.__hardware.transmit(data)
 
     def __hw_release(self):
         print("__hw_release")
+        if self.__receive_thread is not None:
+            self.__receiving = False
+            self.__receive_thread.join()
+            self.__receive_thread = None
+        if self.__hardware is not None:
+            self.__hardware.term()
 
 
 class Error(Exception):
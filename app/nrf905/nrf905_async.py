@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+import asyncio
+
+
+class Nrf905Async:
+    """ asyncio front end for Nrf905Hardware.
+
+        async with Nrf905Async(Nrf905Hardware(), address=0x12345678) as radio:
+            await radio.write(b'hello', address=0x87654321)
+            async for message in radio:
+                print(message.source, message.data)
+
+    Received frames are reassembled into fragments.Message tuples.  The
+    pigpio callback thread only schedules a drain of the RX buffer with
+    loop.call_soon_threadsafe; everything else runs on the event loop, so no
+    threads are added.  write() awaits the DR edge of the last frame instead
+    of blocking.
+    """
+
+    def __init__(self, hardware, address=None, queue_size=256):
+        """ hardware is an Nrf905Hardware, which is closed (term) on exit.
+        address is the RX address to listen on, or None to only transmit.
+        queue_size is the number of messages waiting to be read before new
+        ones are dropped.
+        """
+        self.__hardware = hardware
+        self.__address = address
+        self.__queue_size = queue_size
+        self.__loop = None
+        self.__messages = None
+        self.__write_lock = None
+        self.__drain_scheduled = False
+        self.__closed = True
+        self.dropped = 0
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def open(self):
+        self.__loop = asyncio.get_running_loop()
+        self.__messages = asyncio.Queue(self.__queue_size)
+        self.__write_lock = asyncio.Lock()
+        self.__hardware.open()
+        self.__hardware.set_receive_listener(self.__frame_received)
+        if self.__address is not None:
+            self.__hardware.receive(self.__address)
+        self.__closed = False
+
+    async def close(self):
+        if self.__closed:
+            return
+        self.__closed = True
+        self.__hardware.set_receive_listener(None)
+        self.__hardware.cancel_transmit()
+        self.__hardware.term()
+        # Wake anything waiting in __anext__.
+        if not self.__messages.full():
+            self.__messages.put_nowait(None)
+
+    def __frame_received(self):
+        """ Runs on the pigpio callback thread.  Only one drain is scheduled
+        however many frames arrive before it runs.
+        """
+        if not self.__drain_scheduled:
+            self.__drain_scheduled = True
+            self.__loop.call_soon_threadsafe(self.__drain)
+
+    def __drain(self):
+        self.__drain_scheduled = False
+        while True:
+            message = self.__hardware.get_message()
+            if message is None:
+                break
+            try:
+                self.__messages.put_nowait(message)
+            except asyncio.QueueFull:
+                self.dropped += 1
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.__closed and self.__messages.empty():
+            raise StopAsyncIteration
+        message = await self.__messages.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+    async def write(self, data, address=None, timeout=1.0):
+        """ Transmits data, to address if given, and returns the message id
+        once the last frame is on the air.  Raises TimeoutError if that takes
+        longer than timeout seconds.
+        """
+        async with self.__write_lock:
+            future = self.__loop.create_future()
+
+            def done():
+                self.__loop.call_soon_threadsafe(_set_done, future)
+
+            message_id = self.__hardware.start_transmit(data, address, done)
+            try:
+                await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                self.__hardware.cancel_transmit()
+                raise TimeoutError("nRF905 did not signal the end of transmission") from None
+            return message_id
+
+
+def _set_done(future):
+    if not future.done():
+        future.set_result(None)
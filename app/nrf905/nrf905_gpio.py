@@ -1,6 +1,43 @@
 #!/usr/bin/env python3
 
+import threading
+import time
 import pigpio
+from nrf905.metrics import Counter, Histogram
+
+MODE_SWITCH_SECONDS = Histogram(
+    'nrf905_gpio_mode_switch_seconds', 'Time taken to change the nRF905 mode pins.')
+MODE_SWITCHES_SKIPPED = Counter(
+    'nrf905_gpio_mode_switches_skipped_total',
+    'Mode changes skipped because the pins were already in that mode.')
+
+# Pin maps for Nrf905Gpio(pins=...), BCM numbers.  DEFAULT_PINS is the single
+# module wiring above.  SPI_0_PINS and SPI_1_PINS are the two module wiring in
+# the README, for a module on the main and one on the auxiliary SPI bus.
+DEFAULT_PINS = {
+    'power_up': 17,
+    'transmit_enable': 22,
+    'chip_enable': 25,
+    'data_ready': 18,
+    'carrier_detect': 23,
+    'address_matched': 24,
+}
+SPI_0_PINS = {
+    'power_up': 22,
+    'transmit_enable': 15,
+    'chip_enable': 27,
+    'data_ready': 25,
+    'carrier_detect': 23,
+    'address_matched': 24,
+}
+SPI_1_PINS = {
+    'power_up': 6,
+    'transmit_enable': 14,
+    'chip_enable': 5,
+    'data_ready': 26,
+    'carrier_detect': 12,
+    'address_matched': 13,
+}
 
 class Nrf905Gpio:
     """ Control the GPIO pins when using the nRF905.  Pins used are:
@@ -21,6 +58,13 @@ TODO 17 and 18 are used by SPI1
 
         Callbacks can be set up once and left in place.  The nRF905 only changes
         the state on these pins when in receive mode. 
+
+        set_packet_callback combines the CD, AM and DR edges of a received
+        packet into one call.
+
+        Pass pins (see SPI_0_PINS and SPI_1_PINS) to use other pins, for
+        example for a second module.  The pin attributes of the instance are
+        then set from it.
     """
     
     # GPIO pins.  Uses BCM numbers same as pigpio.
@@ -43,13 +87,60 @@ TODO 17 and 18 are used by SPI1
     # Activate transmitter.
     SHOCKBURST_TX = 3
 
-    def __init__(self, pi):
+    # Longest time from CD or AM rising to DR rising for one packet, in
+    # microseconds: preamble, 4 address bytes, 32 payload bytes and a 16 bit
+    # CRC at 50kbps come to about 7.7ms.
+    MAX_PACKET_US = 10000
+
+    # Bank 1 bits set in each mode.  Each mode's bits include those of the
+    # mode before it, so going from one mode to another only ever sets bits
+    # or only clears them and takes a single pigpio call.
+    OUTPUT_MASK = (1 << POWER_UP) | (1 << TRANSMIT_RECEIVE_CHIP_ENABLE) | (1 << TRANSMIT_ENABLE)
+    MODE_BITS = {
+        POWER_DOWN: 0,
+        STANDBY: 1 << POWER_UP,
+        SHOCKBURST_RX: (1 << POWER_UP) | (1 << TRANSMIT_RECEIVE_CHIP_ENABLE),
+        SHOCKBURST_TX: OUTPUT_MASK,
+    }
+
+    def __init__(self, pi, pins=None):
         # print("__init__")
+        if pins is not None:
+            self.__use_pins(dict(DEFAULT_PINS, **pins))
         # Output pins controlling nRF905 - set all to 0.
         for pin in self.output_pins:
             pi.set_mode(pin, pigpio.OUTPUT)
             pi.write(pin, 0)
         self.__callback_dict = dict()
+        # Tick of the last rising edge of each packet start pin, see
+        # set_packet_callback.
+        self.__start_ticks = {}
+        self.__packet_callback = None
+        # The mode the output pins were last set to.  None if unknown.
+        self.__mode = self.POWER_DOWN
+        # Mode changes come from both the caller's thread and the pigpio
+        # callback thread.
+        self.__mode_lock = threading.Lock()
+
+    def __use_pins(self, pins):
+        """ Sets the pin attributes, which otherwise come from the class. """
+        self.POWER_UP = pins['power_up']
+        self.TRANSMIT_ENABLE = pins['transmit_enable']
+        self.TRANSMIT_RECEIVE_CHIP_ENABLE = pins['chip_enable']
+        self.output_pins = [self.POWER_UP, self.TRANSMIT_ENABLE, self.TRANSMIT_RECEIVE_CHIP_ENABLE]
+        self.DATA_READY = pins['data_ready']
+        self.CARRIER_DETECT = pins['carrier_detect']
+        self.ADDRESS_MATCHED = pins['address_matched']
+        self.callback_pins = [self.DATA_READY, self.CARRIER_DETECT, self.ADDRESS_MATCHED]
+        self.OUTPUT_MASK = 0
+        for pin in self.output_pins:
+            self.OUTPUT_MASK |= 1 << pin
+        self.MODE_BITS = {
+            self.POWER_DOWN: 0,
+            self.STANDBY: 1 << self.POWER_UP,
+            self.SHOCKBURST_RX: (1 << self.POWER_UP) | (1 << self.TRANSMIT_RECEIVE_CHIP_ENABLE),
+            self.SHOCKBURST_TX: self.OUTPUT_MASK,
+        }
 
     def term(self, pi):
         # print("term")
@@ -58,6 +149,7 @@ TODO 17 and 18 are used by SPI1
             self.reset_pin(pi, pin)
         for pin in self.output_pins:
             self.reset_pin(pi, pin)
+        self.__mode = None
 
     def reset_pin(self, pi, pin):
         # print("reset_pin", pin)
@@ -71,27 +163,64 @@ TODO 17 and 18 are used by SPI1
             else:
                 pi.set_pull_up_down(pin, pigpio.PUD_DOWN)
 
+    def get_mode(self):
+        """ Returns the mode the output pins were last set to, or None if it
+        is not known.
+        """
+        return self.__mode
+
+    def set_mode(self, pi, mode):
+        """ Sets PWR_UP, TRX_CE and TX_EN for the given mode with bank 1
+        writes, so the pins change together.  Does nothing if the pins are
+        already in that mode.
+        """
+        bits = self.MODE_BITS[mode]
+        with self.__mode_lock:
+            if mode == self.__mode:
+                MODE_SWITCHES_SKIPPED.inc()
+                return
+            start = time.perf_counter()
+            if self.__mode is None:
+                clear = self.OUTPUT_MASK & ~bits
+                set_ = bits
+            else:
+                current = self.MODE_BITS[self.__mode]
+                clear = current & ~bits
+                set_ = bits & ~current
+            # Clear first so an unknown starting state never passes through
+            # transmit on its way to a lower mode.
+            if clear:
+                pi.clear_bank_1(clear)
+            if set_:
+                pi.set_bank_1(set_)
+            self.__mode = mode
+            MODE_SWITCH_SECONDS.observe(time.perf_counter() - start)
+
+    def invalidate_mode(self):
+        """ Forgets the cached mode so the next set_mode writes all three pins.
+        Call after the pins were changed other than through this class.
+        """
+        with self.__mode_lock:
+            self.__mode = None
+
     def set_mode_power_down(self, pi):
-        pi.write(self.POWER_UP, 0)
-        pi.write(self.TRANSMIT_RECEIVE_CHIP_ENABLE, 0)
-        pi.write(self.TRANSMIT_ENABLE, 0)
+        self.set_mode(pi, self.POWER_DOWN)
 
     def set_mode_standby(self, pi):
-        pi.write(self.POWER_UP, 1)
-        pi.write(self.TRANSMIT_RECEIVE_CHIP_ENABLE, 0)
-        pi.write(self.TRANSMIT_ENABLE, 0)
+        self.set_mode(pi, self.STANDBY)
 
     def set_mode_receive(self, pi):
-        pi.write(self.POWER_UP, 1)
-        pi.write(self.TRANSMIT_RECEIVE_CHIP_ENABLE, 1)
-        pi.write(self.TRANSMIT_ENABLE, 0)
+        self.set_mode(pi, self.SHOCKBURST_RX)
 
     def set_mode_transmit(self, pi):
-        pi.write(self.POWER_UP, 1)
-        pi.write(self.TRANSMIT_RECEIVE_CHIP_ENABLE, 1)
-        pi.write(self.TRANSMIT_ENABLE, 1)
+        self.set_mode(pi, self.SHOCKBURST_TX)
 
-    def set_callback(self, pi, pin, callback_function):
+    def set_callback(self, pi, pin, callback_function, edge=pigpio.EITHER_EDGE):
+        """ Calls callback_function(gpio, level, tick) on the pigpio callback
+        thread for each edge on pin of the kind given (pigpio.RISING_EDGE,
+        FALLING_EDGE or EITHER_EDGE).  Asking only for the edges needed saves
+        a wakeup of the callback for each of the others.
+        """
         # print("set_callback", pin)
         # Using index() causes a ValueError exception if the pin is not found.
         self.callback_pins.index(pin)
@@ -99,10 +228,47 @@ TODO 17 and 18 are used by SPI1
         # PUD_OFF is used as this is what works with the nRF905 module.
         pi.set_mode(pin, pigpio.INPUT)
         pi.set_pull_up_down(pin, pigpio.PUD_OFF)
+        # Replace any callback already set on the pin.
+        previous = self.__callback_dict.pop(pin, None)
+        if previous is not None:
+            previous.cancel()
         # Create callback object and store it for use by the cancel function.
-        callback_obj = pi.callback(pin, pigpio.EITHER_EDGE, callback_function)
+        callback_obj = pi.callback(pin, edge, callback_function)
         self.__callback_dict[pin] = callback_obj
 
+    def set_packet_callback(self, pi, callback_function, start_pins=()):
+        """ Calls callback_function(gpio, level, tick, start_tick) once per
+        packet, when DR rises, instead of once per edge on each pin.  Only
+        rising edges are asked for, so with no start_pins a packet costs a
+        single wakeup of the callback thread.
+        start_tick is tick unless start_pins are given (ADDRESS_MATCHED, or
+        CARRIER_DETECT for an earlier but noisier edge).  It is then the
+        tick of the earliest of their rising edges in the MAX_PACKET_US
+        before DR rose, when the packet started to arrive.  Each start pin
+        adds a wakeup per packet that only notes the tick.
+        """
+        self.__start_ticks = {}
+        self.__packet_callback = callback_function
+        for pin in start_pins:
+            self.set_callback(pi, pin, self.__packet_start, pigpio.RISING_EDGE)
+        self.set_callback(pi, self.DATA_READY, self.__packet_ready, pigpio.RISING_EDGE)
+
+    def __packet_start(self, gpio, level, tick):
+        self.__start_ticks[gpio] = tick
+
+    def __packet_ready(self, gpio, level, tick):
+        start_tick = tick
+        if self.__start_ticks:
+            # Ticks are microseconds and wrap at 2**32.
+            earliest = 0
+            for edge_tick in self.__start_ticks.values():
+                before = (tick - edge_tick) & 0xffffffff
+                if earliest < before <= self.MAX_PACKET_US:
+                    earliest = before
+                    start_tick = edge_tick
+            self.__start_ticks.clear()
+        self.__packet_callback(gpio, level, tick, start_tick)
+
     def clear_callback(self, pi, pin):
         """ Clears the callback for the given pin.
         Returns True if pin found.
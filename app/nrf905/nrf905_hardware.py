@@ -1,10 +1,29 @@
 #!/usr/bin/env python3
 
-import Queue
+import threading
+import time
 import pigpio
-from nrf905.nrf905_spi import Nrf905Spi
+from nrf905.fragments import Reassembler, fragment
+from nrf905.frame_buffer import FrameRingBuffer
+from nrf905.metrics import Counter, Gauge, Histogram
+from nrf905.nrf905_spi import Nrf905Spi, band_channels, frequency_to_channel
 from nrf905.nrf905_gpio import Nrf905Gpio
 
+RX_FRAMES = Counter('nrf905_rx_frames_total', 'Frames read from the nRF905.', ['spi_bus'])
+RX_FRAMES_DROPPED = Counter(
+    'nrf905_rx_frames_dropped_total', 'Frames dropped because the RX buffer was full.',
+    ['spi_bus'])
+RX_BUFFER_DEPTH = Gauge('nrf905_rx_buffer_frames', 'Frames waiting in the RX buffer.',
+                        ['spi_bus'])
+RX_READ_SECONDS = Histogram(
+    'nrf905_rx_read_seconds',
+    'Time in data_ready_callback from entry to the frame being buffered.')
+RX_DR_TO_READ_SECONDS = Histogram(
+    'nrf905_rx_dr_to_read_seconds',
+    'Time from the DR edge (pigpio tick) to the end of the payload read, sampled.')
+TX_FRAMES = Counter('nrf905_tx_frames_total', 'Frames transmitted.', ['spi_bus'])
+
+
 class Nrf905Hardware:
     """ Controls the nRF905 module.
     
@@ -13,70 +32,318 @@ class Nrf905Hardware:
 
     CRYSTAL_FREQUENCY_HZ = 16 * 1000 * 1000  # 16MHz is on the board I'm using.
     
-    def __init__(self):
-        print("init")
-        self.__pi = pigpio.pi()
-        self.__gpio = Nrf905Gpio(self.__pi)
-        self.__spi = Nrf905Spi(self.__pi)
-        self.__receive_queue = Queue.Queue()
+    def __init__(self, pi=None, spi_bus=0, receive_capacity=64, reassembly_timeout=2.0,
+                 pins=None, tick_sample_every=64, packet_start_pins=None):
+        """ pi defaults to a connection to the local pigpio daemon.  Pass a
+        pigpio_sim.SimulatedPi to run without hardware.
+        pins is the GPIO pin map for Nrf905Gpio, needed when more than one
+        module shares the pi.
+        tick_sample_every sets how often (in frames) the time from the DR
+        edge to the end of the payload read is measured.  Each measurement
+        costs a pigpio call for the current tick.  0 turns it off.
+        receive_capacity is the number of frames the RX buffer holds before
+        new frames are dropped.
+        reassembly_timeout is how long, in seconds, a partly received
+        message is kept waiting for its next fragment.
+        Received frames are timestamped with the pigpio tick of DR rising.
+        packet_start_pins, for example ['address_matched'], names pins whose
+        rising edge marks the start of the packet instead (see
+        Nrf905Gpio.set_packet_callback), at the cost of a callback per pin
+        per packet.
+        """
+        self.__pi = pi if pi is not None else pigpio.pi()
+        self.__gpio = Nrf905Gpio(self.__pi, pins)
+        self.__spi = Nrf905Spi(self.__pi, spi_bus)
+        self.__receive_buffer = FrameRingBuffer(receive_capacity)
+        self.reassembler = Reassembler(reassembly_timeout)
+        # Our RX address, sent as the source of each message.
+        self.__address = 0
+        # Transmit pipeline state, shared with the DR callback.
+        self.__transmit_lock = threading.Lock()
+        self.__transmit_condition = threading.Condition()
+        self.__transmit_frames = None
+        self.__transmit_sent = 0
+        self.__transmit_return_mode = Nrf905Gpio.STANDBY
+        self.__transmit_done = None
+        self.__message_id = 0
+        self.__receive_listener = None
+        self.__tick_sample_every = tick_sample_every
+        self.__frames_until_sample = 1
+        self.__packet_start_pins = packet_start_pins or []
+        # (tick, time.time()) taken together, see tick_time.
+        self.__tick_reference = None
+        self.__tick_reference_at = None
+        bus = str(spi_bus)
+        self.__rx_frames = RX_FRAMES.labels(bus)
+        self.__rx_frames_dropped = RX_FRAMES_DROPPED.labels(bus)
+        self.__rx_buffer_depth = RX_BUFFER_DEPTH.labels(bus)
+        self.__tx_frames = TX_FRAMES.labels(bus)
 
     def term(self):
-        print("term")
-        self.__spi.term(self.__pi)
-        self.__gpio.term(self.__pi)
+        self.close()
         self.__pi.stop()
 
+    def close(self):
+        """ Releases the SPI handle and the pins but leaves the pigpio
+        connection open for other modules sharing it.
+        """
+        self.__spi.close(self.__pi)
+        self.__gpio.term(self.__pi)
+
     def open(self):
         """ Set up the nRF905 module in power down mode. """
-        print("open")
         if self.__pi.connected:
-            self.__gpio.set_mode(self.__pi, Nrf905Gpio.POWER_DOWN)
-            self.__spi.open()
-            self.__receive_queue = 0  # Clear the queue. 
+            self.__gpio.set_mode_power_down(self.__pi)
+            pins = {'address_matched': self.__gpio.ADDRESS_MATCHED,
+                    'carrier_detect': self.__gpio.CARRIER_DETECT}
+            self.__gpio.set_packet_callback(
+                self.__pi, self.data_ready_callback,
+                [pins[name] for name in self.__packet_start_pins])
+            self.__receive_buffer.clear()
         else:
             raise ProcessLookupError("Could not connect to pigpio daemon.")
 
-    def transmit(self, data):
+    def transmit(self, data, address=None, timeout=1.0):
         """ Put into standby mode, write the data to be transmitted to the 
         nRF905 and set mode to transmit.
-        If the data given is too bit to be transmitted in one burst, the data
-        is split into burst sized chunks and transmitted until all the data has
-        been sent.
+        The data is split into burst sized frames, each with a fragment header
+        (see fragments.py), and transmitted until all the data has been sent.
+        Each frame after the first is loaded by data_ready_callback as soon as
+        DR signals that the previous one is on the air.
+        If address is given the TX address is set first.  The radio goes back
+        to receive mode afterwards if it was receiving.
+        Returns the message id used.  Raises TimeoutError if DR does not rise
+        within timeout seconds of a frame being sent.
         """
-        print("transmit", data)
-        self.__gpio.set_mode(self.__pi, Nrf905Gpio.STANDBY)
-        # Write to registers
-        self.__gpio.set_mode(self.__pi, Nrf905Gpio.TRANSMIT)
-
-    def data_ready_callback(self):
-        """ When data is ready, drop out of receive mode, read the data from 
-        the SPI RX register, go back into receive mode and finally write the 
-        data to the rx queue.
+        with self.__transmit_lock:
+            message_id = self.start_transmit(data, address)
+            with self.__transmit_condition:
+                sent = 0
+                while self.__transmit_frames is not None:
+                    if not self.__transmit_condition.wait_for(
+                            lambda: self.__transmit_sent != sent, timeout):
+                        self.cancel_transmit()
+                        raise TimeoutError("nRF905 did not signal the end of transmission")
+                    sent = self.__transmit_sent
+            return message_id
+
+    def start_transmit(self, data, address=None, done=None):
+        """ Starts transmitting data as transmit() does but returns the
+        message id without waiting.  done() is called on the pigpio callback
+        thread once the last frame has been sent.
+        Raises RuntimeError if a transmit is already in progress.
         """
-        print("drc")
+        with self.__transmit_condition:
+            if self.__transmit_frames is not None:
+                raise RuntimeError("transmit already in progress")
+            message_id = self.__message_id
+            frames = fragment(data, message_id, self.__address)
+            self.__message_id = (message_id + 1) & 0xff
+            return_mode = self.__gpio.get_mode()
+            if return_mode != Nrf905Gpio.SHOCKBURST_RX:
+                return_mode = Nrf905Gpio.STANDBY
+            self.__gpio.set_mode_standby(self.__pi)
+            if address is not None:
+                self.__spi.write_transmit_address(self.__pi, address)
+            self.__transmit_frames = frames
+            self.__transmit_sent = 0
+            self.__transmit_return_mode = return_mode
+            self.__transmit_done = done
+            self.__transmit_next()
+            return message_id
+
+    def cancel_transmit(self):
+        """ Stops a transmit in progress.  Its done callback is not called. """
+        with self.__transmit_condition:
+            if self.__transmit_frames is not None:
+                self.__transmit_frames = None
+                self.__transmit_done = None
+                self.__gpio.set_mode(self.__pi, self.__transmit_return_mode)
+
+    def __transmit_next(self):
+        """ Loads the next frame and starts sending it, or, when there are no
+        more, puts the radio back in the mode it was in before transmit.
+        Called with __transmit_condition held.
+        """
+        frame = next(self.__transmit_frames, None)
         self.__gpio.set_mode_standby(self.__pi)
-        data = self.__spi.read_rx_data(self.__pi)
-        self.__gpio.set_mode_receive(self.__pi)
-        for byte in data:
-            self.__receive_queue.put(byte)
-        print(data)
+        if frame is None:
+            self.__transmit_frames = None
+            self.__gpio.set_mode(self.__pi, self.__transmit_return_mode)
+            done, self.__transmit_done = self.__transmit_done, None
+            if done is not None:
+                done()
+        else:
+            self.__spi.write_transmit_payload(self.__pi, frame)
+            self.__gpio.set_mode_transmit(self.__pi)
+            self.__tx_frames.inc()
+
+    def set_receive_listener(self, listener):
+        """ listener() is called on the pigpio callback thread each time a
+        frame has been added to the RX buffer.  None removes it.
+        """
+        self.__receive_listener = listener
+
+    def data_ready_callback(self, gpio, level, tick, start_tick=None):
+        """ In transmit mode DR rising means the frame has been sent, so the
+        next frame is loaded.  Otherwise a payload has been received: drop out
+        of receive mode, read the data from the SPI RX register, go back into
+        receive mode and finally copy the frame into the RX buffer with
+        start_tick (when the frame started to arrive, default tick) as its
+        tick.
+        This is a pigpio callback so it runs on the pigpio callback thread.
+        Only the rising edge of DR matters.
+        """
+        if level != 1:
+            return
+        # Held from the mode check until the radio is back in receive mode,
+        # so start_transmit cannot switch to transmit in between and have
+        # the frame aborted by the switch back.
+        with self.__transmit_condition:
+            if self.__gpio.get_mode() == Nrf905Gpio.SHOCKBURST_TX:
+                if self.__transmit_frames is not None:
+                    self.__transmit_sent += 1
+                    self.__transmit_next()
+                    self.__transmit_condition.notify()
+                return
+            start = time.perf_counter()
+            self.__gpio.set_mode_standby(self.__pi)
+            data = self.__spi.read_receive_frame(self.__pi)
+            if self.__tick_sample_every:
+                self.__frames_until_sample -= 1
+                if self.__frames_until_sample <= 0:
+                    self.__frames_until_sample = self.__tick_sample_every
+                    # Ticks are microseconds and wrap at 2**32.
+                    elapsed = (self.__pi.get_current_tick() - tick) & 0xffffffff
+                    RX_DR_TO_READ_SECONDS.observe(elapsed / 1000000)
+            self.__gpio.set_mode_receive(self.__pi)
+        if data is None:
+            return
+        self.__rx_frames.inc()
+        if self.__receive_buffer.put(data, tick if start_tick is None else start_tick):
+            self.__rx_buffer_depth.value = len(self.__receive_buffer)
+            RX_READ_SECONDS.observe(time.perf_counter() - start)
+            listener = self.__receive_listener
+            if listener is not None:
+                listener()
+        else:
+            self.__rx_frames_dropped.inc()
 
     def receive(self, address):
-        print("receive", address)
-        self.__gpio.set_mode(self.__pi, Nrf905Gpio.STANDBY)
-        self.__gpio.set_data_ready_callback(self.__pi, self.data_ready_callback)
-        # Send data to registers for receive.
-        self.__spi.set_address(self.__pi, address)
-        self.__gpio.set_mode(self.__pi, Nrf905Gpio.RECEIVE)
+        """ Sets the RX address and starts listening.  Received payloads are
+        buffered by data_ready_callback.
+        """
+        self.__gpio.set_mode_standby(self.__pi)
+        # Send data to registers for receive.  RX_ADDRESS is bytes 5 to 8 of
+        # the configuration register, LSB first.
+        config = self.__spi.configuration_register_read(self.__pi)
+        config[5:9] = list(address.to_bytes(4, 'little'))
+        self.__spi.configuration_register_write(self.__pi, config)
+        self.__address = address
+        self.__gpio.set_mode_receive(self.__pi)
+
+    def set_frequency(self, frequency_mhz, nearest=False):
+        """ Tunes to frequency_mhz (see nrf905_spi.frequency_to_channel) with
+        one CHANNEL_CONFIG transaction and returns the Channel used.
+        """
+        channel = frequency_to_channel(frequency_mhz, nearest)
+        config = self.__spi.configuration_register_read(self.__pi)
+        mode = self.__gpio.get_mode()
+        self.__gpio.set_mode_standby(self.__pi)
+        self.__spi.set_channel_config(self.__pi, channel.ch_no, channel.hfreq_pll,
+                                      (config[1] >> 2) & 0x03)
+        if mode is not None:
+            self.__gpio.set_mode(self.__pi, mode)
+        return channel
+
+    def scan_band(self, hfreq_pll=0, dwell=0.005, samples=4, channels=None):
+        """ Listens on each channel of a band in turn and returns a dict of
+        Channel to occupancy: the fraction of CD samples that were high.
+        Each channel is sampled samples times spread over dwell seconds
+        after switching to it.  channels defaults to the whole band.
+        Each channel change is a single CHANNEL_CONFIG transaction.  The
+        channel and mode in use before the scan are restored afterwards.
+        """
+        if channels is None:
+            channels = band_channels(hfreq_pll)
+        config = self.__spi.configuration_register_read(self.__pi)
+        mode = self.__gpio.get_mode()
+        pa_pwr = (config[1] >> 2) & 0x03
+        interval = dwell / samples
+        occupancy = {}
+        for channel in channels:
+            self.__gpio.set_mode_standby(self.__pi)
+            self.__spi.set_channel_config(self.__pi, channel.ch_no, channel.hfreq_pll, pa_pwr)
+            self.__gpio.set_mode_receive(self.__pi)
+            high = 0
+            deadline = time.monotonic()
+            for _ in range(samples):
+                deadline += interval
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                high += self.__pi.read(self.__gpio.CARRIER_DETECT)
+            occupancy[channel] = high / samples
+        self.__gpio.set_mode_standby(self.__pi)
+        self.__spi.configuration_register_write(self.__pi, config)
+        if mode is not None:
+            self.__gpio.set_mode(self.__pi, mode)
+        return occupancy
+
+    def get_frame(self, timeout=0):
+        """ Returns the oldest received frame_buffer.Frame, or None if no
+        frame arrives within timeout seconds.  The frame's data is a view into
+        the RX buffer that is only valid until the next call.
+        """
+        frame = self.__receive_buffer.get(timeout)
+        self.__rx_buffer_depth.value = len(self.__receive_buffer)
+        return frame
+
+    def get_message(self, timeout=0):
+        """ Reads received frames until one completes a message and returns
+        it as a fragments.Message.  Returns None if no message is complete
+        within timeout seconds (None waits forever).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            frame = self.get_frame(remaining)
+            if frame is None:
+                self.reassembler.expire()
+                return None
+            message = self.reassembler.add(frame.data, tick=frame.tick)
+            if message is not None:
+                return message
+
+    def tick_time(self, tick):
+        """ Returns the time (as time.time()) at which the pigpio tick was
+        taken.  Ticks are converted with a tick and time read together, read
+        again once a minute as the two clocks drift.  Ticks wrap every 71
+        minutes so only ticks from within about 35 minutes of that reading
+        convert correctly.
+        """
+        now = time.monotonic()
+        if self.__tick_reference is None or now - self.__tick_reference_at > 60:
+            self.__tick_reference = (self.__pi.get_current_tick(), time.time())
+            self.__tick_reference_at = now
+        reference_tick, reference_time = self.__tick_reference
+        elapsed = (tick - reference_tick) & 0xffffffff
+        if elapsed >= 0x80000000:
+            elapsed -= 0x100000000
+        return reference_time + elapsed / 1000000
 
     def get_receive_data(self):
-        """ Returns a list of all bytes in the RX queue.  If the queue is empty,
-        returns empty list.
+        """ Returns a list of all bytes in the RX buffer.  If the buffer is
+        empty, returns empty list.
         """
         result = []
-        if len(self.__receive_queue) > 0:
-            while not self.__receive_queue.empty():
-                byte = self.__receive_queue.get()
-                result.append(byte)
+        frame = self.__receive_buffer.get()
+        while frame is not None:
+            result.extend(frame.data)
+            frame = self.__receive_buffer.get()
         return result
 
+    def get_receive_overflows(self):
+        """ Number of frames dropped because the RX buffer was full. """
+        return self.__receive_buffer.overflows
+
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+import collections
+import threading
+import time
+import pigpio
+from nrf905.fragments import Reassembler
+from nrf905.nrf905_hardware import Nrf905Hardware
+
+RadioFrame = collections.namedtuple('RadioFrame', ['radio', 'data', 'tick', 'sequence'])
+RadioFrame.__doc__ = """ A frame from one of the radios of an Nrf905Manager.
+    radio -- index of the radio, as returned by add_radio.
+    data, tick, sequence -- as in frame_buffer.Frame.  sequence counts per
+        radio.
+"""
+
+
+class Nrf905Manager:
+    """ Runs several nRF905 modules on one pigpio connection.
+
+    Each module has its own SPI bus and pin map (see nrf905_gpio.SPI_0_PINS
+    and SPI_1_PINS) and can listen on its own channel, so each adds a
+    channel's worth of receive capacity.  Frames from all of them come out of
+    get_frame() as one stream in the order they arrived.  pigpio runs all the
+    callbacks of a connection on one thread, so arrival order is tick order.
+    """
+
+    def __init__(self, pi=None, receive_capacity=64, reassembly_timeout=2.0):
+        """ pi defaults to a connection to the local pigpio daemon, which is
+        stopped by close().  A pi passed in is left running.
+        """
+        self.__owns_pi = pi is None
+        self.__pi = pi if pi is not None else pigpio.pi()
+        self.__receive_capacity = receive_capacity
+        self.radios = []
+        # Index of the radio each buffered frame came from, oldest first.
+        self.__arrivals = collections.deque()
+        self.__condition = threading.Condition()
+        self.reassembler = Reassembler(reassembly_timeout)
+
+    def add_radio(self, spi_bus, pins, address=None, frequency_mhz=None):
+        """ Opens the module on spi_bus wired to pins.  If address is given
+        it starts listening on it, on frequency_mhz if that is given too.
+        Returns the index of the radio; the Nrf905Hardware is
+        self.radios[index].
+        """
+        hardware = Nrf905Hardware(self.__pi, spi_bus, self.__receive_capacity, pins=pins)
+        hardware.open()
+        index = len(self.radios)
+        hardware.set_receive_listener(lambda: self.__frame_received(index))
+        if frequency_mhz is not None:
+            hardware.set_frequency(frequency_mhz)
+        if address is not None:
+            hardware.receive(address)
+        self.radios.append(hardware)
+        return index
+
+    def close(self):
+        for hardware in self.radios:
+            hardware.set_receive_listener(None)
+            hardware.close()
+        self.radios = []
+        if self.__owns_pi:
+            self.__pi.stop()
+
+    def __frame_received(self, index):
+        """ Runs on the pigpio callback thread. """
+        with self.__condition:
+            self.__arrivals.append(index)
+            self.__condition.notify()
+
+    def get_frame(self, timeout=0):
+        """ Returns the oldest frame received by any radio as a RadioFrame,
+        or None if none arrives within timeout seconds (None waits forever).
+        The data is a view into the radio's RX buffer that is valid until the
+        next frame is taken from the same radio.
+        """
+        while True:
+            with self.__condition:
+                if not self.__condition.wait_for(lambda: self.__arrivals, timeout):
+                    return None
+                index = self.__arrivals.popleft()
+            frame = self.radios[index].get_frame()
+            if frame is not None:
+                return RadioFrame(index, frame.data, frame.tick, frame.sequence)
+
+    def get_message(self, timeout=0):
+        """ Returns the next complete fragments.Message from any radio, or
+        None if none completes within timeout seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            frame = self.get_frame(remaining)
+            if frame is None:
+                self.reassembler.expire()
+                return None
+            message = self.reassembler.add(frame.data, tick=frame.tick)
+            if message is not None:
+                return message
+
+    def get_receive_overflows(self):
+        """ Frames dropped by all radios because their RX buffer was full. """
+        return sum(hardware.get_receive_overflows() for hardware in self.radios)
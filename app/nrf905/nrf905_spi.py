@@ -1,7 +1,66 @@
 #!/usr/bin/env python3
 
+import collections
+import time
 import pigpio
 
+try:
+    from nrf905.metrics import Counter, Histogram
+except ImportError:  # Run from this directory, where nrf905 is nrf905.py.
+    from metrics import Counter, Histogram
+
+SPI_TRANSFER_SECONDS = Histogram(
+    'nrf905_spi_transfer_seconds', 'Time taken by each SPI transaction with the nRF905.')
+SPI_TRANSFERS_SKIPPED = Counter(
+    'nrf905_spi_transfers_skipped_total',
+    'Register reads and writes answered from the shadow copy without an SPI transaction.')
+
+# The nRF905 channel plan (data sheet section 10.1):
+#     frequency = (422.4 + CH_NO / 10) * (1 + HFREQ_PLL) MHz
+# CH_NO is 9 bits, so each band has 512 channels, 100kHz apart in the 433MHz
+# band (HFREQ_PLL = 0) and 200kHz apart in the 868/915MHz band (HFREQ_PLL = 1).
+Channel = collections.namedtuple('Channel', ['frequency_mhz', 'ch_no', 'hfreq_pll'])
+
+CHANNELS_PER_BAND = 512
+
+
+def _channel_frequency(ch_no, hfreq_pll):
+    # Worked in units of 100kHz so the result is rounded the same way for
+    # every channel.
+    return (4224 + ch_no) * (1 + hfreq_pll) / 10
+
+
+CHANNEL_PLAN = tuple(Channel(_channel_frequency(ch_no, hfreq_pll), ch_no, hfreq_pll)
+                     for hfreq_pll in (0, 1) for ch_no in range(CHANNELS_PER_BAND))
+# Channels keyed by frequency in units of 100kHz.  The bands do not overlap.
+_CHANNELS_BY_TENTHS = {(4224 + channel.ch_no) * (1 + channel.hfreq_pll): channel
+                       for channel in CHANNEL_PLAN}
+
+
+def band_channels(hfreq_pll):
+    """ Returns the 512 channels of one band, lowest frequency first. """
+    start = hfreq_pll * CHANNELS_PER_BAND
+    return CHANNEL_PLAN[start:start + CHANNELS_PER_BAND]
+
+
+def frequency_to_channel(frequency_mhz, nearest=False):
+    """ Returns the Channel for frequency_mhz.  If it is not exactly a
+    channel frequency, raises ValueError, or with nearest=True returns the
+    closest channel in the nearer band.
+    """
+    tenths = round(frequency_mhz * 10)
+    channel = _CHANNELS_BY_TENTHS.get(tenths)
+    if channel is not None and abs(tenths - frequency_mhz * 10) < 1e-6:
+        return channel
+    if not nearest:
+        raise ValueError("Frequency not found.")
+    low_band_top = band_channels(0)[-1].frequency_mhz
+    high_band_bottom = band_channels(1)[0].frequency_mhz
+    hfreq_pll = 0 if frequency_mhz < (low_band_top + high_band_bottom) / 2 else 1
+    ch_no = round(frequency_mhz * 10 / (1 + hfreq_pll) - 4224)
+    return band_channels(hfreq_pll)[min(max(ch_no, 0), CHANNELS_PER_BAND - 1)]
+
+
 class Nrf905Spi:
     """ Handles access to SPI bus and the nRF905 registers.
     Extracts from the data sheet.
@@ -25,6 +84,7 @@ class Nrf905Spi:
     SPI_CE_ACTIVE_HIGH = 0 # nRF905 active low. 1 bit
     SPI_CE_PIN = 0 # Use SPIx_CE0_N. 1 bit
     SPI_USE_AUX = 0 # Use main for RPi1A/B. 1 bit
+    SPI_AUX_FLAG = 1 << 8  # The A bit selects the auxiliary SPI bus.
     SPI_3WIRE = 0  # nRF905 is 4 wire. 1 bit
     SPI_TX_LSB_FIRST = 0  # nRF905 is MSB first. 1 bit
     SPI_RX_LSB_FIRST = 0  # nRF905 is MSB first. 1 bit
@@ -38,6 +98,8 @@ class Nrf905Spi:
     INSTRUCTION_W_TX_ADDRESS = 0b00100010
     INSTRUCTION_R_TX_ADDRESS = 0b00100011
     INSTRUCTION_R_RX_ADDRESS = 0b00100100
+    # The data sheet calls 0b00100100 R_RX_PAYLOAD.
+    INSTRUCTION_R_RX_PAYLOAD = 0b00100100
     INSTRUCTION_CHANNEL_CONFIG = 0b10000000
 
 
@@ -49,8 +111,14 @@ class Nrf905Spi:
         self.__transmit_payload_width = 0b100000  # 32 bytes
         # The last value of the status register.
         self.__status_register = 0
+        # Shadow copies of the registers, None until read or written.  The
+        # nRF905 keeps its registers through power down, so they stay valid
+        # until the module loses power (see invalidate_cache).
+        self.__config = None
+        self.__transmit_address = None
         # Open SPI device
         self.__spi_handle = 0
+        self.__spi_bus = -1
         spi_flags = 0  # For SPI0
         if spi_bus == 0:
             self.__spi_bus = 0
@@ -64,36 +132,88 @@ class Nrf905Spi:
         if self.__spi_bus == -1:
             raise ValueError("spi_bus value not supported for this board")
         else:
-            self.__spi_handle = pi.spi_open(self.__spi_bus, self.SPI_SCK_HZ, spi_flags)
+            if self.__spi_bus == 1:
+                # SPI1 is the auxiliary bus, used with its CE0.
+                spi_flags |= self.SPI_AUX_FLAG
+            self.__spi_handle = pi.spi_open(0, self.SPI_SCK_HZ, spi_flags)
 
     def close(self, pi):
         pi.spi_close(self.__spi_handle)
 
+    def __xfer(self, pi, data):
+        start = time.perf_counter()
+        result = pi.spi_xfer(self.__spi_handle, data)
+        SPI_TRANSFER_SECONDS.observe(time.perf_counter() - start)
+        return result
+
+    def __write(self, pi, data):
+        start = time.perf_counter()
+        result = pi.spi_write(self.__spi_handle, data)
+        SPI_TRANSFER_SECONDS.observe(time.perf_counter() - start)
+        return result
+
+    def invalidate_cache(self):
+        """ Forgets the shadow registers so the next reads go to the device.
+        Call after the module has been power cycled.
+        """
+        self.__config = None
+        self.__transmit_address = None
+
     def configuration_register_write(self, pi, data):
         """ Writes data to the RF configuration register.
+            Only the bytes that differ from the shadow copy are sent: a
+            change to CH_NO, HFREQ_PLL or PA_PWR alone uses the two byte
+            CHANNEL_CONFIG instruction, anything else one W_CONFIG write
+            starting at the first changed byte.
             Raises ValueError exception if data does not contain 10 bytes.
         """
-        if len(data) == 10:
-            # Prepend the instruction for writing all bytes to the config 
-            # register.  The 4 least significant bytes are set to 0 so all 
-            # bytes are written to. 
-            data.insert(0, INSTRUCTION_W_CONFIG)
-            # Write the data to the register.
-            pi.spi_write(self.__spi_handle, data)
-        else:
+        if len(data) != 10:
             raise ValueError("data must contain 10 bytes")
+        data = [byte & 0xff for byte in data]
+        if self.__config is None:
+            first, last = 0, 9
+        else:
+            changed = [i for i in range(10) if data[i] != self.__config[i]]
+            if not changed:
+                SPI_TRANSFERS_SKIPPED.inc()
+                return
+            first, last = changed[0], changed[-1]
+        if self.__config is not None and last <= 1 \
+                and (data[1] ^ self.__config[1]) & 0xf0 == 0:
+            # Only channel, PLL and PA bits changed.
+            self.__write(pi, [self.INSTRUCTION_CHANNEL_CONFIG | (data[1] & 0x0f), data[0]])
+        else:
+            # The low 4 bits of W_CONFIG give the byte to start writing at.
+            self.__write(pi, [self.INSTRUCTION_W_CONFIG | first] + data[first:last + 1])
+        self.__set_config(data)
 
-    def configuration_register_read(self, pi):
+    def configuration_register_read(self, pi, refresh=False):
         """ Returns an array of 10 bytes read from the RF configuration register.
-            If the read was not successful, returns empty array.
+            The shadow copy is returned if there is one, unless refresh is
+            True.  If the read was not successful, returns empty array.
             We need to write an instruction byte before reading back the data
             so we use spi_xfer instead of spi_read.
             The command for reading all bytes is 0x10.
+            The first byte received is the status register.
         """
-        (count, data) = pi.spi_xfer(self.__spi_handle, b'\0x10')
+        if self.__config is not None and not refresh:
+            SPI_TRANSFERS_SKIPPED.inc()
+            return list(self.__config)
+        command = [self.INSTRUCTION_R_CONFIG] + [0] * 10
+        (count, data) = self.__xfer(pi, command)
         if count < 0:
-            data = []
-        return data
+            return []
+        self.__status_register = data[0]
+        self.__set_config(list(data[1:]))
+        return list(self.__config)
+
+    def __set_config(self, config):
+        """ Updates the shadow copy and the register widths it sets. """
+        self.__config = config
+        self.__receive_address_width = config[2] & 0x07
+        self.__transmit_address_width = (config[2] >> 4) & 0x07
+        self.__receive_payload_width = config[3] & 0x3f
+        self.__transmit_payload_width = config[4] & 0x3f
 
     def configuration_register_print(self, data):
         # Prints the values using data sheet names.
@@ -158,38 +278,22 @@ class Nrf905Spi:
     def __frequency_to_bits(self, frequency):
         """ Returns a pair of bytes correct values of CH_NO and HFREQ_PLL.
         Raises exception if frequency is invalid.
-        Table 24 from data sheet gives these values.
         The HFREQ_PLL is byte 1, bit 1 and CH_NO bit 8 is byte 1, bit 0.
-        So all that is needed it a tuple containing a frequency and two byte
-        values.
         UK frequency ranges:
             433.05 to 434.79
             863.00 to 870.00
-        TODO Add more valid frequencies.
         """
-        frequency_list = [
-            (430.0, (0b01001100, 0b00)),  # 430MHz
-            (433.1, (0b01101011, 0b00)),
-            (433.2, (0b01101100, 0b00)),
-            (433.7, (0b01111011, 0b00)),
-            (862.0, (0b01010110, 0b10)),  # 860MHz
-            (868.2, (0b01110101, 0b10)),
-            (868.4, (0b01110110, 0b10)),
-            (869.8, (0b01111101, 0b10)),
-            (902.2, (0b00011111, 0b11)),  # 900MHZ
-            (902.4, (0b00100000, 0b11)),
-            (927.8, (0b10011111, 0b11))
-        ]
-        result = (0,0)
-        for entry in frequency_list:
-            if entry[0] == frequency:
-                result = entry[1]
-        if result == (0, 0):
-            raise ValueError("Frequency not found.")
-        return result
+        channel = frequency_to_channel(frequency)
+        return (channel.ch_no & 0xff, (channel.hfreq_pll << 1) | (channel.ch_no >> 8))
 
     def write_transmit_payload(self, pi, payload):
-        pass
+        """ Writes payload (up to the TX payload width, 32 bytes by default)
+        to the TX payload register.
+        """
+        data = bytearray(1 + len(payload))
+        data[0] = self.INSTRUCTION_W_TX_PAYLOAD
+        data[1:] = payload
+        self.__write(pi, data)
 
     def read_transmit_payload(self, pi, payload):
         pass
@@ -201,40 +305,80 @@ class Nrf905Spi:
         """
         # Create the array of bytes to send.
         data = []
-        data.append(INSTRUCTION_W_TX_ADDRESS)
+        data.append(self.INSTRUCTION_W_TX_ADDRESS)
         for i in range(0, self.__transmit_address_width):
             byte = address & 0x000000FF
             data.append(byte)
             address = address >> 8
-        print("wta:", address, data)
+        if data[1:] == self.__transmit_address:
+            SPI_TRANSFERS_SKIPPED.inc()
+            return
         # Send the bytes.
-        (count, status) = pi.spi_xfer(self.__spi_handle, data)
-        # There should only be one byte received, the value of the status register.
-        print("wta:", count, status)
-        self.__status_register = status
+        (count, status) = self.__xfer(pi, data)
+        # The first byte received is the value of the status register.
+        self.__status_register = status[0]
+        self.__transmit_address = data[1:]
 
-    def read_transmit_address(self, pi):
+    def read_transmit_address(self, pi, refresh=False):
         """ Returns a 32 bit value representing the address.
         The value returned is  1 to 4 bytes long (dependent on the value in the 
         config register).   Multi-byte values are returned LSB first, so the 
         bytes need to be reversed.
+        The shadow copy is returned if there is one, unless refresh is True.
         """
+        if self.__transmit_address is not None and not refresh:
+            SPI_TRANSFERS_SKIPPED.inc()
+            return int.from_bytes(bytes(self.__transmit_address), 'little')
         # Send the instruction to read the TX ADDRESS register.
-        command = INSTRUCTION_R_TX_ADDRESS
-        (count, address) = pi.spi_xfer(self.__spi_handle, command)
-        print("rta:", count, address)
+        command = [self.INSTRUCTION_R_TX_ADDRESS] + [0] * self.__transmit_address_width
+        (count, data) = self.__xfer(pi, command)
         # The first byte received is the status register.
-        self.__status_register = address.pop(0)
-        # What is left is the address so reverse the bytes.
-        address.reverse()
-        #  TODO Convert the byte array into a 32 bit value. 
-        return address
+        self.__status_register = data[0]
+        # What is left is the address, LSB first.
+        self.__transmit_address = list(data[1:])
+        return int.from_bytes(bytes(data[1:]), 'little')
 
     def read_receive_payload(self, pi):
-        pass
+        """ Returns the RX payload as a list of bytes.  Reading the payload
+        clears DR and AM.
+        """
+        command = [self.INSTRUCTION_R_RX_PAYLOAD] + [0] * self.__receive_payload_width
+        (count, data) = self.__xfer(pi, command)
+        if count < 0:
+            return []
+        self.__status_register = data[0]
+        return list(data[1:])
+
+    def read_receive_frame(self, pi):
+        """ Like read_receive_payload but returns a memoryview of the SPI
+        reply without copying the payload into a list.  Returns None if the
+        read failed.
+        """
+        command = [self.INSTRUCTION_R_RX_PAYLOAD] + [0] * self.__receive_payload_width
+        (count, data) = self.__xfer(pi, command)
+        if count < 0:
+            return None
+        self.__status_register = data[0]
+        return memoryview(data)[1:count]
 
     def set_channel_config(self, pi, channel, hfreq_pll, pa_pwr):
-        pass
+        """ Sets CH_NO (9 bits), HFREQ_PLL (1 bit) and PA_PWR (2 bits) with
+        the two byte CHANNEL_CONFIG instruction.  Does nothing if the shadow
+        copy shows they are already set.
+        """
+        if not 0 <= channel <= 0x1ff or hfreq_pll not in (0, 1) or not 0 <= pa_pwr <= 3:
+            raise ValueError("channel config out of range")
+        bits = (pa_pwr << 2) | (hfreq_pll << 1) | (channel >> 8)
+        if self.__config is not None:
+            if self.__config[0] == channel & 0xff and self.__config[1] & 0x0f == bits:
+                SPI_TRANSFERS_SKIPPED.inc()
+                return
+        self.__write(pi, [self.INSTRUCTION_CHANNEL_CONFIG | bits, channel & 0xff])
+        if self.__config is not None:
+            config = list(self.__config)
+            config[0] = channel & 0xff
+            config[1] = (config[1] & 0xf0) | bits
+            self.__set_config(config)
 
     def get_status_register(self):
         """Gets the last read value of the status register. """
@@ -0,0 +1,491 @@
+#!/usr/bin/env python3
+""" An in-process stand in for pigpio.pi() with simulated nRF905 modules.
+
+SimulatedPi implements the part of the pigpio API the driver uses (GPIO
+modes, reads and writes, pull up/downs, edge callbacks and the SPI
+functions) so the Nrf905Gpio, Nrf905Spi and Nrf905Hardware classes can run
+on any box.  Every API call costs a configurable round trip, which models
+the socket round trip to pigpiod.
+
+Each SimulatedNrf905 models the registers of the chip (table 13 of the data
+sheet), follows the PWR_UP, TRX_CE and TX_EN pins and drives the DR, CD and
+AM pins.  Radios attached to the same SimulatedAir hear each other.
+Frames can also be put on the air by a test with SimulatedNrf905.inject().
+
+Callbacks are run on a thread of their own, in order, as pigpio does.
+"""
+
+import queue
+import threading
+import time
+
+from nrf905.nrf905_gpio import DEFAULT_PINS
+
+# pigpio constants (same values as the pigpio module).
+INPUT = 0
+OUTPUT = 1
+PUD_OFF = 0
+PUD_DOWN = 1
+PUD_UP = 2
+RISING_EDGE = 0
+FALLING_EDGE = 1
+EITHER_EDGE = 2
+SPI_AUX = 1 << 8  # spi_open flag for the auxiliary SPI bus.
+
+# nRF905 instructions (table 13).
+W_CONFIG = 0x00
+R_CONFIG = 0x10
+W_TX_PAYLOAD = 0x20
+R_TX_PAYLOAD = 0x21
+W_TX_ADDRESS = 0x22
+R_TX_ADDRESS = 0x23
+R_RX_PAYLOAD = 0x24
+CHANNEL_CONFIG = 0x80
+
+# Status register bits.
+STATUS_DR = 0x20
+STATUS_AM = 0x80
+
+# Power on values of the RF configuration register (table 14).
+DEFAULT_CONFIG = [0x6c, 0x00, 0x44, 0x20, 0x20, 0xe7, 0xe7, 0xe7, 0xe7, 0xe7]
+
+def _tick():
+    """ Microseconds, wrapping at 32 bits like pigpio ticks. """
+    return int(time.monotonic() * 1000000) & 0xffffffff
+
+
+class _Callback:
+    """ Returned by SimulatedPi.callback(), like pigpio's _callback. """
+
+    def __init__(self, pi, gpio, edge, func):
+        self.gpio = gpio
+        self.edge = edge
+        self.func = func
+        self.__pi = pi
+
+    def cancel(self):
+        self.__pi._cancel_callback(self)
+
+
+class SimulatedAir:
+    """ Connects SimulatedNrf905 radios.  A transmitted frame is received by
+    every other radio that is in receive mode on the same channel and whose
+    RX address matches the TX address.
+    """
+
+    def __init__(self):
+        self.radios = []
+
+    def transmit(self, sender, channel, address, payload):
+        for radio in self.radios:
+            if radio is not sender:
+                radio.hear(channel, address, payload)
+
+
+class SimulatedNrf905:
+    """ Register and pin level model of one nRF905.
+
+    airtime_us is the time between entering ShockBurst TX and DR going high.
+    """
+
+    def __init__(self, pins=None, air=None, airtime_us=0):
+        self.pins = dict(DEFAULT_PINS, **(pins or {}))
+        self.config = list(DEFAULT_CONFIG)
+        self.tx_address = [0xe7] * 4
+        self.tx_payload = [0] * 32
+        self.rx_payload = [0] * 32
+        self.airtime_us = airtime_us
+        self.pi = None
+        self.air = air
+        if air is not None:
+            air.radios.append(self)
+        self.data_ready = 0
+        self.carrier_detect = 0
+        self.address_matched = 0
+        self.mode = 'power_down'
+        self.frames_sent = 0
+        self.frames_received = 0
+        self.frames_dropped = 0
+        # (CH_NO, HFREQ_PLL) of channels someone else is transmitting on.  CD
+        # is high while receiving on one of them.
+        self.carriers = set()
+
+    # Configuration register fields.
+
+    @property
+    def channel(self):
+        """ (CH_NO, HFREQ_PLL) """
+        return (((self.config[1] & 0x01) << 8) | self.config[0], (self.config[1] >> 1) & 0x01)
+
+    @property
+    def rx_address(self):
+        width = self.config[2] & 0x07
+        return bytes(self.config[5:5 + width])
+
+    @property
+    def tx_address_bytes(self):
+        width = (self.config[2] >> 4) & 0x07
+        return bytes(self.tx_address[:width])
+
+    @property
+    def rx_payload_width(self):
+        return self.config[3] & 0x3f
+
+    @property
+    def tx_payload_width(self):
+        return self.config[4] & 0x3f
+
+    def status(self):
+        result = 0
+        if self.data_ready:
+            result |= STATUS_DR
+        if self.address_matched:
+            result |= STATUS_AM
+        return result
+
+    # SPI
+
+    def spi_xfer(self, data):
+        """ Runs one SPI transaction (CSN low to high) and returns the bytes
+        clocked out on MISO.
+        """
+        data = list(data)
+        if not data:
+            return []
+        instruction = data[0]
+        out = [self.status()] + [0] * (len(data) - 1)
+        args = data[1:]
+        if instruction & 0xf0 == W_CONFIG:
+            offset = instruction & 0x0f
+            for i, byte in enumerate(args[:10 - offset]):
+                self.config[offset + i] = byte & 0xff
+        elif instruction & 0xf0 == R_CONFIG:
+            offset = instruction & 0x0f
+            values = self.config[offset:]
+            for i in range(min(len(args), len(values))):
+                out[1 + i] = values[i]
+        elif instruction == W_TX_PAYLOAD:
+            for i, byte in enumerate(args[:32]):
+                self.tx_payload[i] = byte & 0xff
+        elif instruction == R_TX_PAYLOAD:
+            for i in range(min(len(args), 32)):
+                out[1 + i] = self.tx_payload[i]
+        elif instruction == W_TX_ADDRESS:
+            for i, byte in enumerate(args[:4]):
+                self.tx_address[i] = byte & 0xff
+        elif instruction == R_TX_ADDRESS:
+            for i in range(min(len(args), 4)):
+                out[1 + i] = self.tx_address[i]
+        elif instruction == R_RX_PAYLOAD:
+            for i in range(min(len(args), 32)):
+                out[1 + i] = self.rx_payload[i]
+            # DR and AM go low once the payload has been clocked out.
+            if self.data_ready and len(args) >= self.rx_payload_width:
+                self.__set_pins(data_ready=0, address_matched=0, carrier_detect=0)
+        elif instruction & 0xf0 == CHANNEL_CONFIG:
+            if args:
+                self.config[0] = args[0] & 0xff
+            self.config[1] = (self.config[1] & 0xf0) | (instruction & 0x0f)
+        return out
+
+    # Pins
+
+    def output_changed(self, levels):
+        """ Called by SimulatedPi when PWR_UP, TRX_CE or TX_EN change. """
+        power_up = levels.get(self.pins['power_up'], 0)
+        chip_enable = levels.get(self.pins['chip_enable'], 0)
+        transmit_enable = levels.get(self.pins['transmit_enable'], 0)
+        if not power_up:
+            mode = 'power_down'
+        elif not chip_enable:
+            mode = 'standby'
+        elif transmit_enable:
+            mode = 'transmit'
+        else:
+            mode = 'receive'
+        if mode == self.mode:
+            return
+        previous = self.mode
+        self.mode = mode
+        if mode == 'transmit':
+            self.__set_pins(data_ready=0, address_matched=0, carrier_detect=0)
+            self.pi._schedule(self.airtime_us, self.__transmitted)
+        elif previous == 'transmit':
+            self.__set_pins(data_ready=0)
+
+    def __transmitted(self):
+        if self.mode != 'transmit':
+            return
+        self.frames_sent += 1
+        if self.air is not None:
+            self.air.transmit(self, self.channel, self.tx_address_bytes,
+                              bytes(self.tx_payload[:self.tx_payload_width]))
+        self.__set_pins(data_ready=1)
+
+    def hear(self, channel, address, payload):
+        """ A frame is on the air.  It is received if this radio is listening
+        on the channel and the address matches.
+        """
+        with self.pi.lock:
+            self.__hear(channel, address, payload)
+
+    def __hear(self, channel, address, payload):
+        if self.mode != 'receive' or channel != self.channel:
+            return
+        if address != self.rx_address:
+            return
+        if self.data_ready:
+            # Previous payload not read yet.
+            self.frames_dropped += 1
+            return
+        payload = list(payload[:self.rx_payload_width])
+        self.rx_payload = payload + [0] * (32 - len(payload))
+        self.frames_received += 1
+        self.__set_pins(carrier_detect=1)
+        self.__set_pins(address_matched=1)
+        self.__set_pins(data_ready=1)
+
+    def inject(self, payload, address=None, channel=None):
+        """ Puts a frame on the air for this radio only.  address and channel
+        default to what the radio is listening to.
+        """
+        if address is None:
+            address = self.rx_address
+        if channel is None:
+            channel = self.channel
+        self.hear(channel, bytes(address), bytes(payload))
+
+    def __set_pins(self, **levels):
+        for name, level in levels.items():
+            if getattr(self, name) != level:
+                setattr(self, name, level)
+                if self.pi is not None:
+                    self.pi._input_changed(self.pins[name], level)
+
+    def level(self, gpio):
+        """ Returns the level the radio drives on gpio, or None. """
+        if self.pins['carrier_detect'] == gpio and self.mode == 'receive' \
+                and self.channel in self.carriers:
+            return 1
+        for name in ('data_ready', 'carrier_detect', 'address_matched'):
+            if self.pins[name] == gpio:
+                return getattr(self, name)
+        return None
+
+
+class SimulatedPi:
+    """ Stand in for pigpio.pi().
+
+    round_trip_us is added to every call to model the socket round trip to
+    the pigpio daemon.  Radios are attached per SPI bus: 0 for the main bus
+    and 1 for the auxiliary bus (the A bit of the spi_open flags).
+    """
+
+    def __init__(self, radios=None, round_trip_us=0, hardware_revision=2):
+        self.connected = True
+        self.round_trip_us = round_trip_us
+        self.hardware_revision = hardware_revision
+        self.calls = 0
+        self.__modes = {}
+        self.__levels = {}
+        self.__pulls = {}
+        self.__callbacks = []
+        self.__spi_handles = {}
+        self.__next_handle = 0
+        self.__radios = {}
+        self.lock = threading.RLock()
+        self.__events = queue.Queue()
+        self.__thread = threading.Thread(target=self.__dispatch, name='pigpio-sim', daemon=True)
+        self.__thread.start()
+        for bus, radio in (radios or {0: SimulatedNrf905()}).items():
+            self.attach(bus, radio)
+
+    def attach(self, spi_bus, radio):
+        radio.pi = self
+        self.__radios[spi_bus] = radio
+
+    def radio(self, spi_bus=0):
+        return self.__radios[spi_bus]
+
+    def __round_trip(self):
+        self.calls += 1
+        if self.round_trip_us:
+            end = time.perf_counter() + self.round_trip_us / 1000000
+            # Sleep for most of it, then spin for accuracy.
+            if self.round_trip_us > 200:
+                time.sleep((self.round_trip_us - 100) / 1000000)
+            while time.perf_counter() < end:
+                pass
+
+    # Connection
+
+    def stop(self):
+        self.connected = False
+        self.__events.put(None)
+
+    def get_hardware_revision(self):
+        self.__round_trip()
+        return self.hardware_revision
+
+    def get_current_tick(self):
+        self.__round_trip()
+        return _tick()
+
+    # GPIO
+
+    def set_mode(self, gpio, mode):
+        self.__round_trip()
+        with self.lock:
+            self.__modes[gpio] = mode
+        return 0
+
+    def get_mode(self, gpio):
+        self.__round_trip()
+        return self.__modes.get(gpio, INPUT)
+
+    def set_pull_up_down(self, gpio, pud):
+        self.__round_trip()
+        with self.lock:
+            before = self.__level(gpio)
+            self.__pulls[gpio] = pud
+            after = self.__level(gpio)
+        if before != after:
+            self._input_changed(gpio, after)
+        return 0
+
+    def read(self, gpio):
+        self.__round_trip()
+        with self.lock:
+            return self.__level(gpio)
+
+    def write(self, gpio, level):
+        self.__round_trip()
+        with self.lock:
+            self.__modes[gpio] = OUTPUT
+            self.__levels[gpio] = 1 if level else 0
+            self.__outputs_changed()
+        return 0
+
+    def read_bank_1(self):
+        self.__round_trip()
+        with self.lock:
+            result = 0
+            for gpio in range(32):
+                if self.__level(gpio):
+                    result |= 1 << gpio
+            return result
+
+    def set_bank_1(self, bits):
+        self.__round_trip()
+        with self.lock:
+            for gpio in range(32):
+                if bits & (1 << gpio):
+                    self.__levels[gpio] = 1
+            self.__outputs_changed()
+        return 0
+
+    def clear_bank_1(self, bits):
+        self.__round_trip()
+        with self.lock:
+            for gpio in range(32):
+                if bits & (1 << gpio):
+                    self.__levels[gpio] = 0
+            self.__outputs_changed()
+        return 0
+
+    def __level(self, gpio):
+        if self.__modes.get(gpio, INPUT) == OUTPUT:
+            return self.__levels.get(gpio, 0)
+        for radio in self.__radios.values():
+            level = radio.level(gpio)
+            if level is not None:
+                return level
+        return 1 if self.__pulls.get(gpio) == PUD_UP else 0
+
+    def __outputs_changed(self):
+        for radio in self.__radios.values():
+            radio.output_changed(self.__levels)
+
+    def callback(self, user_gpio, edge=RISING_EDGE, func=None):
+        self.__round_trip()
+        callback = _Callback(self, user_gpio, edge, func)
+        with self.lock:
+            self.__callbacks.append(callback)
+        return callback
+
+    def _cancel_callback(self, callback):
+        self.__round_trip()
+        with self.lock:
+            if callback in self.__callbacks:
+                self.__callbacks.remove(callback)
+
+    def _input_changed(self, gpio, level):
+        """ Queues the callbacks for an edge on gpio. """
+        tick = _tick()
+        wanted = RISING_EDGE if level else FALLING_EDGE
+        with self.lock:
+            callbacks = [c for c in self.__callbacks
+                         if c.gpio == gpio and c.edge in (wanted, EITHER_EDGE)]
+        for callback in callbacks:
+            self.__events.put((callback.func, gpio, level, tick))
+
+    def _schedule(self, delay_us, func):
+        """ Runs func on the callback thread after delay_us. """
+        self.__events.put((self.__delayed, func, time.perf_counter() + delay_us / 1000000, None))
+
+    @staticmethod
+    def __delayed(func, when, _):
+        while time.perf_counter() < when:
+            time.sleep(0)
+        func()
+
+    def __dispatch(self):
+        while True:
+            event = self.__events.get()
+            try:
+                if event is None:
+                    return
+                func, gpio, level, tick = event
+                func(gpio, level, tick)
+            finally:
+                self.__events.task_done()
+
+    def wait_idle(self):
+        """ Blocks until every queued callback has run. """
+        self.__events.join()
+
+    # SPI
+
+    def spi_open(self, spi_channel, baud, spi_flags=0):
+        self.__round_trip()
+        # Radios are attached per bus: 0 is the main SPI, 1 the auxiliary.
+        bus = 1 if spi_flags & SPI_AUX else 0
+        if bus not in self.__radios:
+            raise ValueError(f"No simulated radio on SPI bus {bus}")
+        handle = self.__next_handle
+        self.__next_handle += 1
+        self.__spi_handles[handle] = self.__radios[bus]
+        return handle
+
+    def spi_close(self, handle):
+        self.__round_trip()
+        del self.__spi_handles[handle]
+        return 0
+
+    def spi_xfer(self, handle, data):
+        self.__round_trip()
+        if isinstance(data, str):
+            data = data.encode('latin-1')
+        elif isinstance(data, int):
+            data = [data]
+        with self.lock:
+            out = self.__spi_handles[handle].spi_xfer(data)
+        return len(out), bytearray(out)
+
+    def spi_write(self, handle, data):
+        count, _ = self.spi_xfer(handle, data)
+        return count
+
+    def spi_read(self, handle, count):
+        self.__round_trip()
+        return count, bytearray(count)
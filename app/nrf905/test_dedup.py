@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from nrf905.dedup import DedupCache
+from nrf905.fragments import Reassembler, fragment
+
+
+class TestDedupCache(unittest.TestCase):
+
+    def test_seen(self):
+        cache = DedupCache(ttl=2.0)
+        self.assertFalse(cache.seen(('a', 1), now=0.0))
+        self.assertTrue(cache.seen(('a', 1), now=1.0))
+        self.assertFalse(cache.seen(('b', 1), now=1.0))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        self.assertIn(('a', 1), cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_ttl_counts_from_first_seen(self):
+        cache = DedupCache(ttl=2.0)
+        cache.seen('k', now=0.0)
+        self.assertTrue(cache.seen('k', now=1.5))
+        # Seeing it again did not extend its life.
+        self.assertFalse(cache.seen('k', now=2.0))
+        self.assertTrue(cache.seen('k', now=3.0))
+
+    def test_expire(self):
+        cache = DedupCache(ttl=1.0)
+        for index in range(5):
+            cache.add(index, now=index * 0.5)
+        cache.expire(now=2.2)
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn(2, cache)
+        self.assertIn(3, cache)
+
+    def test_bounded(self):
+        cache = DedupCache(ttl=10.0, max_entries=3)
+        for key in range(5):
+            cache.seen(key, now=0.0)
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.evicted, 2)
+        self.assertNotIn(0, cache)
+        self.assertFalse(cache.seen(0, now=0.0))
+
+    def test_reassembler_drops_repeats(self):
+        clock = [0.0]
+        reassembler = Reassembler(timeout=2.0, clock=lambda: clock[0])
+        frames = [bytes(frame) for frame in fragment(b'x' * 40, 7, source=0xa)]
+        self.assertIsNone(reassembler.add(frames[0]))
+        self.assertEqual(reassembler.add(frames[1]).data, b'x' * 40)
+        # AUTO_RETRAN resends the same frames.
+        self.assertIsNone(reassembler.add(frames[0]))
+        self.assertIsNone(reassembler.add(frames[1]))
+        self.assertEqual(len(reassembler), 0)
+        clock[0] = 2.5
+        self.assertIsNone(reassembler.add(frames[0]))
+        self.assertEqual(reassembler.add(frames[1]).data, b'x' * 40)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+import queue
+import unittest
+
+from nrf905 import fragments
+from nrf905.fragments import Reassembler
+from nrf905.nrf905 import Nrf905
+from nrf905.nrf905_hardware import Nrf905Hardware
+from nrf905.pigpio_sim import SimulatedAir, SimulatedNrf905, SimulatedPi
+
+
+def frames_of(data, message_id, source=0):
+    return [bytes(frame) for frame in fragments.fragment(data, message_id, source)]
+
+
+class TestFragments(unittest.TestCase):
+
+    def test_fragment(self):
+        data = bytes(range(60))
+        frames = frames_of(data, 300, source=0x12345678)
+        self.assertEqual(len(frames), 3)
+        self.assertEqual(fragments.fragment_count(len(data)), 3)
+        self.assertTrue(all(len(frame) == fragments.FRAME_SIZE for frame in frames))
+        self.assertEqual(fragments.parse_header(frames[0]), (0x12345678, 300 & 0xff, 0, False, 24))
+        self.assertEqual(fragments.parse_header(frames[2]), (0x12345678, 300 & 0xff, 2, True, 12))
+        self.assertEqual(frames[2][8:20], bytes(range(48, 60)))
+        self.assertEqual(frames[2][20:], bytes(12))
+
+    def test_empty(self):
+        frames = frames_of(b'', 1)
+        self.assertEqual(len(frames), 1)
+        self.assertEqual(fragments.parse_header(frames[0]), (0, 1, 0, True, 0))
+
+    def test_too_long(self):
+        with self.assertRaises(ValueError):
+            fragments.fragment(bytes(24 * fragments.MAX_FRAGMENTS + 1), 0)
+
+
+class TestReassembler(unittest.TestCase):
+
+    def test_single_frame(self):
+        reassembler = Reassembler()
+        message = reassembler.add(frames_of(b'hello', 5, source=9)[0], now=0, tick=1234)
+        self.assertEqual(message, (9, 5, b'hello', 1234))
+        # A repeat of a delivered message is not delivered again.
+        self.assertIsNone(reassembler.add(frames_of(b'hello', 5, source=9)[0], now=0.1))
+        self.assertEqual(reassembler.messages, 1)
+
+    def test_interleaved_out_of_order(self):
+        reassembler = Reassembler()
+        first = bytes(range(100))
+        second = bytes(range(100, 150))
+        a = frames_of(first, 1, source=1)
+        b = frames_of(second, 1, source=2)
+        order = [a[4], b[1], a[0], a[2], a[0], b[2], a[1], b[0], a[3]]
+        results = [reassembler.add(frame, now=0, tick=tick) for tick, frame in enumerate(order)]
+        # A message's tick is that of the first of its frames to arrive.
+        self.assertEqual(results[7], (2, 1, second, 1))
+        self.assertEqual(results[8], (1, 1, first, 0))
+        self.assertEqual(results.count(None), 7)
+        self.assertEqual(len(reassembler), 0)
+
+    def test_timeout(self):
+        reassembler = Reassembler(timeout=1.0)
+        frames = frames_of(bytes(50), 3)
+        reassembler.add(frames[0], now=0)
+        reassembler.add(frames[1], now=0.5)
+        self.assertEqual(len(reassembler), 1)
+        reassembler.expire(now=1.6)
+        self.assertEqual(len(reassembler), 0)
+        self.assertEqual(reassembler.evicted, 1)
+        self.assertIsNone(reassembler.add(frames[2], now=1.7))
+
+    def test_bounds(self):
+        reassembler = Reassembler(max_pending=2, max_message_size=100)
+        for source in range(3):
+            reassembler.add(frames_of(bytes(50), 0, source)[0], now=source)
+        self.assertEqual(len(reassembler), 2)
+        self.assertEqual(reassembler.evicted, 1)
+        frames = frames_of(bytes(200), 0, source=7)
+        for frame in frames:
+            self.assertIsNone(reassembler.add(frame, now=5))
+        self.assertGreater(reassembler.dropped, 0)
+
+    def test_message_id_wrap(self):
+        # At full rate a sender gets back to the same message id in about
+        # 256 * 7.7ms.  The new message must not be taken for a repeat.
+        reassembler = Reassembler()
+        now = 0.0
+        for count in range(300):
+            data = count.to_bytes(2, 'little')
+            message = reassembler.add(frames_of(data, count, source=4)[0], now=now)
+            self.assertEqual(message.data, data)
+            now += 0.0077
+        self.assertEqual(reassembler.messages, 300)
+
+    def test_fragment_past_last(self):
+        reassembler = Reassembler()
+        frames = frames_of(bytes(range(40)), 2)
+        stray = bytearray(frames[0])
+        fragments.HEADER.pack_into(stray, 0, 0, 2, 5, 10)
+        # Past the end of a message whose last fragment has arrived.
+        self.assertIsNone(reassembler.add(frames[1], now=0))
+        self.assertIsNone(reassembler.add(bytes(stray), now=0))
+        self.assertEqual(reassembler.dropped, 1)
+        self.assertEqual(reassembler.add(frames[0], now=0).data, bytes(range(40)))
+        # Past the end, arriving before the last fragment.
+        frames = frames_of(bytes(range(40)), 3)
+        fragments.HEADER.pack_into(stray, 0, 0, 3, 5, 10)
+        self.assertIsNone(reassembler.add(frames[0], now=0))
+        self.assertIsNone(reassembler.add(bytes(stray), now=0))
+        self.assertEqual(reassembler.add(frames[1], now=0).data, bytes(range(40)))
+        self.assertEqual(len(reassembler), 0)
+
+    def test_many_senders(self):
+        reassembler = Reassembler()
+        messages = {source: bytes([source & 0xff]) * 70 for source in range(500)}
+        frames = [frames_of(data, 0, source) for source, data in messages.items()]
+        received = {}
+        for index in range(3):
+            for source_frames in frames:
+                message = reassembler.add(source_frames[index], now=0)
+                if message is not None:
+                    received[message.source] = message.data
+        self.assertEqual(received, messages)
+
+
+class TestTransmit(unittest.TestCase):
+
+    def test_transmit(self):
+        air = SimulatedAir()
+        # Give the receiver time to read each frame before the next arrives.
+        sender = SimulatedNrf905(air=air, airtime_us=1000)
+        receiver = SimulatedNrf905(air=air)
+        tx_pi = SimulatedPi({0: sender})
+        rx_pi = SimulatedPi({0: receiver})
+        rx = Nrf905Hardware(rx_pi, receive_capacity=16)
+        rx.open()
+        rx.receive(0x12345678)
+        tx = Nrf905Hardware(tx_pi)
+        tx.open()
+        tx.receive(0xcafe)
+        data = bytes(range(200))
+        self.assertEqual(tx.transmit(data, address=0x12345678), 0)
+        self.assertEqual(tx.transmit(b'next', address=0x12345678), 1)
+        rx_pi.wait_idle()
+        self.assertEqual(sender.frames_sent, 10)
+        self.assertEqual(sender.mode, 'receive')
+        first = rx.get_message()
+        second = rx.get_message()
+        self.assertEqual(first[:3], (0xcafe, 0, data))
+        self.assertEqual(second[:3], (0xcafe, 1, b'next'))
+        self.assertGreater((second.tick - first.tick) & 0xffffffff, 0)
+        self.assertIsNone(rx.get_message(timeout=0.01))
+        tx.term()
+        rx.term()
+
+    def test_nrf905_write_callback(self):
+        air = SimulatedAir()
+        tx_pi = SimulatedPi({0: SimulatedNrf905(air=air, airtime_us=1000)})
+        rx_pi = SimulatedPi({0: SimulatedNrf905(air=air)})
+        messages = queue.Queue()
+        receiver = Nrf905(Nrf905Hardware(rx_pi))
+        receiver.set_address(0x12345678)
+        receiver.open(434, messages.put)
+        transmitter = Nrf905(Nrf905Hardware(tx_pi))
+        transmitter.open(434)
+        # 434MHz is CH_NO 116 of the 433MHz band, not the power on 433.2MHz.
+        self.assertEqual(rx_pi.radio(0).channel, (116, 0))
+        self.assertEqual(tx_pi.radio(0).channel, (116, 0))
+        tx_pi.radio(0).tx_address = [0x78, 0x56, 0x34, 0x12]
+        transmitter.write(bytes(range(100)))
+        self.assertEqual(messages.get(timeout=1), bytes(range(100)))
+        transmitter.close()
+        receiver.close()
+
+    def test_transmit_returns_to_standby(self):
+        pi = SimulatedPi()
+        hardware = Nrf905Hardware(pi)
+        hardware.open()
+        hardware.transmit(b'hello')
+        self.assertEqual(pi.radio(0).mode, 'standby')
+        hardware.term()
+
+    def test_transmit_timeout(self):
+        pi = SimulatedPi()
+        # Without open() there is no DR callback to signal the end of the frame.
+        hardware = Nrf905Hardware(pi)
+        with self.assertRaises(TimeoutError):
+            hardware.transmit(b'hello', timeout=0.05)
+        self.assertEqual(pi.radio(0).mode, 'standby')
+        pi.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import threading
+import unittest
+
+from nrf905.frame_buffer import FrameRingBuffer
+from nrf905.nrf905_hardware import Nrf905Hardware
+from nrf905.pigpio_sim import SimulatedPi
+
+
+class TestFrameRingBuffer(unittest.TestCase):
+
+    def test_put_get(self):
+        ring = FrameRingBuffer(capacity=4, frame_size=32)
+        self.assertIsNone(ring.get())
+        self.assertTrue(ring.put(bytes(range(32)), tick=100))
+        self.assertTrue(ring.put(b'\x01\x02', tick=200))
+        self.assertEqual(len(ring), 2)
+        frame = ring.get()
+        self.assertIsInstance(frame.data, memoryview)
+        self.assertEqual(bytes(frame.data), bytes(range(32)))
+        self.assertEqual((frame.tick, frame.sequence), (100, 0))
+        frame = ring.get()
+        self.assertEqual(bytes(frame.data), b'\x01\x02')
+        self.assertEqual((frame.tick, frame.sequence), (200, 1))
+        self.assertIsNone(ring.get())
+        self.assertEqual(len(ring), 0)
+
+    def test_overflow(self):
+        ring = FrameRingBuffer(capacity=2, frame_size=4)
+        self.assertTrue(ring.put(b'aaaa'))
+        self.assertTrue(ring.put(b'bbbb'))
+        self.assertFalse(ring.put(b'cccc'))
+        self.assertEqual(ring.overflows, 1)
+        self.assertEqual(bytes(ring.get().data), b'aaaa')
+        # The slot of a frame handed out is not reused until it is released.
+        self.assertFalse(ring.put(b'dddd'))
+        ring.release()
+        self.assertTrue(ring.put(b'eeee'))
+        self.assertEqual(ring.get().data.tobytes(), b'bbbb')
+        frame = ring.get()
+        self.assertEqual(bytes(frame.data), b'eeee')
+        # Dropped frames leave a gap in the sequence numbers.
+        self.assertEqual(frame.sequence, 4)
+
+    def test_get_waits(self):
+        ring = FrameRingBuffer(capacity=2, frame_size=4)
+        self.assertIsNone(ring.get(timeout=0.01))
+        timer = threading.Timer(0.01, ring.put, (b'abcd', 7))
+        timer.start()
+        frame = ring.get(timeout=1)
+        timer.join()
+        self.assertEqual((bytes(frame.data), frame.tick), (b'abcd', 7))
+
+    def test_hardware_frames(self):
+        pi = SimulatedPi()
+        radio = pi.radio(0)
+        hardware = Nrf905Hardware(pi, receive_capacity=2)
+        hardware.open()
+        hardware.receive(0x12345678)
+        for value in range(3):
+            radio.inject(bytes([value]) * 32)
+            pi.wait_idle()
+        self.assertEqual(hardware.get_receive_overflows(), 1)
+        frame = hardware.get_frame()
+        self.assertEqual(bytes(frame.data), bytes(32))
+        self.assertEqual(frame.sequence, 0)
+        frame = hardware.get_frame()
+        self.assertEqual(bytes(frame.data), b'\x01' * 32)
+        self.assertGreaterEqual(frame.tick, 0)
+        self.assertIsNone(hardware.get_frame())
+        hardware.term()
+
+
+if __name__ == '__main__':
+    unittest.main()
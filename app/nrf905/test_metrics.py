@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from nrf905.metrics import REGISTRY, Counter, Gauge, Histogram, Registry
+from nrf905.nrf905_hardware import Nrf905Hardware
+from nrf905.pigpio_sim import SimulatedPi
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_render(self):
+        registry = Registry()
+        histogram = Histogram('test_seconds', 'Test.', (0.1, 1.0), registry=registry)
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        counter = Counter('test_total', 'Test.', ['kind'], registry=registry)
+        counter.labels('a"b').inc(2)
+        Gauge('test_depth', 'Test.', registry=registry, function=lambda: 7)
+        Counter('test_kept_total', 'Test.', registry=registry, function=lambda: 9)
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE test_seconds histogram', lines)
+        self.assertIn('test_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{le="1.0"} 2', lines)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count 3', lines)
+        self.assertIn('test_total{kind="a\\"b"} 2', lines)
+        self.assertIn('test_depth 7', lines)
+        self.assertIn('# TYPE test_kept_total counter', lines)
+        self.assertIn('test_kept_total 9', lines)
+        with self.assertRaises(ValueError):
+            Counter('test_total', 'Again.', registry=registry)
+        with self.assertRaises(ValueError):
+            counter.labels()
+
+    def test_radio_metrics(self):
+        frames = REGISTRY.get('nrf905_rx_frames_total').labels('0')
+        dr_to_read = REGISTRY.get('nrf905_rx_dr_to_read_seconds')
+        before = (frames.value, dr_to_read.count)
+        pi = SimulatedPi()
+        hardware = Nrf905Hardware(pi, tick_sample_every=2)
+        hardware.open()
+        hardware.receive(0x12345678)
+        for _ in range(4):
+            pi.radio(0).inject(bytes(32))
+            pi.wait_idle()
+            hardware.get_frame()
+        self.assertEqual(frames.value - before[0], 4)
+        self.assertEqual(dr_to_read.count - before[1], 2)
+        self.assertIn('nrf905_spi_transfer_seconds_count', REGISTRY.render())
+        hardware.term()
+
+
+if __name__ == '__main__':
+    unittest.main()
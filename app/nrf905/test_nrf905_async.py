@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+import asyncio
+import unittest
+
+from nrf905.nrf905_async import Nrf905Async
+from nrf905.nrf905_hardware import Nrf905Hardware
+from nrf905.pigpio_sim import SimulatedAir, SimulatedNrf905, SimulatedPi
+
+
+class TestNrf905Async(unittest.IsolatedAsyncioTestCase):
+
+    async def test_write_and_receive(self):
+        air = SimulatedAir()
+        tx_pi = SimulatedPi({0: SimulatedNrf905(air=air, airtime_us=1000)})
+        rx_pi = SimulatedPi({0: SimulatedNrf905(air=air)})
+        async with Nrf905Async(Nrf905Hardware(rx_pi), address=0x12345678) as receiver, \
+                Nrf905Async(Nrf905Hardware(tx_pi), address=0xcafe) as transmitter:
+            data = bytes(range(100))
+            self.assertEqual(await transmitter.write(data, address=0x12345678), 0)
+            self.assertEqual(await transmitter.write(b'two', address=0x12345678), 1)
+            messages = []
+            async for message in receiver:
+                messages.append(message)
+                if len(messages) == 2:
+                    break
+            self.assertEqual([message[:3] for message in messages],
+                             [(0xcafe, 0, data), (0xcafe, 1, b'two')])
+
+    async def test_iterator_ends_on_close(self):
+        radio = Nrf905Async(Nrf905Hardware(SimulatedPi()), address=0x12345678)
+        await radio.open()
+
+        async def read_all():
+            return [message async for message in radio]
+        task = asyncio.create_task(read_all())
+        await asyncio.sleep(0)
+        await radio.close()
+        self.assertEqual(await asyncio.wait_for(task, 1), [])
+
+    async def test_write_timeout(self):
+        pi = SimulatedPi({0: SimulatedNrf905(airtime_us=200000)})
+        async with Nrf905Async(Nrf905Hardware(pi)) as radio:
+            with self.assertRaises(TimeoutError):
+                await radio.write(b'hello', timeout=0.05)
+            self.assertEqual(pi.radio(0).mode, 'standby')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from nrf905.nrf905_gpio import SPI_0_PINS, SPI_1_PINS
+from nrf905.nrf905_hardware import Nrf905Hardware
+from nrf905.nrf905_manager import Nrf905Manager
+from nrf905.pigpio_sim import SimulatedAir, SimulatedNrf905, SimulatedPi
+
+
+class TestNrf905Manager(unittest.TestCase):
+
+    def setUp(self):
+        self.air = SimulatedAir()
+        self.radio_0 = SimulatedNrf905(pins=SPI_0_PINS, air=self.air)
+        self.radio_1 = SimulatedNrf905(pins=SPI_1_PINS, air=self.air)
+        self.pi = SimulatedPi({0: self.radio_0, 1: self.radio_1})
+        self.manager = Nrf905Manager(self.pi)
+
+    def tearDown(self):
+        self.manager.close()
+        self.pi.stop()
+
+    def test_parallel_channels(self):
+        self.assertEqual(self.manager.add_radio(0, SPI_0_PINS, 0x12345678, 433.2), 0)
+        self.assertEqual(self.manager.add_radio(1, SPI_1_PINS, 0x12345678, 434.2), 1)
+        self.assertEqual(self.radio_0.channel, (108, 0))
+        self.assertEqual(self.radio_1.channel, (118, 0))
+        self.assertEqual((self.radio_0.mode, self.radio_1.mode), ('receive', 'receive'))
+        self.radio_1.inject(b'\x01' * 32)
+        self.pi.wait_idle()
+        self.radio_0.inject(b'\x00' * 32)
+        self.pi.wait_idle()
+        self.radio_1.inject(b'\x02' * 32)
+        self.pi.wait_idle()
+        frames = []
+        frame = self.manager.get_frame()
+        while frame is not None:
+            frames.append((frame.radio, bytes(frame.data[:1]), frame.sequence, frame.tick))
+            frame = self.manager.get_frame()
+        self.assertEqual([frame[:3] for frame in frames],
+                         [(1, b'\x01', 0), (0, b'\x00', 0), (1, b'\x02', 1)])
+        ticks = [frame[3] for frame in frames]
+        self.assertEqual(ticks, sorted(ticks))
+
+    def test_messages_from_both_channels(self):
+        self.manager.add_radio(0, SPI_0_PINS, 0x12345678, 433.2)
+        self.manager.add_radio(1, SPI_1_PINS, 0x12345678, 434.2)
+        senders = []
+        for frequency, source in ((433.2, 0xa), (434.2, 0xb)):
+            radio = SimulatedNrf905(air=self.air, airtime_us=1000)
+            pi = SimulatedPi({0: radio})
+            hardware = Nrf905Hardware(pi)
+            hardware.open()
+            hardware.receive(source)
+            hardware.set_frequency(frequency)
+            senders.append(hardware)
+        senders[0].transmit(bytes(60), address=0x12345678)
+        senders[1].transmit(b'b' * 30, address=0x12345678)
+        messages = {self.manager.get_message(timeout=1)[:3] for _ in range(2)}
+        self.assertEqual(messages, {(0xa, 0, bytes(60)), (0xb, 0, b'b' * 30)})
+        for hardware in senders:
+            hardware.term()
+
+
+if __name__ == '__main__':
+    unittest.main()
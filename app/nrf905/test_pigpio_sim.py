@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+
+import queue
+import sys
+import threading
+import time
+import unittest
+
+from nrf905.nrf905_gpio import Nrf905Gpio
+from nrf905.nrf905_hardware import Nrf905Hardware
+from nrf905.nrf905_spi import CHANNEL_PLAN, Nrf905Spi, frequency_to_channel
+from nrf905.fragments import fragment
+from nrf905 import pigpio_sim
+from nrf905.pigpio_sim import SimulatedAir, SimulatedNrf905, SimulatedPi
+
+
+class TestPigpioSim(unittest.TestCase):
+    """ Runs the driver stack against the simulated pigpio backend.  These
+    tests do not need a Pi or the pigpio daemon.
+    """
+
+    def setUp(self):
+        self.pi = SimulatedPi()
+        self.radio = self.pi.radio(0)
+
+    def tearDown(self):
+        self.pi.stop()
+
+    def test_configuration_register_read_write(self):
+        spi = Nrf905Spi(self.pi, 0)
+        self.assertEqual(spi.configuration_register_read(self.pi), pigpio_sim.DEFAULT_CONFIG)
+        data = spi.configuration_register_create(433.2, 0xDDCCBBAA, 16)
+        spi.configuration_register_write(self.pi, data)
+        self.assertEqual(spi.configuration_register_read(self.pi), data)
+        self.assertEqual(self.radio.rx_address, bytes([0xAA, 0xBB, 0xCC, 0xDD]))
+        spi.close(self.pi)
+
+    def test_configuration_register_cache(self):
+        spi = Nrf905Spi(self.pi, 0)
+        config = spi.configuration_register_read(self.pi)
+        # Reads come from the shadow copy.
+        calls = self.pi.calls
+        self.assertEqual(spi.configuration_register_read(self.pi), config)
+        spi.configuration_register_write(self.pi, config)
+        self.assertEqual(self.pi.calls, calls)
+        # A change to the RX address is one write starting at byte 5.
+        config[5:9] = [1, 2, 3, 4]
+        spi.configuration_register_write(self.pi, config)
+        self.assertEqual(self.pi.calls - calls, 1)
+        self.assertEqual(self.radio.rx_address, bytes([1, 2, 3, 4]))
+        # A channel change is one CHANNEL_CONFIG.
+        spi.set_channel_config(self.pi, 0x1ab, 1, 3)
+        self.assertEqual(self.pi.calls - calls, 2)
+        self.assertEqual(self.radio.config[0], 0xab)
+        self.assertEqual(self.radio.config[1] & 0x0f, 0b1111)
+        spi.set_channel_config(self.pi, 0x1ab, 1, 3)
+        config = spi.configuration_register_read(self.pi)
+        self.assertEqual(self.pi.calls - calls, 2)
+        config[0] = 0x6c
+        spi.configuration_register_write(self.pi, config)
+        self.assertEqual(self.pi.calls - calls, 3)
+        self.assertEqual(spi.configuration_register_read(self.pi, refresh=True), self.radio.config)
+        with self.assertRaises(ValueError):
+            spi.set_channel_config(self.pi, 0x200, 0, 0)
+        spi.close(self.pi)
+
+    def test_transmit_address_read_write(self):
+        spi = Nrf905Spi(self.pi, 0)
+        self.assertEqual(spi.read_transmit_address(self.pi), 0xe7e7e7e7)
+        spi.write_transmit_address(self.pi, 0x12345678)
+        self.assertEqual(spi.read_transmit_address(self.pi), 0x12345678)
+        self.assertEqual(spi.read_transmit_address(self.pi, refresh=True), 0x12345678)
+        calls = self.pi.calls
+        spi.write_transmit_address(self.pi, 0x12345678)
+        self.assertEqual(self.pi.calls, calls)
+        spi.close(self.pi)
+
+    def test_output_pins(self):
+        gpio = Nrf905Gpio(self.pi)
+        gpio.set_mode_standby(self.pi)
+        self.assertEqual(self.radio.mode, 'standby')
+        gpio.set_mode_receive(self.pi)
+        self.assertEqual(self.radio.mode, 'receive')
+        gpio.set_mode_power_down(self.pi)
+        self.assertEqual(self.radio.mode, 'power_down')
+        self.assertEqual(self.pi.read(Nrf905Gpio.POWER_UP), 0)
+
+    def test_mode_calls(self):
+        gpio = Nrf905Gpio(self.pi)
+        for mode, name in [(Nrf905Gpio.SHOCKBURST_TX, 'transmit'),
+                           (Nrf905Gpio.SHOCKBURST_RX, 'receive'),
+                           (Nrf905Gpio.POWER_DOWN, 'power_down'),
+                           (Nrf905Gpio.STANDBY, 'standby')]:
+            calls = self.pi.calls
+            gpio.set_mode(self.pi, mode)
+            self.assertEqual(self.pi.calls - calls, 1)
+            self.assertEqual(self.radio.mode, name)
+            self.assertEqual(gpio.get_mode(), mode)
+        # Setting the current mode again does not touch the pins.
+        calls = self.pi.calls
+        gpio.set_mode_standby(self.pi)
+        self.assertEqual(self.pi.calls, calls)
+        # With the mode unknown, the pins are cleared then set.
+        self.pi.write(Nrf905Gpio.TRANSMIT_ENABLE, 1)
+        gpio.invalidate_mode()
+        gpio.set_mode_receive(self.pi)
+        self.assertEqual(self.pi.calls - calls, 3)
+        self.assertEqual(self.radio.mode, 'receive')
+        self.assertEqual(self.pi.read(Nrf905Gpio.TRANSMIT_ENABLE), 0)
+
+    def test_callback(self):
+        items = queue.Queue()
+        gpio = Nrf905Gpio(self.pi)
+        gpio.set_callback(self.pi, Nrf905Gpio.DATA_READY,
+                          lambda num, level, tick: items.put((num, level)))
+        # The simulated radio drives DR high when a frame arrives.
+        gpio.set_mode_receive(self.pi)
+        self.radio.inject(bytes(32))
+        self.assertEqual(items.get(timeout=1), (Nrf905Gpio.DATA_READY, 1))
+        self.assertTrue(gpio.clear_callback(self.pi, Nrf905Gpio.DATA_READY))
+
+    def test_callback_edge(self):
+        items = queue.Queue()
+        gpio = Nrf905Gpio(self.pi)
+        gpio.set_callback(self.pi, Nrf905Gpio.DATA_READY,
+                          lambda num, level, tick: items.put(level), pigpio_sim.RISING_EDGE)
+        hardware = Nrf905Spi(self.pi, 0)
+        gpio.set_mode_receive(self.pi)
+        for _ in range(3):
+            self.radio.inject(bytes(32))
+            hardware.read_receive_frame(self.pi)
+        self.pi.wait_idle()
+        # DR fell after each read but only the rising edges were delivered.
+        self.assertEqual([items.get_nowait() for _ in range(items.qsize())], [1, 1, 1])
+
+    def test_packet_callback(self):
+        events = []
+        gpio = Nrf905Gpio(self.pi)
+        gpio.set_packet_callback(self.pi, lambda *args: events.append(args),
+                                 [Nrf905Gpio.CARRIER_DETECT, Nrf905Gpio.ADDRESS_MATCHED])
+        self.pi._input_changed(Nrf905Gpio.CARRIER_DETECT, 1)
+        time.sleep(0.002)
+        self.pi._input_changed(Nrf905Gpio.ADDRESS_MATCHED, 1)
+        self.pi._input_changed(Nrf905Gpio.DATA_READY, 1)
+        for pin in Nrf905Gpio.callback_pins:
+            self.pi._input_changed(pin, 0)
+        self.pi.wait_idle()
+        # One call for the packet, timed from the carrier.
+        self.assertEqual(len(events), 1)
+        pin, level, tick, start_tick = events[0]
+        self.assertEqual((pin, level), (Nrf905Gpio.DATA_READY, 1))
+        self.assertGreaterEqual((tick - start_tick) & 0xffffffff, 2000)
+        # An edge too long before DR belongs to something else.
+        self.pi._input_changed(Nrf905Gpio.ADDRESS_MATCHED, 1)
+        time.sleep((Nrf905Gpio.MAX_PACKET_US + 5000) / 1000000)
+        self.pi._input_changed(Nrf905Gpio.DATA_READY, 1)
+        self.pi.wait_idle()
+        pin, level, tick, start_tick = events[1]
+        self.assertEqual(start_tick, tick)
+
+    def test_receive_tick(self):
+        hardware = Nrf905Hardware(self.pi)
+        hardware.open()
+        hardware.receive(0x12345678)
+        before = time.time()
+        self.radio.inject(bytes(32))
+        self.pi.wait_idle()
+        after = time.time()
+        frame = hardware.get_frame()
+        self.assertLessEqual(before - 0.001, hardware.tick_time(frame.tick))
+        self.assertLessEqual(hardware.tick_time(frame.tick), after + 0.001)
+        # Ticks wrap at 32 bits.
+        tick = self.pi.get_current_tick()
+        self.assertAlmostEqual(hardware.tick_time((tick - 10) & 0xffffffff),
+                               hardware.tick_time(tick) - 0.00001, places=6)
+        hardware.term()
+
+    def test_receive(self):
+        hardware = Nrf905Hardware(self.pi)
+        hardware.open()
+        hardware.receive(0x12345678)
+        self.radio.inject(bytes(range(32)))
+        self.pi.wait_idle()
+        self.assertEqual(hardware.get_receive_data(), list(range(32)))
+        self.assertEqual(self.radio.data_ready, 0)
+        # Wrong address is not received.
+        self.radio.inject(bytes(32), address=b'\x01\x02\x03\x04')
+        self.pi.wait_idle()
+        self.assertEqual(hardware.get_receive_data(), [])
+
+    def test_receive_while_transmitting(self):
+        radio = SimulatedNrf905(airtime_us=300)
+        pi = SimulatedPi({0: radio}, round_trip_us=50)
+        hardware = Nrf905Hardware(pi)
+        hardware.open()
+        hardware.receive(0x12345678)
+        stopping = threading.Event()
+
+        def inject():
+            while not stopping.is_set():
+                radio.inject(bytes(32))
+                time.sleep(0.0003)
+
+        # Switch threads as often as possible so a receive callback and
+        # start_transmit interleave.
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        injector = threading.Thread(target=inject)
+        injector.start()
+        try:
+            for index in range(100):
+                time.sleep(0.0001 * (index % 13))
+                hardware.transmit(b'x' * 100, timeout=0.5)
+        finally:
+            stopping.set()
+            injector.join()
+            sys.setswitchinterval(switch_interval)
+        pi.wait_idle()
+        self.assertEqual(radio.frames_sent, 100 * len(list(fragment(b'x' * 100, 0))))
+        self.assertGreater(radio.frames_received, 0)
+        self.assertEqual(radio.mode, 'receive')
+        hardware.term()
+
+    def test_channel_plan(self):
+        self.assertEqual(len(CHANNEL_PLAN), 1024)
+        self.assertEqual(frequency_to_channel(433.2), (433.2, 108, 0))
+        self.assertEqual(frequency_to_channel(927.8), (927.8, 415, 1))
+        with self.assertRaises(ValueError):
+            frequency_to_channel(868.3)
+        self.assertEqual(frequency_to_channel(433.92, nearest=True).frequency_mhz, 433.9)
+        self.assertEqual(frequency_to_channel(868.35, nearest=True).frequency_mhz, 868.4)
+        self.assertEqual(frequency_to_channel(300, nearest=True), (422.4, 0, 0))
+        self.assertEqual(frequency_to_channel(1000, nearest=True), (947.0, 511, 1))
+        for channel in CHANNEL_PLAN:
+            self.assertIs(frequency_to_channel(channel.frequency_mhz), channel)
+
+    def test_scan_band(self):
+        self.radio.carriers = {(115, 0), (300, 0)}
+        hardware = Nrf905Hardware(self.pi)
+        hardware.open()
+        hardware.receive(0x12345678)
+        config = list(self.radio.config)
+        occupancy = hardware.scan_band(dwell=0, samples=2)
+        self.assertEqual(len(occupancy), 512)
+        busy = sorted(channel.frequency_mhz for channel, value in occupancy.items() if value)
+        self.assertEqual(busy, [433.9, 452.4])
+        self.assertEqual(self.radio.config, config)
+        self.assertEqual(self.radio.mode, 'receive')
+        hardware.term()
+
+    def test_air(self):
+        air = SimulatedAir()
+        sender = SimulatedNrf905(air=air)
+        receiver = SimulatedNrf905(air=air)
+        tx_pi = SimulatedPi({0: sender})
+        rx_pi = SimulatedPi({0: receiver})
+        hardware = Nrf905Hardware(rx_pi)
+        hardware.open()
+        hardware.receive(0xe7e7e7e7)
+        spi = Nrf905Spi(tx_pi, 0)
+        tx_pi.spi_write(0, [Nrf905Spi.INSTRUCTION_W_TX_PAYLOAD] + [7] * 32)
+        gpio = Nrf905Gpio(tx_pi)
+        gpio.set_mode_transmit(tx_pi)
+        tx_pi.wait_idle()
+        rx_pi.wait_idle()
+        self.assertEqual(sender.data_ready, 1)
+        self.assertEqual(hardware.get_receive_data(), [7] * 32)
+        spi.close(tx_pi)
+        tx_pi.stop()
+        rx_pi.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,239 @@
+import datetime
+import os
+import threading
+
+from sqlalchemy import Column, Index, MetaData, Table, delete, event, func, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from app import app, db
+from .database import PARTITION_PREFIX
+from .fastschema import ROW_FIELDS
+from .models import Data, DataPartition
+
+# Each partition numbers its rows from YYYYMM * PARTITION_ID_SPAN, so _id
+# stays unique across the data table and all partitions.
+PARTITION_ID_SPAN = 10 ** 10
+
+# Order of the values in the insert parameters of a Data row: a validated
+# row, its posted_at and the packed payload with its layout id.
+INSERT_COLUMNS = ROW_FIELDS + ('posted_at', 'payload', 'layout_id')
+POSTED_AT = INSERT_COLUMNS.index('posted_at')
+
+_metadata = MetaData()
+_tables = {}
+# Partitions known to exist, so the insert path can skip the checks.
+_known = set()
+_lock = threading.Lock()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_partitions(session):
+    # A rollback may have undone the creation of a partition.
+    _known.clear()
+
+
+def partitioning_enabled():
+    return app.config.get('DATA_PARTITIONING', False)
+
+
+def month_start(value):
+    return datetime.datetime(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{PARTITION_PREFIX}{month:%Y%m}'
+
+
+def partition_first_id(name):
+    return int(name[len(PARTITION_PREFIX):]) * PARTITION_ID_SPAN
+
+
+def partition_table(name):
+    """ Returns the Table for a partition.  Partitions have the columns of the
+    data table and indexes of their own (index names are global in SQLite).
+    The foreign keys are left out; SQLite does not enforce them here and the
+    referenced tables live in the models' metadata.
+    """
+    table = _tables.get(name)
+    if table is None:
+        with _lock:
+            table = _tables.get(name)
+            if table is None:
+                columns = [Column(column.name, column.type, primary_key=column.primary_key,
+                                  nullable=column.nullable)
+                           for column in Data.__table__.columns]
+                table = Table(name, _metadata, *columns, sqlite_autoincrement=True)
+                Index(f'ix_{name}_device_id_posted_at', table.c.device_id, table.c.posted_at)
+                Index(f'ix_{name}_posted_at', table.c.posted_at)
+                _tables[name] = table
+    return table
+
+
+def ensure_partition(month):
+    """ Creates the partition for the month if needed, in the current
+    transaction, and returns its Table.  Every statement is a no-op if
+    another process got there first, so two writers starting a month at
+    the same time both succeed.
+    """
+    name = partition_name(month)
+    table = partition_table(name)
+    if name not in _known:
+        connection = db.session.connection()
+        connection.execute(CreateTable(table, if_not_exists=True))
+        for index in table.indexes:
+            connection.execute(CreateIndex(index, if_not_exists=True))
+        # sqlite_sequence has no unique constraint, so INSERT OR IGNORE
+        # would not stop a second seed row.
+        connection.execute(text('INSERT INTO sqlite_sequence (name, seq) SELECT :name, :seq '
+                                'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)'),
+                           {'name': name, 'seq': partition_first_id(name)})
+        db.session.execute(sqlite_insert(DataPartition)
+                           .values(name=name, start=month, finish=add_months(month, 1))
+                           .on_conflict_do_nothing(index_elements=['name']))
+        _known.add(name)
+    return table
+
+
+def insert_data(table, params):
+    """ Inserts params, tuples in INSERT_COLUMNS order, into the data table or
+    a partition with one executemany.  The tuples go to the driver as they
+    are, with only the values whose column type needs it (the JSON data and
+    the posted_at datetime) converted, so no dict is built per row.
+    """
+    if not params:
+        return
+    connection = db.session.connection()
+    processors = [(index, processor) for index, processor
+                  in enumerate(_bind_processors(connection.dialect)) if processor is not None]
+    if processors:
+        converted = []
+        for row in params:
+            row = list(row)
+            for index, processor in processors:
+                row[index] = processor(row[index])
+            converted.append(tuple(row))
+        params = converted
+    connection.exec_driver_sql(
+        f'INSERT INTO {table.name} ({", ".join(INSERT_COLUMNS)}) '
+        f'VALUES ({", ".join("?" * len(INSERT_COLUMNS))})', params)
+
+
+_processors = {}
+
+
+def _bind_processors(dialect):
+    """ Returns the bind processor (or None) of each of INSERT_COLUMNS. """
+    result = _processors.get(dialect.name)
+    if result is None:
+        columns = Data.__table__.columns
+        result = _processors[dialect.name] = [
+            columns[name].type.dialect_impl(dialect).bind_processor(dialect)
+            for name in INSERT_COLUMNS]
+    return result
+
+
+def insert_partitioned(params):
+    """ Inserts the rows (as for insert_data) into the partitions for their
+    posted_at month, one executemany per partition.
+    """
+    by_month = {}
+    for row in params:
+        by_month.setdefault(month_start(row[POSTED_AT]), []).append(row)
+    for month, rows in sorted(by_month.items()):
+        insert_data(ensure_partition(month), rows)
+
+
+def partition_existing_rows():
+    """ Moves the rows of the unpartitioned data table into the partitions
+    for their posted_at month, one transaction per month.  Rows keep their
+    _id, which is below the first id of any partition.
+    Returns {partition name: rows moved}.
+    """
+    data = Data.__table__
+    month_of = func.strftime('%Y-%m-01', data.c.posted_at)
+    months = db.session.scalars(select(month_of).group_by(month_of).order_by(month_of)).all()
+    db.session.commit()
+    moved = {}
+    for month in months:
+        start = datetime.datetime.fromisoformat(month)
+        finish = add_months(start, 1)
+        table = ensure_partition(start)
+        in_month = (data.c.posted_at >= start) & (data.c.posted_at < finish)
+        columns = [column.name for column in data.columns]
+        result = db.session.execute(table.insert().from_select(
+            columns, select(*(data.c[name] for name in columns)).where(in_month)))
+        db.session.execute(delete(data).where(in_month))
+        db.session.commit()
+        moved[table.name] = result.rowcount
+    return moved
+
+
+def data_tables(start, finish):
+    """ Returns every table that can hold rows with start <= posted_at < finish:
+    the unpartitioned data table followed by the overlapping partitions in
+    time order.  start and finish may be None.
+    """
+    tables = [Data.__table__]
+    query = select(DataPartition.name).order_by(DataPartition.start)
+    if start is not None:
+        query = query.where(DataPartition.finish > start)
+    if finish is not None:
+        query = query.where(DataPartition.start < finish)
+    for name in db.session.scalars(query):
+        tables.append(partition_table(name))
+    return tables
+
+
+def expired_partitions(now=None):
+    """ Returns the partitions that are entirely older than the retention
+    period of DATA_RETENTION_MONTHS full months (None keeps everything).
+    """
+    months = app.config.get('DATA_RETENTION_MONTHS')
+    if not months:
+        return []
+    now = now or datetime.datetime.utcnow()
+    cutoff = add_months(month_start(now), -months)
+    query = select(DataPartition).where(DataPartition.finish <= cutoff)
+    return db.session.scalars(query.order_by(DataPartition.start)).all()
+
+
+def archive_partition(name, archive_dir):
+    """ Copies a partition into a SQLite file of its own in archive_dir. """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f'{name}.db')
+    with db.engine.connect() as connection:
+        connection.exec_driver_sql('ATTACH DATABASE ? AS archive', (path,))
+        try:
+            connection.exec_driver_sql(f'DROP TABLE IF EXISTS archive.{name}')
+            connection.exec_driver_sql(f'CREATE TABLE archive.{name} AS SELECT * FROM main.{name}')
+            connection.commit()
+        finally:
+            connection.exec_driver_sql('DETACH DATABASE archive')
+    return path
+
+
+def apply_retention(now=None):
+    """ Drops, or archives and then drops, every expired partition.  Each
+    partition goes with one DROP TABLE rather than a DELETE of its rows.
+    Rows in the unpartitioned data table are not touched and the rollups are
+    kept.  Returns the names of the partitions removed.
+    """
+    action = app.config.get('DATA_RETENTION_ACTION', 'drop')
+    removed = []
+    for partition in expired_partitions(now):
+        name = partition.name
+        if action == 'archive':
+            archive_partition(name, app.config['DATA_ARCHIVE_DIR'])
+        partition_table(name).drop(db.session.connection(), checkfirst=True)
+        db.session.execute(delete(DataPartition).where(DataPartition.name == name))
+        db.session.commit()
+        _known.discard(name)
+        removed.append(name)
+    return removed
@@ -0,0 +1,277 @@
+import json
+import struct
+
+from sqlalchemy import event, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app import db
+from .models import DataLayout
+from .registry import device_registry
+
+try:
+    import numpy
+except ImportError:  # unpack_columns falls back to struct.
+    numpy = None
+
+# struct codes a layout may use, with the Python type each one stores.
+INTEGER_CODES = 'bBhHiIqQ'
+FLOAT_CODES = 'fd'
+# The NumPy type of each code, little endian as the layouts are packed.
+NUMPY_TYPES = {'b': 'i1', 'B': 'u1', 'h': '<i2', 'H': '<u2', 'i': '<i4', 'I': '<u4',
+               'q': '<i8', 'Q': '<u8', 'f': '<f4', 'd': '<f8'}
+
+
+class PayloadLayout:
+    """ A fixed binary layout for the readings of one device type.
+
+    The layout is declared on Devicetype.payload_layout as a list of
+    [name, code] pairs, where code is a struct format code (one of bBhHiIqQfd)
+    or Ns for a string of at most N UTF-8 bytes, for example:
+
+        [["amperage", "H"], ["address", "I"], ["user", "16s"]]
+
+    Values are packed little endian with no padding.  Each packed row keeps
+    the id of its layout in the payload_layouts table (see layout_id), so the
+    layout of a type can be edited without changing how older rows decode.
+    """
+
+    def __init__(self, fields):
+        self.names = []
+        self.codes = []
+        for name, code in fields:
+            if not (code in INTEGER_CODES or code in FLOAT_CODES
+                    or (code.endswith('s') and code[:-1].isdigit())):
+                raise ValueError(f"Unsupported payload field code: {code}")
+            self.names.append(name)
+            self.codes.append(code)
+        self.struct = struct.Struct('<' + ''.join(self.codes))
+        # The layout as stored in payload_layouts.fields.
+        self.definition = json.dumps([[name, code] for name, code in zip(self.names, self.codes)])
+        self.numeric_names = [name for name, code in zip(self.names, self.codes)
+                              if not code.endswith('s')]
+        self.__name_set = set(self.names)
+        self.__column_decoders = {}
+
+    def pack(self, data):
+        """ Returns the packed bytes for a reading, or None if the reading
+        does not fit the layout (other keys, wrong types, out of range or a
+        number a float code cannot store exactly).
+        """
+        if not isinstance(data, dict) or data.keys() != self.__name_set:
+            return None
+        values = []
+        floats = []
+        for index, (name, code) in enumerate(zip(self.names, self.codes)):
+            value = data[name]
+            if isinstance(value, bool):
+                return None
+            if code in INTEGER_CODES:
+                if not isinstance(value, int):
+                    return None
+            elif code in FLOAT_CODES:
+                if not isinstance(value, (int, float)):
+                    return None
+                floats.append(index)
+            else:
+                if not isinstance(value, str) or '\0' in value:
+                    return None
+                value = value.encode('utf-8')
+                if len(value) > int(code[:-1]):
+                    return None
+            values.append(value)
+        try:
+            payload = self.struct.pack(*values)
+        except struct.error:
+            return None
+        if floats:
+            # A float code rounds what it stores; a value that does not come
+            # back unchanged (0.1 as 'f', a large int) stays JSON.
+            unpacked = self.struct.unpack(payload)
+            if any(unpacked[index] != values[index] for index in floats):
+                return None
+        return payload
+
+    def unpack(self, payload):
+        """ Returns the reading dict for packed bytes. """
+        result = {}
+        for name, code, value in zip(self.names, self.codes, self.struct.unpack(payload)):
+            if isinstance(value, bytes):
+                value = value.rstrip(b'\0').decode('utf-8')
+            result[name] = value
+        return result
+
+    def records(self, buffer, stride=None, offset=0):
+        """ Returns the packed bytes of each record in buffer, one record
+        every stride bytes (default the layout size) starting offset bytes
+        into each slot.  A trailing part slot is ignored.
+        """
+        stride, count = self.__slots(buffer, stride, offset)
+        view = memoryview(buffer).cast('B')
+        size = self.struct.size
+        return [bytes(view[start:start + size])
+                for start in range(offset, count * stride, stride)]
+
+    def unpack_columns(self, buffer, stride=None, offset=0):
+        """ Decodes every record in buffer (laid out as for records()) in one
+        pass and returns a dict of field name to column.  Numeric columns are
+        NumPy arrays when NumPy is installed and tuples otherwise; string
+        columns are lists of str.
+        Raises ValueError if a string is not valid UTF-8.
+        """
+        stride, count = self.__slots(buffer, stride, offset)
+        decoder = self.__column_decoder(stride, offset)
+        if numpy is not None:
+            records = numpy.frombuffer(buffer, decoder, count)
+            columns = {name: records[name].copy() for name in self.names}
+        else:
+            view = memoryview(buffer).cast('B')[:count * stride]
+            values = list(zip(*decoder.iter_unpack(view))) or [()] * len(self.names)
+            columns = dict(zip(self.names, values))
+        for name, code in zip(self.names, self.codes):
+            if code.endswith('s'):
+                columns[name] = [bytes(value).rstrip(b'\0').decode('utf-8')
+                                 for value in columns[name]]
+        return columns
+
+    def __slots(self, buffer, stride, offset):
+        """ Returns (stride, number of whole records) for buffer. """
+        if stride is None:
+            stride = self.struct.size
+        if offset < 0 or offset + self.struct.size > stride:
+            raise ValueError("Payload layout does not fit in the record stride.")
+        return stride, memoryview(buffer).nbytes // stride
+
+    def __column_decoder(self, stride, offset):
+        """ Returns the NumPy structured dtype, or without NumPy the Struct,
+        of one record slot.
+        """
+        key = (numpy is not None, stride, offset)
+        decoder = self.__column_decoders.get(key)
+        if decoder is None:
+            if numpy is None:
+                pad = stride - offset - self.struct.size
+                decoder = struct.Struct(f'<{offset}x' + ''.join(self.codes) + f'{pad}x')
+            else:
+                formats = []
+                offsets = []
+                position = offset
+                for code in self.codes:
+                    formats.append('S' + code[:-1] if code.endswith('s') else NUMPY_TYPES[code])
+                    offsets.append(position)
+                    position += struct.calcsize('<' + code)
+                decoder = numpy.dtype({'names': self.names, 'formats': formats,
+                                       'offsets': offsets, 'itemsize': stride})
+            self.__column_decoders[key] = decoder
+        return decoder
+
+
+# Compiled layouts keyed by the layout as stored, so an edited layout is
+# compiled again rather than served stale.
+_layouts = {}
+
+
+def compile_layout(fields):
+    """ Returns the PayloadLayout for a stored layout, or None if there is no
+    layout or it is not valid.
+    """
+    if not fields:
+        return None
+    key = repr(fields)
+    if key not in _layouts:
+        try:
+            _layouts[key] = PayloadLayout(fields)
+        except (TypeError, ValueError):
+            _layouts[key] = None
+    return _layouts[key]
+
+
+def layout_for_device(device_id):
+    """ Returns the PayloadLayout declared by the type of the device, or None
+    if the device, its type or the layout is unknown.
+    """
+    device = device_registry.get_device(device_id)
+    if device is None or device[3] is None:
+        return None
+    try:
+        devicetype = device_registry.get_devicetype(int(device[3]))
+    except ValueError:
+        return None
+    if devicetype is None:
+        return None
+    return compile_layout(devicetype[2])
+
+
+# payload_layouts ids by PayloadLayout.definition, and the layouts by id.
+# The rows never change, but a rollback may undo one just added.
+_layout_ids = {}
+_stored_layouts = {}
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_layout_ids(session):
+    _layout_ids.clear()
+    _stored_layouts.clear()
+
+
+def layout_id(layout):
+    """ Returns the id of the payload_layouts row for a PayloadLayout, adding
+    the row in the current transaction if it is new.
+    """
+    result = _layout_ids.get(layout.definition)
+    if result is None:
+        # Another process may add the same layout at the same time.
+        db.session.execute(sqlite_insert(DataLayout).values(fields=layout.definition)
+                           .on_conflict_do_nothing(index_elements=['fields']))
+        result = db.session.scalar(select(DataLayout._id)
+                                   .where(DataLayout.fields == layout.definition))
+        _layout_ids[layout.definition] = result
+        _stored_layouts[result] = layout
+    return result
+
+
+def stored_layout(layout_id):
+    """ Returns the PayloadLayout with the given payload_layouts id, or None
+    if there is no such row or its layout is not valid.
+    """
+    if layout_id is None:
+        return None
+    layout = _stored_layouts.get(layout_id)
+    if layout is None:
+        fields = db.session.scalar(select(DataLayout.fields).where(DataLayout._id == layout_id))
+        if fields is None:
+            return None
+        layout = _stored_layouts[layout_id] = compile_layout(json.loads(fields))
+    return layout
+
+
+def pack_row(row):
+    """ Returns the insert parameters, in partitions.INSERT_COLUMNS order, for
+    a validated row with its posted_at, (statusmod, data, device_id,
+    posted_at).  Readings that fit the layout of the device type are stored
+    in payload, with data set to None and layout_id to the layout's id;
+    anything else is kept as JSON.
+    """
+    statusmod, data, device_id, posted_at = row
+    layout = layout_for_device(device_id)
+    if layout is not None:
+        payload = layout.pack(data)
+        if payload is not None:
+            return (statusmod, None, device_id, posted_at, payload, layout_id(layout))
+    return (statusmod, data, device_id, posted_at, None, None)
+
+
+def reading_of(data, payload, layout_id):
+    """ Returns the reading of a stored Data row, decoding the payload with
+    the layout it was packed with when the row was stored packed.  A payload
+    that cannot be decoded is returned as {"raw": "<hex>"}.
+    """
+    if payload is None:
+        return data
+    layout = stored_layout(layout_id)
+    if layout is not None and len(payload) == layout.struct.size:
+        try:
+            return layout.unpack(payload)
+        except ValueError:
+            pass
+    return {'raw': payload.hex()}
@@ -0,0 +1,91 @@
+import base64
+import datetime
+
+from sqlalchemy import select, tuple_, union_all
+
+from app import db
+from .models import Data
+from .partitions import data_tables
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def parse_datetime(value, end=False):
+    """ Parses a date or datetime string as sent by the date forms.
+    A plain date (YYYY-MM-DD) used as the end of a range covers the whole day,
+    so it is moved on to midnight of the next day.
+    Raises ValueError if the value cannot be parsed.
+    """
+    result = datetime.datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        result += datetime.timedelta(days=1)
+    return result
+
+
+def encode_cursor(posted_at, row_id):
+    """ Returns an opaque cursor for the position after the given row. """
+    raw = f'{posted_at.isoformat()}|{row_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    """ Returns (posted_at, _id) from a cursor made by encode_cursor.
+    Raises ValueError if the cursor is not valid.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        posted_at, row_id = raw.split('|')
+        return datetime.datetime.fromisoformat(posted_at), int(row_id)
+    except (UnicodeDecodeError, ValueError, TypeError) as err:
+        raise ValueError(f'Invalid cursor: {cursor}') from err
+
+
+def page_size(value):
+    """ Clamps a requested page size to 1..MAX_PAGE_SIZE. """
+    if value is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(int(value), MAX_PAGE_SIZE))
+
+
+def source_range_query(table, start, finish, device_id=None):
+    """ Returns a select of the rows of one data table (the data table or a
+    partition) with start <= posted_at < finish ordered by (posted_at, _id).
+    A start or finish of None leaves that end open.
+    """
+    query = select(table)
+    if start is not None:
+        query = query.where(table.c.posted_at >= start)
+    if finish is not None:
+        query = query.where(table.c.posted_at < finish)
+    if device_id is not None:
+        query = query.where(table.c.device_id == device_id)
+    return query.order_by(table.c.posted_at, table.c._id)
+
+
+def data_range_page(start, finish, device_id=None, cursor=None, limit=None):
+    """ Returns (rows, next_cursor) for one page of the date range, ordered by
+    (posted_at, _id).  Only the partitions overlapping the range are read,
+    each with its own keyset index seek and limit, and the branches are
+    merged.  rows are transient Data objects.
+    next_cursor is None when there are no more rows.
+    """
+    limit = page_size(limit)
+    after = decode_cursor(cursor) if cursor else None
+    branches = []
+    for table in data_tables(start, finish):
+        query = source_range_query(table, start, finish, device_id)
+        if after is not None:
+            query = query.where(tuple_(table.c.posted_at, table.c._id) > tuple_(*after))
+        branches.append(select(query.limit(limit + 1).subquery()))
+    merged = union_all(*branches).subquery()
+    query = select(merged).order_by(merged.c.posted_at, merged.c._id)
+    results = db.session.execute(query.limit(limit + 1)).mappings().all()
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        last = results[-1]
+        next_cursor = encode_cursor(last['posted_at'], last['_id'])
+    columns = [column.key for column in Data.__table__.columns]
+    rows = [Data(**{key: result[key] for key in columns}) for result in results]
+    return rows, next_cursor
@@ -0,0 +1,349 @@
+""" Long running service that stores what the nRF905 receives.
+
+The service owns the radio and shares nothing with the web process but the
+database: the web tier never opens the SPI bus, and reception never waits
+on a request.  Run it next to the web app with
+
+    python -m app.radio_ingest --address 0x12345678 --frequency 433.2
+
+Two threads do the work.  The receive thread takes complete messages from
+the radio, drops repeats and queues the rest with the time they arrived
+(from the pigpio tick of the packet, see Nrf905Gpio.set_packet_callback);
+it never blocks on the database, so when the queue is full messages are
+dropped and counted.  A repeat is a message with the same source and data
+as one received in the last dedup_ttl seconds, whatever its message id, as
+senders often send each reading several times.  The queue is a
+WriteBehindBuffer (writebehind.py), whose writer thread decodes queued
+messages into Data rows and inserts them in batches, one transaction per
+batch.
+
+A message's source (the sender's RX address, see nrf905/fragments.py) is
+looked up in the devices table.  An unknown address makes the device
+registry reload, at most every unknown_reload_seconds, so a device added
+through the web app is picked up without waiting for its ttl; messages
+from addresses still unknown are counted and dropped.  Messages the size
+of the payload layout of the device type are stored packed as received,
+decoded a batch at a time for the rollups (see ingest.insert_packed).
+Other messages are decoded as a JSON object, or else kept as
+{"raw": "<hex>"}.
+
+Health is reported on a Unix socket: each connection gets one JSON object
+of counters and is closed.  `python -m app.radio_ingest --health` prints it
+and exits non-zero unless the status is "ok".  The radio stack's metrics
+(nrf905/metrics.py) are served the same way, in the Prometheus text format,
+on a second socket that the web app's /metrics reads (see
+monitoring.render_metrics).
+"""
+
+import argparse
+import datetime
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from app import app
+from .ingest import insert_packed, insert_rows
+from .nrf905.dedup import DedupCache
+from .payloads import layout_for_device
+from .registry import device_registry
+from .writebehind import BufferFull, WriteBehindBuffer
+
+# The radio stack imports itself as the top level package nrf905.
+_app_dir = os.path.dirname(os.path.abspath(__file__))
+if _app_dir not in sys.path:
+    sys.path.append(_app_dir)
+
+
+def decode_reading(data, layout):
+    """ Returns the reading dict for the data of a message.  layout is the
+    PayloadLayout of the sender's device type, or None.
+    """
+    if layout is not None and len(data) == layout.struct.size:
+        try:
+            return layout.unpack(data)
+        except ValueError:
+            pass
+    try:
+        reading = json.loads(data)
+    except ValueError:
+        reading = None
+    if isinstance(reading, dict):
+        return reading
+    return {'raw': data.hex()}
+
+
+class RadioIngestService:
+    """ Receives messages from an Nrf905Hardware and writes them as Data rows.
+
+    A batch is written when batch_rows messages are waiting or
+    batch_interval_ms has passed since the first of them arrived, whichever
+    comes first.  queue_size bounds the messages waiting to be written.
+    dedup_ttl and dedup_entries size the cache of recent messages used to
+    drop repeats (see nrf905/dedup.py).  health_socket and metrics_socket
+    are the paths of the Unix sockets to serve stats() and radio_metrics()
+    on, or None for none.  unknown_reload_seconds limits how often a
+    message from an unknown address reloads the device registry.
+    """
+
+    def __init__(self, flask_app, hardware, address, frequency_mhz=None,
+                 batch_rows=500, batch_interval_ms=200, queue_size=10000,
+                 health_socket=None, dedup_ttl=2.0, dedup_entries=4096,
+                 metrics_socket=None, unknown_reload_seconds=5.0):
+        self.__app = flask_app
+        self.__hardware = hardware
+        self.__address = address
+        self.__frequency_mhz = frequency_mhz
+        self.__buffer = WriteBehindBuffer(flask_app, batch_rows, batch_interval_ms, queue_size,
+                                          write=self.__write, name='radio-ingest-write')
+        self.__dedup = DedupCache(dedup_ttl, dedup_entries)
+        self.__health_socket = health_socket
+        self.__metrics_socket = metrics_socket
+        self.__unknown_reload_seconds = unknown_reload_seconds
+        # (server socket, path) of each socket served.
+        self.__servers = []
+        self.__threads = []
+        self.__receiving = threading.Event()
+        self.__stopping = threading.Event()
+        self.__started_at = None
+        # Counters.  Each is only updated by one thread.
+        self.__received = 0
+        self.__unknown = 0
+        self.__last_message_at = None
+
+    def start(self):
+        """ Opens the radio, starts receiving and starts the threads. """
+        self.__started_at = time.monotonic()
+        self.__hardware.open()
+        if self.__frequency_mhz is not None:
+            self.__hardware.set_frequency(self.__frequency_mhz)
+        self.__hardware.receive(self.__address)
+        self.__receiving.set()
+        self.__buffer.start()
+        self.__start_thread(self.__receive_loop, 'radio-ingest-receive')
+        if self.__health_socket is not None:
+            self.__serve(self.__health_socket, 'radio-ingest-health',
+                         lambda: json.dumps(self.stats()).encode() + b'\n')
+        if self.__metrics_socket is not None:
+            self.__serve(self.__metrics_socket, 'radio-ingest-metrics',
+                         lambda: radio_metrics().encode())
+
+    def stop(self, timeout=None):
+        """ Stops receiving, writes what is queued and releases the radio. """
+        self.__receiving.clear()
+        self.__stopping.set()
+        for thread in self.__threads:
+            thread.join(timeout)
+        self.__threads = []
+        self.__buffer.stop(timeout)
+        self.__hardware.term()
+        for server, path in self.__servers:
+            server.close()
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        self.__servers = []
+
+    def stats(self):
+        """ Returns a dict of the service counters and its status: "ok", or
+        "failing" when a thread has died or the last batch failed.
+        failed_rows counts every message of a failed batch.
+        """
+        buffer = self.__buffer.stats()
+        alive = (bool(self.__threads) and all(thread.is_alive() for thread in self.__threads)
+                 and buffer['writer_alive'])
+        now = time.monotonic()
+        return {
+            'status': 'ok' if alive and not buffer['last_flush_failed'] else 'failing',
+            'uptime_seconds': round(now - self.__started_at, 3) if self.__started_at else 0.0,
+            'received_messages': self.__received,
+            'duplicate_messages': self.__dedup.hits,
+            'dropped_messages': buffer['rejected_rows'],
+            'unknown_device_messages': self.__unknown,
+            'queue_depth': buffer['queue_depth'],
+            'queue_size': buffer['queue_size'],
+            'batches': buffer['flushes'],
+            'written_rows': buffer['flushed_rows'],
+            'failed_rows': buffer['failed_rows'],
+            'last_batch_seconds': buffer['last_flush_seconds'],
+            'seconds_since_last_message': (round(now - self.__last_message_at, 3)
+                                           if self.__last_message_at else None),
+            'radio_overflows': self.__hardware.get_receive_overflows(),
+            'reassembly_evicted': self.__hardware.reassembler.evicted,
+            'reassembly_dropped': self.__hardware.reassembler.dropped,
+        }
+
+    def __start_thread(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self.__threads.append(thread)
+
+    def __receive_loop(self):
+        while self.__receiving.is_set():
+            message = self.__hardware.get_message(timeout=0.1)
+            if message is None:
+                continue
+            self.__received += 1
+            self.__last_message_at = time.monotonic()
+            if self.__dedup.seen((message.source, hash(message.data)), self.__last_message_at):
+                continue
+            # The message carries the pigpio tick of its first frame, so
+            # posted_at is when it came off the air, not when it got here.
+            if message.tick is None:
+                received_at = datetime.datetime.utcnow()
+            else:
+                received_at = datetime.datetime.utcfromtimestamp(
+                    self.__hardware.tick_time(message.tick))
+            try:
+                self.__buffer.put((message.source, message.data, received_at), timeout=0)
+            except BufferFull:
+                pass
+
+    def __write(self, items):
+        """ Writes a batch of queued (source, data, posted_at) messages.  Runs
+        on the buffer's writer thread, which rolls back and counts the batch
+        as failed if this raises.  Returns the number of rows written.
+        """
+        rows = []
+        # Messages that fit their device's payload layout, per device, are
+        # stored packed as received and decoded a batch at a time.
+        packed = {}
+        for item in items:
+            source, data, posted_at = item
+            device = device_registry.get_device_by_address(source)
+            if device is None:
+                device_registry.refresh(self.__unknown_reload_seconds)
+                device = device_registry.get_device_by_address(source)
+            if device is None:
+                self.__unknown += 1
+                continue
+            layout = layout_for_device(device[0])
+            if layout is not None and len(data) == layout.struct.size:
+                packed.setdefault(device[0], (layout, []))[1].append(item)
+            else:
+                rows.append((None, decode_reading(data, layout), device[0], posted_at))
+        written = 0
+        for device_id, (layout, group) in packed.items():
+            buffer = b''.join(data for _source, data, _posted_at in group)
+            try:
+                written += insert_packed(device_id, layout, buffer,
+                                         [posted_at for _source, _data, posted_at in group])
+            except ValueError:
+                rows.extend((None, decode_reading(data, None), device_id, posted_at)
+                            for _source, data, posted_at in group)
+        return written + insert_rows(rows)
+
+    def __serve(self, path, name, body):
+        """ Listens on a Unix socket at path and starts a thread that sends
+        body() to each connection and closes it.
+        """
+        # A socket left behind by a previous run would make bind fail.
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        server.listen()
+        server.settimeout(0.5)
+        self.__servers.append((server, path))
+        self.__start_thread(lambda: self.__serve_loop(server, body), name)
+
+    def __serve_loop(self, server, body):
+        while not self.__stopping.is_set():
+            try:
+                connection, _ = server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            with connection:
+                try:
+                    connection.sendall(body())
+                except OSError:
+                    pass
+
+
+def radio_metrics():
+    """ Returns the metrics of the radio stack, imported under its own top
+    level name (nrf905.*), in the Prometheus text format, or '' if it is not
+    loaded in this process.
+    """
+    module = sys.modules.get('nrf905.metrics')
+    return module.REGISTRY.render() if module is not None else ''
+
+
+def read_socket(path, timeout=1.0):
+    """ Returns all that the service sends on one connection to the Unix
+    socket at path.  Raises OSError if it is not reachable.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(path)
+        chunks = []
+        while True:
+            chunk = client.recv(4096)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def read_health(path, timeout=1.0):
+    """ Returns the stats dict served on the health socket at path. """
+    return json.loads(read_socket(path, timeout))
+
+
+def main(argv=None):
+    config = app.config
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--spi-bus', type=int, default=config.get('RADIO_SPI_BUS', 0))
+    parser.add_argument('--address', type=lambda text: int(text, 0),
+                        default=config.get('RADIO_ADDRESS', 0xe7e7e7e7),
+                        help='our RX address, e.g. 0x12345678')
+    parser.add_argument('--frequency', type=float,
+                        default=config.get('RADIO_FREQUENCY_MHZ'), help='MHz')
+    parser.add_argument('--health-socket', default=config.get('RADIO_INGEST_HEALTH_SOCKET'))
+    parser.add_argument('--metrics-socket', default=config.get('RADIO_INGEST_METRICS_SOCKET'))
+    parser.add_argument('--health', action='store_true',
+                        help='print the health of the running service and exit')
+    args = parser.parse_args(argv)
+
+    if args.health:
+        try:
+            stats = read_health(args.health_socket)
+        except OSError as err:
+            print(f'radio ingest not reachable on {args.health_socket}: {err}')
+            return 1
+        print(json.dumps(stats, indent=2))
+        return 0 if stats['status'] == 'ok' else 1
+
+    from nrf905.nrf905_hardware import Nrf905Hardware
+    service = RadioIngestService(
+        app, Nrf905Hardware(spi_bus=args.spi_bus), args.address, args.frequency,
+        batch_rows=config.get('RADIO_INGEST_BATCH_ROWS', 500),
+        batch_interval_ms=config.get('RADIO_INGEST_BATCH_INTERVAL_MS', 200),
+        queue_size=config.get('RADIO_INGEST_QUEUE_SIZE', 10000),
+        health_socket=args.health_socket,
+        dedup_ttl=config.get('RADIO_INGEST_DEDUP_SECONDS', 2.0),
+        dedup_entries=config.get('RADIO_INGEST_DEDUP_ENTRIES', 4096),
+        metrics_socket=args.metrics_socket,
+        unknown_reload_seconds=config.get('RADIO_INGEST_UNKNOWN_RELOAD_SECONDS', 5.0))
+    stopped = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stopped.set())
+    service.start()
+    stopped.wait()
+    service.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+import collections
+import hashlib
+import json
+import threading
+import time
+
+from sqlalchemy import event, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+from app import app, db
+from .models import Device, Devicetype
+
+
+_Snapshot = collections.namedtuple('_Snapshot', [
+    'loaded_at', 'generation', 'devices', 'devices_by_address', 'devicetypes',
+    'device_bodies', 'list_body'])
+
+
+class DeviceRegistry:
+    """ In-memory copy of the devices and types_of_devices tables.
+
+    The tables hardly ever change, so they are loaded once and served from
+    memory until the devices or types_of_devices table is written by this
+    process, through the ORM or a Core insert, update or delete, and the
+    write is committed (or the optional ttl in seconds runs out, which
+    covers writes made by other processes and raw SQL).  The JSON bodies
+    and their ETags are built at load time so a request only has to look
+    them up.
+
+    A load builds a new snapshot and then publishes it in one assignment,
+    so readers see either the old tables or the new ones, never a part
+    load.  invalidate() moves the generation on; a snapshot loaded at an
+    older generation is stale, which covers a write during the load.
+    """
+
+    def __init__(self, ttl=None):
+        self.__ttl = ttl
+        self.__lock = threading.Lock()
+        self.__generation_lock = threading.Lock()
+        self.__generation = 0
+        self.__snapshot = None
+
+    def invalidate(self):
+        with self.__generation_lock:
+            self.__generation += 1
+
+    def refresh(self, min_age):
+        """ Reloads now unless the tables were loaded less than min_age
+        seconds ago.  For callers that found an id or address missing and
+        cannot wait for the ttl, without reloading on every miss.
+        """
+        with self.__lock:
+            snapshot = self.__snapshot
+            if snapshot is None or time.monotonic() - snapshot.loaded_at >= min_age:
+                self.__load()
+
+    def __is_stale(self, snapshot):
+        if snapshot is None or snapshot.generation != self.__generation:
+            return True
+        return self.__ttl is not None and time.monotonic() - snapshot.loaded_at > self.__ttl
+
+    def __current(self):
+        """ Returns the snapshot, loading the tables first if it is stale. """
+        snapshot = self.__snapshot
+        if self.__is_stale(snapshot):
+            with self.__lock:
+                snapshot = self.__snapshot
+                if self.__is_stale(snapshot):
+                    snapshot = self.__load()
+        return snapshot
+
+    def __load(self):
+        # Taken before reading, so a write during the load leaves the
+        # snapshot stale.
+        generation = self.__generation
+        loaded_at = time.monotonic()
+        devices = [tuple(row) for row in db.session.execute(select(Device.__table__)).all()]
+        devicetypes = [tuple(row) for row in db.session.execute(select(Devicetype.__table__)).all()]
+        snapshot = _Snapshot(
+            loaded_at=loaded_at,
+            generation=generation,
+            devices={row[0]: row for row in devices},
+            devices_by_address={row[1]: row for row in devices},
+            devicetypes={row[0]: row for row in devicetypes},
+            device_bodies={row[0]: self.__body([row]) for row in devices},
+            list_body=self.__body(devices),
+        )
+        self.__snapshot = snapshot
+        return snapshot
+
+    @staticmethod
+    def __body(rows):
+        """ Returns (json bytes, etag) for a list of rows. """
+        body = json.dumps(rows).encode()
+        return body, hashlib.sha1(body).hexdigest()
+
+    def devices_body(self):
+        """ Returns (json bytes, etag) of the full device list. """
+        return self.__current().list_body
+
+    def device_body(self, device_id):
+        """ Returns (json bytes, etag) for one device.  An unknown id gives an
+        empty list, as the database query did.
+        """
+        return self.__current().device_bodies.get(device_id) or self.__body([])
+
+    def get_device(self, device_id):
+        """ Returns the devices row for the id, or None. """
+        return self.__current().devices.get(device_id)
+
+    def get_device_by_address(self, address):
+        """ Returns the devices row for a radio address, or None. """
+        return self.__current().devices_by_address.get(address)
+
+    def get_devicetype(self, devicetype_id):
+        """ Returns the types_of_devices row for the id, or None. """
+        return self.__current().devicetypes.get(devicetype_id)
+
+
+device_registry = DeviceRegistry(app.config.get('DEVICE_REGISTRY_TTL'))
+
+_REGISTRY_TABLES = frozenset((Device.__tablename__, Devicetype.__tablename__))
+# Set by a connection commit that wrote the registry tables, for the
+# after_commit of the session on the same thread.
+_committed = threading.local()
+
+
+@event.listens_for(Engine, 'after_execute')
+def _note_registry_write(conn, clauseelement, multiparams, params, execution_options, result):
+    # Catches ORM flushes and Core insert(), update() and delete() alike.
+    # The cache is cleared now and again once the transaction ends, as a
+    # reload in between would read the rows as they were before the write.
+    if isinstance(clauseelement, UpdateBase) and clauseelement.table.name in _REGISTRY_TABLES:
+        conn.info['device_registry_written'] = True
+        device_registry.invalidate()
+
+
+@event.listens_for(Engine, 'commit')
+def _commit_registry_write(conn):
+    if conn.info.pop('device_registry_written', False):
+        device_registry.invalidate()
+        _committed.pending = True
+
+
+@event.listens_for(Engine, 'rollback')
+def _rollback_registry_write(conn):
+    if conn.info.pop('device_registry_written', False):
+        device_registry.invalidate()
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_registry_commit(session):
+    # The Engine commit event fires just before the COMMIT is sent; this
+    # one fires after it, when a reload sees the new rows.
+    if getattr(_committed, 'pending', False):
+        _committed.pending = False
+        device_registry.invalidate()
@@ -0,0 +1,225 @@
+import datetime
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app import db
+from .models import Rollup
+
+MINUTE = 60
+HOUR = 60 * 60
+DAY = 24 * 60 * 60
+# Finest first.
+RESOLUTIONS = [MINUTE, HOUR, DAY]
+RESOLUTION_NAMES = {'minute': MINUTE, 'hour': HOUR, 'day': DAY}
+# Fewest buckets a range should give when choose_resolution picks for it.
+MIN_POINTS = 24
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def bucket_start(posted_at, resolution):
+    """ Returns the start of the bucket of the given resolution holding
+    posted_at.
+    """
+    seconds = int((posted_at - EPOCH).total_seconds())
+    return EPOCH + datetime.timedelta(seconds=seconds - seconds % resolution)
+
+
+def numeric_fields(data):
+    """ Yields (name, value) for the numeric values of a reading.  Booleans
+    and nested values are skipped.
+    """
+    if isinstance(data, dict):
+        for name, value in data.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield name, value
+
+
+def aggregate_rows(rows):
+    """ Returns a dict keyed by (resolution, device_id, field, bucket) holding
+    [count, sum, min, max] for the given Data rows, tuples of (statusmod,
+    data, device_id, posted_at) as passed to ingest.insert_rows.
+    """
+    result = {}
+    for _statusmod, data, device_id, posted_at in rows:
+        if device_id is None:
+            continue
+        fields = list(numeric_fields(data))
+        if not fields:
+            continue
+        for resolution in RESOLUTIONS:
+            bucket = bucket_start(posted_at, resolution)
+            for name, value in fields:
+                key = (resolution, device_id, name, bucket)
+                entry = result.get(key)
+                if entry is None:
+                    result[key] = [1, value, value, value]
+                else:
+                    entry[0] += 1
+                    entry[1] += value
+                    if value < entry[2]:
+                        entry[2] = value
+                    if value > entry[3]:
+                        entry[3] = value
+    return result
+
+
+def aggregate_columns(device_id, posted_at, columns):
+    """ As aggregate_rows, for readings of one device given as numeric
+    columns (see payloads.PayloadLayout.unpack_columns) with posted_at a
+    datetime for all of them or a list with one per reading.  Each run of
+    readings in the same bucket is reduced with one sum, min and max per
+    column.
+    """
+    result = {}
+    count = len(next(iter(columns.values()), ()))
+    if not count:
+        return result
+    if isinstance(posted_at, datetime.datetime):
+        seconds = [int((posted_at - EPOCH).total_seconds())]
+    else:
+        seconds = [int((value - EPOCH).total_seconds()) for value in posted_at]
+    for resolution in RESOLUTIONS:
+        if len(seconds) == 1:
+            ends = [count]
+        else:
+            ends = [index for index in range(1, count)
+                    if seconds[index] // resolution != seconds[index - 1] // resolution]
+            ends.append(count)
+        start = 0
+        for end in ends:
+            first = seconds[min(start, len(seconds) - 1)]
+            bucket = EPOCH + datetime.timedelta(seconds=first - first % resolution)
+            for name, column in columns.items():
+                total, low, high = _reduce(column[start:end])
+                key = (resolution, device_id, name, bucket)
+                entry = result.get(key)
+                if entry is None:
+                    result[key] = [end - start, total, low, high]
+                else:
+                    entry[0] += end - start
+                    entry[1] += total
+                    entry[2] = min(entry[2], low)
+                    entry[3] = max(entry[3], high)
+            start = end
+    return result
+
+
+def _reduce(values):
+    """ Returns (sum, min, max) of a non-empty column slice. """
+    if hasattr(values, 'dtype'):
+        # NumPy: sum in float64 so small float and int types cannot overflow.
+        return values.sum(dtype='f8').item(), values.min().item(), values.max().item()
+    return sum(values), min(values), max(values)
+
+
+def update_rollups(rows):
+    """ Merges the given Data rows into the rollup tables.  Runs in the
+    caller's transaction so the rollups are committed with the rows.
+    """
+    merge_rollups(aggregate_rows(rows))
+
+
+def merge_rollups(aggregates):
+    """ Adds aggregates as returned by aggregate_rows to the rollup tables. """
+    if not aggregates:
+        return
+    values = [
+        {'resolution': resolution, 'device_id': device_id, 'field': name,
+         'bucket': bucket, 'count': count, 'sum': total, 'min': low, 'max': high}
+        for (resolution, device_id, name, bucket), (count, total, low, high)
+        in aggregates.items()
+    ]
+    statement = sqlite_insert(Rollup)
+    statement = statement.on_conflict_do_update(
+        index_elements=['resolution', 'device_id', 'field', 'bucket'],
+        set_={
+            'count': Rollup.count + statement.excluded['count'],
+            'sum': Rollup.sum + statement.excluded['sum'],
+            'min': func.min(Rollup.min, statement.excluded['min']),
+            'max': func.max(Rollup.max, statement.excluded['max']),
+        })
+    db.session.execute(statement, values)
+
+
+def rebuild_rollups(batches):
+    """ Recomputes all rollups from batches of Data rows as produced by
+    export.iter_data_batches.  Commits once at the end.
+    """
+    db.session.execute(delete(Rollup))
+    for rows in batches:
+        update_rollups([(statusmod, data, device_id, posted_at)
+                        for _id, statusmod, data, posted_at, device_id in rows])
+    db.session.commit()
+
+
+def choose_resolution(start, finish):
+    """ Returns the coarsest resolution that still gives MIN_POINTS buckets
+    over the range, or MINUTE for ranges too short for that.
+    """
+    span = (finish - start).total_seconds()
+    result = MINUTE
+    for resolution in RESOLUTIONS:
+        if span >= resolution * MIN_POINTS:
+            result = resolution
+    return result
+
+
+def rollup_series(device_id, field, start, finish, resolution=None):
+    """ Returns (resolution, rows) for one field of one device, one row per
+    non-empty bucket in [start, finish).  The rollups hold whole minutes, so
+    the range is narrowed to the whole minutes inside it: start is rounded
+    up and finish down.  The whole buckets of the chosen resolution come
+    from its rollups; a partial bucket at either end is added up from the
+    finer rollups and reported as one bucket starting at the start of the
+    part covered.
+    """
+    if resolution is None:
+        resolution = choose_resolution(start, finish)
+    if bucket_start(start, MINUTE) != start:
+        start = bucket_start(start, MINUTE) + datetime.timedelta(seconds=MINUTE)
+    finish = bucket_start(finish, MINUTE)
+    if start >= finish:
+        return resolution, []
+    return resolution, _series(device_id, field, start, finish, resolution)
+
+
+def _series(device_id, field, start, finish, resolution):
+    """ Rows of the given resolution for [start, finish), both on minute
+    boundaries, with the partial buckets at the ends merged from finer ones.
+    """
+    first = bucket_start(start, resolution)
+    if first != start:
+        first += datetime.timedelta(seconds=resolution)
+    last = bucket_start(finish, resolution)
+    if first >= last:
+        # Not one whole bucket: all of it comes from the finer rollups.
+        return _merged(device_id, field, start, finish, resolution)
+    query = select(Rollup).where(
+        Rollup.resolution == resolution,
+        Rollup.device_id == device_id,
+        Rollup.field == field,
+        Rollup.bucket >= first,
+        Rollup.bucket < last,
+    ).order_by(Rollup.bucket)
+    rows = db.session.scalars(query).all()
+    return (_merged(device_id, field, start, first, resolution) + rows
+            + _merged(device_id, field, last, finish, resolution))
+
+
+def _merged(device_id, field, start, finish, resolution):
+    """ Returns [] or a list of one Rollup of the given resolution adding up
+    the finer rollups of [start, finish).
+    """
+    if start >= finish:
+        return []
+    finer = RESOLUTIONS[RESOLUTIONS.index(resolution) - 1]
+    parts = _series(device_id, field, start, finish, finer)
+    if not parts:
+        return []
+    return [Rollup(resolution=resolution, device_id=device_id, field=field, bucket=start,
+                   count=sum(part.count for part in parts),
+                   sum=sum(part.sum for part in parts),
+                   min=min(part.min for part in parts),
+                   max=max(part.max for part in parts))]
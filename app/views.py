@@ -1,17 +1,25 @@
 from app import app
-from flask import request, redirect,  url_for, session, jsonify, render_template
-from .models import db, DataSchema, DateForm
-#from .nrf905.nrf905 import Nrf905
+from flask import request, redirect,  url_for, session, jsonify, render_template, Response, stream_with_context
+from .models import DateForm
+from .fastschema import dump_rows
+from .ingest import IngestError, parse_records, ingest_records, validate_records
+from .queries import parse_datetime, data_range_page
+from .export import iter_data_batches, ndjson_lines, csv_lines, table_rows_json
+from .registry import device_registry
+from .writebehind import write_behind
+from .partitions import apply_retention, partition_existing_rows
+from .rollups import RESOLUTION_NAMES, rebuild_rollups, rollup_series
+from .monitoring import render_metrics
 import datetime
-import sqlite3
 import json
 
 
  
 @app.route('/add_new_data', methods=['POST', 'GET'])
 def add_new_data():
-    #receiver = Nrf905()
-    #data = receiver.open(433)
+    """ Stores a fixed sample record.  Radio data does not come through the
+    web app; it is written by the radio ingest service (radio_ingest.py).
+    """
     datadev = {
         'statusmod':'ON',
         'data': {
@@ -21,33 +29,81 @@ def add_new_data():
         },
         'device_id':1
     }
-    schema = DataSchema()
-    result = schema.load(datadev)
-    #receiver.close()
-    db.session.add(result)
-    db.session.commit()
+    ingest_records([datadev])
     return 'Data is succesfully commited!'
 
+@app.route('/add_new_data/batch', methods=['POST'])
+def add_new_data_batch():
+    """ Stores a JSON array or NDJSON body of Data records with one commit
+    for the whole batch.
+    """
+    try:
+        records = parse_records(request.get_data(), request.mimetype)
+    except IngestError as err:
+        return jsonify({'error': str(err)}), 400
+    return jsonify(ingest_records(records))
+
+@app.route('/add_new_data/buffered', methods=['POST'])
+def add_new_data_buffered():
+    """ Validates a JSON array or NDJSON body of Data records and hands the
+    valid ones to the write-behind buffer without waiting for the commit.
+    Answers 202, or 503 with Retry-After if the buffer is full or stopped.
+    202 means queued, not stored: rows still queued when the process is
+    killed are lost, and a flush that fails twice is not stored either but
+    written to WRITE_BEHIND_DEAD_LETTER_FILE (and counted in failed_rows
+    at /add_new_data/buffer) for loading again by hand.
+    """
+    try:
+        records = parse_records(request.get_data(), request.mimetype)
+    except IngestError as err:
+        return jsonify({'error': str(err)}), 400
+    rows, errors = validate_records(records)
+    now = datetime.datetime.utcnow()
+    try:
+        queued = write_behind.put_many([row + (now,) for row in rows])
+    except RuntimeError as err:
+        # Stopped, as during shutdown.
+        return jsonify({'error': str(err)}), 503, {'Retry-After': '1'}
+    body = {'received': len(records), 'queued': queued, 'errors': errors}
+    if queued < len(rows):
+        return jsonify(body), 503, {'Retry-After': '1'}
+    return jsonify(body), 202
+
+
+@app.route('/add_new_data/buffer', methods=['GET'])
+def get_write_behind_stats():
+    return jsonify(write_behind.stats())
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """ Request, database, write-behind and (if running here) radio metrics
+    in the Prometheus text format.
+    """
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/devicelist', methods=['GET'])
 def get_devicelist():
-    conn = sqlite3.connect('instance/DataDevices.db')
-    curs = conn.cursor()
-    curs.execute('select * from devices')
-    result = curs.fetchall()
-    curs.close()
-    conn.close()
-    return jsonify(result)
+    return registry_response(*device_registry.devices_body())
 
 @app.route('/get_data_by_postdate')
 def get_data_by_postdate():
-    conn = sqlite3.connect('instance/DataDevices.db')
-    curs = conn.cursor()
-    curs.execute('SELECT * FROM data')
-                 #WHERE :posted_at_finish > posted_at > :posted_at_start', {'posted_at_finish': posted_at_finish, 'posted_at_start': posted_at_start})
-    result = curs.fetchall()
-    curs.close()
-    conn.close()
-    return result
+    """ Returns one page of Data rows posted between the 'start' and 'finish'
+    query arguments.  Optional arguments: device_id, limit and cursor (the
+    'next' value of the previous page).  Without a range every row is
+    returned as before, as a JSON array of [_id, statusmod, data, posted_at,
+    device_id] lists.
+    """
+    if 'start' not in request.args or 'finish' not in request.args:
+        batches = iter_data_batches(None, None,
+                                    batch_size=app.config.get('EXPORT_BATCH_SIZE', 1000))
+        return Response(stream_with_context(table_rows_json(batches)),
+                        mimetype='application/json')
+    return data_range_response(request.args['start'], request.args['finish'])
+
+
+@app.route('/get_data_by_postdate/form')
+def get_data_by_postdate_form():
+    return render_template('data_by_postdate.html')
 
 
 @app.route('/verify', methods=['POST'])
@@ -58,26 +114,106 @@ def verify():
 
 @app.route('/get_data_by_postdate/result/<posted_at_start>/<posted_at_finish>', methods=['GET', 'POST'])
 def result(posted_at_start, posted_at_finish):
-    conn = sqlite3.connect('instance/DataDevices.db')
-    curs = conn.cursor()
-    curs.execute('SELECT * FROM data')
-                 #WHERE :posted_at_finish > posted_at > :posted_at_start', {'posted_at_finish': posted_at_finish, 'posted_at_start': posted_at_start})
-    result = curs.fetchall()
-    curs.close()
-    conn.close()
-    print(result)
-    return f'Result:{result}'
+    return data_range_response(posted_at_start, posted_at_finish)
+
+
+def data_range_response(posted_at_start, posted_at_finish):
+    try:
+        start = parse_datetime(posted_at_start)
+        finish = parse_datetime(posted_at_finish, end=True)
+        device_id = request.args.get('device_id', type=int)
+        rows, next_cursor = data_range_page(start, finish, device_id,
+                                            request.args.get('cursor'),
+                                            request.args.get('limit', type=int))
+    except ValueError as err:
+        return jsonify({'error': str(err)}), 400
+    return jsonify({'data': dump_rows(rows), 'next': next_cursor})
 
     
 @app.route('/device/<int:device_id>', methods=['GET'])
 def get_device_by_id(device_id):
-    conn = sqlite3.connect('instance/DataDevices.db')
-    curs = conn.cursor()
-    curs.execute('SELECT * FROM devices WHERE _id = :device_id', {'device_id': device_id})
-    result = curs.fetchall()
-    curs.close()
-    conn.close()
-    return jsonify(result)
+    return registry_response(*device_registry.device_body(device_id))
 
 
-    
+def registry_response(body, etag):
+    """ Returns the cached JSON body with a strong ETag, or 304 if the client
+    sent a matching If-None-Match.
+    """
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+@app.route('/export/data.<fmt>', methods=['GET'])
+def export_data(fmt):
+    """ Streams Data rows as NDJSON (/export/data.ndjson) or CSV
+    (/export/data.csv).  Optional query arguments: start, finish, device_id.
+    """
+    formats = {
+        'ndjson': (ndjson_lines, 'application/x-ndjson'),
+        'csv': (csv_lines, 'text/csv'),
+    }
+    if fmt not in formats:
+        return jsonify({'error': f'Unknown export format: {fmt}'}), 404
+    try:
+        start = request.args.get('start')
+        start = parse_datetime(start) if start else None
+        finish = request.args.get('finish')
+        finish = parse_datetime(finish, end=True) if finish else None
+        device_id = request.args.get('device_id', type=int)
+    except ValueError as err:
+        return jsonify({'error': str(err)}), 400
+    encode, mimetype = formats[fmt]
+    batches = iter_data_batches(start, finish, device_id,
+                                app.config.get('EXPORT_BATCH_SIZE', 1000))
+    return Response(stream_with_context(encode(batches)), mimetype=mimetype)
+
+
+@app.route('/rollups/<int:device_id>/<field>', methods=['GET'])
+def get_rollups(device_id, field):
+    """ Returns count, sum, min, max and mean of a numeric reading field per
+    time bucket between the 'start' and 'finish' query arguments.  The
+    coarsest resolution that still gives rollups.MIN_POINTS buckets over the
+    range is used unless 'resolution' (minute, hour or day) is given.  Only
+    the whole minutes inside the range are covered, and the first and last
+    buckets may cover only part of their length.
+    """
+    try:
+        start = parse_datetime(request.args['start'])
+        finish = parse_datetime(request.args['finish'], end=True)
+    except (KeyError, ValueError) as err:
+        return jsonify({'error': f'start and finish are required: {err}'}), 400
+    resolution = request.args.get('resolution')
+    if resolution is not None:
+        if resolution not in RESOLUTION_NAMES:
+            return jsonify({'error': f'Unknown resolution: {resolution}'}), 400
+        resolution = RESOLUTION_NAMES[resolution]
+    resolution, rows = rollup_series(device_id, field, start, finish, resolution)
+    return jsonify({
+        'resolution': resolution,
+        'buckets': [{'bucket': row.bucket.isoformat(), 'count': row.count,
+                     'sum': row.sum, 'min': row.min, 'max': row.max,
+                     'mean': row.sum / row.count} for row in rows],
+    })
+
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """ Recomputes the rollup tables from the data table. """
+    rebuild_rollups(iter_data_batches(None, None,
+                                      batch_size=app.config.get('EXPORT_BATCH_SIZE', 1000)))
+    print('Rollups rebuilt.')
+
+
+@app.cli.command('apply-retention')
+def apply_retention_command():
+    """ Drops or archives the data partitions older than the retention period. """
+    for name in apply_retention():
+        print('Removed partition', name)
+
+
+@app.cli.command('partition-data')
+def partition_data_command():
+    """ Moves the rows of the data table into the monthly partitions. """
+    for name, count in partition_existing_rows().items():
+        print(f'Moved {count} rows to {name}')
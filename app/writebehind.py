@@ -0,0 +1,255 @@
+import atexit
+import datetime
+import json
+import os
+import queue
+import threading
+import time
+
+from app import app, db
+from .ingest import insert_rows
+
+
+class BufferFull(Exception):
+    """ Raised when a row could not be queued before the put timeout ran out. """
+    pass
+
+
+class WriteBehindBuffer:
+    """ Queues validated Data rows and writes them from a single background
+    thread, one transaction per flush.
+
+    A flush happens when flush_rows rows are waiting or flush_interval_ms has
+    passed since the first waiting row arrived, whichever comes first.  The
+    queue is bounded; put() blocks for up to put_timeout seconds when it is
+    full and then raises BufferFull so that callers slow down instead of
+    using unbounded memory.
+
+    Each flush passes the waiting rows to write(rows), by default
+    ingest.insert_rows, on the writer thread inside an app context.  write
+    returns the number of rows written and commits; if it raises, the
+    session is rolled back and the flush is tried once more.  Rows that fail
+    twice are counted as failed and, when dead_letter_path is set, appended
+    to that file as one JSON array per row (datetimes in ISO format, bytes
+    in hex) so that they can be looked at and loaded again by hand.
+
+    The writer thread, called name, is started by start() or the first
+    put(), and stop() flushes whatever is still queued.  stop() is
+    registered with atexit.  It refuses new rows first and waits for the
+    puts already under way, so no row is queued after the final drain.
+    """
+
+    def __init__(self, flask_app, flush_rows=500, flush_interval_ms=200,
+                 queue_size=10000, put_timeout=1.0, write=insert_rows, name='write-behind',
+                 dead_letter_path=None):
+        self.__app = flask_app
+        self.__write = write
+        self.__dead_letter_path = dead_letter_path
+        self.__name = name
+        self.__flush_rows = flush_rows
+        self.__flush_interval = flush_interval_ms / 1000
+        self.__put_timeout = put_timeout
+        self.__queue = queue.Queue(queue_size)
+        self.__thread = None
+        self.__start_lock = threading.Lock()
+        self.__stopping = threading.Event()
+        # Set by stop() once no put is under way; the writer ends when it is
+        # set and the queue is empty.
+        self.__closed = threading.Event()
+        # Guards __stopping against puts and the counters the request
+        # threads update.
+        self.__state = threading.Condition()
+        self.__putting = 0
+        # Counters.  Only the writer thread updates the flush counters.
+        self.__rejected = 0
+        self.__flushes = 0
+        self.__flushed_rows = 0
+        self.__failed_rows = 0
+        self.__retried_flushes = 0
+        self.__dead_letter_rows = 0
+        self.__last_flush_failed = False
+        self.__last_flush_seconds = 0.0
+        self.__max_flush_seconds = 0.0
+        self.__total_flush_seconds = 0.0
+
+    def put(self, row, timeout=None):
+        """ Queues one row as write takes it; for insert_rows a validated
+        tuple followed by its posted_at, so that rows keep the time they
+        arrived rather than the time of the flush.
+        Raises BufferFull if there is no room within the timeout and
+        RuntimeError once the buffer has been stopped.
+        """
+        with self.__state:
+            if self.__stopping.is_set():
+                raise RuntimeError("Write-behind buffer is stopped.")
+            self.__putting += 1
+        try:
+            self.start()
+            self.__queue.put(row, timeout=self.__put_timeout if timeout is None else timeout)
+        except queue.Full:
+            self.__reject(1)
+            raise BufferFull("Write-behind queue is full.")
+        finally:
+            with self.__state:
+                self.__putting -= 1
+                self.__state.notify_all()
+
+    def put_many(self, rows, timeout=None):
+        """ Queues rows in order.  Returns the number queued before the queue
+        filled up or the buffer was stopped (BufferFull is not raised here so
+        the caller can report a partial result).
+        Raises RuntimeError if the buffer was stopped before any row was
+        queued.
+        """
+        queued = 0
+        for row in rows:
+            try:
+                self.put(row, timeout)
+            except BufferFull:
+                self.__reject(len(rows) - queued - 1)
+                break
+            except RuntimeError:
+                if not queued:
+                    raise
+                self.__reject(len(rows) - queued)
+                break
+            queued += 1
+        return queued
+
+    def __reject(self, count):
+        with self.__state:
+            self.__rejected += count
+
+    def start(self):
+        """ Starts the writer thread if it is not running yet. """
+        if self.__thread is None:
+            with self.__start_lock:
+                if self.__thread is None:
+                    thread = threading.Thread(target=self.__run,
+                                              name=self.__name, daemon=True)
+                    thread.start()
+                    atexit.register(self.stop)
+                    self.__thread = thread
+
+    def stop(self, timeout=None):
+        """ Stops accepting rows, flushes what is queued and waits for the
+        writer thread to finish.
+        """
+        with self.__state:
+            self.__stopping.set()
+            self.__state.wait_for(lambda: not self.__putting)
+        self.__closed.set()
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+
+    def stats(self):
+        """ Returns a dict of the buffer counters.  writer_alive is False
+        before start() and once the writer thread has ended.
+        """
+        return {
+            'writer_alive': self.__thread is not None and self.__thread.is_alive(),
+            'queue_depth': self.__queue.qsize(),
+            'queue_size': self.__queue.maxsize,
+            'rejected_rows': self.__rejected,
+            'flushes': self.__flushes,
+            'flushed_rows': self.__flushed_rows,
+            'failed_rows': self.__failed_rows,
+            'retried_flushes': self.__retried_flushes,
+            'dead_letter_rows': self.__dead_letter_rows,
+            'last_flush_failed': self.__last_flush_failed,
+            'last_flush_seconds': self.__last_flush_seconds,
+            'max_flush_seconds': self.__max_flush_seconds,
+            'mean_flush_seconds': (self.__total_flush_seconds / self.__flushes
+                                   if self.__flushes else 0.0),
+        }
+
+    def __run(self):
+        with self.__app.app_context():
+            while not (self.__closed.is_set() and self.__queue.empty()):
+                rows = self.__collect()
+                if rows:
+                    self.__flush(rows)
+
+    def __collect(self):
+        """ Waits for a first row, then gathers rows until flush_rows are
+        waiting or the flush interval has passed.
+        """
+        rows = []
+        try:
+            rows.append(self.__queue.get(timeout=self.__flush_interval))
+        except queue.Empty:
+            return rows
+        deadline = time.monotonic() + self.__flush_interval
+        while len(rows) < self.__flush_rows:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0 or self.__stopping.is_set():
+                    rows.append(self.__queue.get_nowait())
+                else:
+                    rows.append(self.__queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return rows
+
+    def __flush(self, rows):
+        start = time.perf_counter()
+        try:
+            self.__flushed_rows += self.__write_once_more_on_failure(rows)
+            self.__last_flush_failed = False
+        except Exception:
+            self.__failed_rows += len(rows)
+            self.__last_flush_failed = True
+            self.__app.logger.exception("Write-behind flush of %d rows failed", len(rows))
+            self.__dead_letter(rows)
+        elapsed = time.perf_counter() - start
+        self.__flushes += 1
+        self.__last_flush_seconds = elapsed
+        self.__total_flush_seconds += elapsed
+        if elapsed > self.__max_flush_seconds:
+            self.__max_flush_seconds = elapsed
+
+    def __write_once_more_on_failure(self, rows):
+        try:
+            return self.__write(rows)
+        except Exception:
+            db.session.rollback()
+            self.__retried_flushes += 1
+            self.__app.logger.warning("Write-behind flush of %d rows failed, retrying",
+                                      len(rows), exc_info=True)
+        try:
+            return self.__write(rows)
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def __dead_letter(self, rows):
+        if not self.__dead_letter_path:
+            return
+        try:
+            directory = os.path.dirname(self.__dead_letter_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.__dead_letter_path, 'a', encoding='utf-8') as file:
+                for row in rows:
+                    file.write(json.dumps(list(row), default=_dead_letter_value) + '\n')
+            self.__dead_letter_rows += len(rows)
+        except (OSError, TypeError, ValueError):
+            self.__app.logger.exception("Could not write %d failed rows to %s",
+                                        len(rows), self.__dead_letter_path)
+
+
+def _dead_letter_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).hex()
+    raise TypeError(f"Cannot write {type(value).__name__} to the dead letter file")
+
+
+write_behind = WriteBehindBuffer(
+    app,
+    flush_rows=app.config.get('WRITE_BEHIND_FLUSH_ROWS', 500),
+    flush_interval_ms=app.config.get('WRITE_BEHIND_FLUSH_INTERVAL_MS', 200),
+    queue_size=app.config.get('WRITE_BEHIND_QUEUE_SIZE', 10000),
+    put_timeout=app.config.get('WRITE_BEHIND_PUT_TIMEOUT', 1.0),
+    dead_letter_path=app.config.get('WRITE_BEHIND_DEAD_LETTER_FILE'))
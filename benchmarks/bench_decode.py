@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+""" Compares decoding and storing radio frames one at a time with the batch
+decoder (PayloadLayout.unpack_columns and ingest.insert_packed).
+
+Frames are 32 bytes: the fragment header followed by a reading packed in
+the synthetic meter layout.  Both paths store the same rows in a temporary
+SQLite database.
+
+    python benchmarks/bench_decode.py --frames 50000
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def timed(call):
+    start = time.perf_counter()
+    call()
+    return time.perf_counter() - start
+
+
+def benchmark(args):
+    os.environ['DEVELOPMENT_DATABASE_URI'] = f'sqlite:///{os.path.join(args.workdir, "bench.db")}'
+    sys.path.insert(0, ROOT_DIR)
+    sys.path.insert(0, os.path.join(ROOT_DIR, 'app'))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app import app, db
+    from app import payloads
+    from app.ingest import insert_packed, insert_rows
+    from app.models import Device, Devicetype
+    from nrf905.fragments import FRAME_SIZE, HEADER, HEADER_SIZE
+    from synthetic import METER_LAYOUT, make_reading
+
+    layout = payloads.PayloadLayout(METER_LAYOUT)
+    rng = random.Random(args.seed)
+    frames = bytearray()
+    for index in range(args.frames):
+        reading = make_reading(rng, 100001)
+        packed = layout.pack(reading)
+        frames += HEADER.pack(100001, index & 0xff, 0, 0x80 | len(packed)) + packed
+        frames += bytes(FRAME_SIZE - HEADER_SIZE - len(packed))
+    start = datetime.datetime(2026, 1, 1)
+    posted_at = [start + datetime.timedelta(seconds=index * 0.01) for index in range(args.frames)]
+
+    def per_frame_rows():
+        view = memoryview(frames)
+        return [(None, layout.unpack(view[offset + HEADER_SIZE:
+                                          offset + HEADER_SIZE + layout.struct.size]), 1, when)
+                for offset, when in zip(range(0, len(frames), FRAME_SIZE), posted_at)]
+
+    def batch_columns():
+        return layout.unpack_columns(frames, FRAME_SIZE, HEADER_SIZE)
+
+    results = {}
+    for name, numpy in (('numpy', payloads.numpy), ('struct', None)):
+        if name == 'numpy' and numpy is None:
+            continue
+        payloads.numpy = numpy
+        results[f'decode_columns_{name}'] = timed(batch_columns)
+    results['decode_per_frame'] = timed(per_frame_rows)
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(Devicetype(_id=1, name='meter', payload_layout=METER_LAYOUT))
+        db.session.add(Device(_id=1, address=100001, description='meter', device_type='1'))
+        db.session.commit()
+        results['store_per_frame'] = timed(lambda: insert_rows(per_frame_rows()))
+
+        def store_batch():
+            insert_packed(1, layout, frames, posted_at, FRAME_SIZE, HEADER_SIZE)
+            db.session.commit()
+        results['store_batch'] = timed(store_batch)
+
+    for name, seconds in results.items():
+        print(f'{name:24} {seconds * 1000:10.1f} ms {args.frames / seconds:12.0f} frames/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Radio frame decode benchmark.')
+    parser.add_argument('--frames', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        args.workdir = workdir
+        benchmark(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+""" Compares the marshmallow schemas with fastschema.py, in rows per second
+for loading incoming records and for dumping query results.
+
+    python benchmarks/bench_schema.py --rows 100000
+
+Both paths are checked to give the same result before they are timed.
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def rate(rows, call, repeat):
+    """ Best rows per second of repeat runs of call(). """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return rows / best
+
+
+def benchmark(args):
+    os.environ['DEVELOPMENT_DATABASE_URI'] = f'sqlite:///{os.path.join(args.workdir, "bench.db")}'
+    sys.path.insert(0, ROOT_DIR)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from marshmallow import ValidationError
+    from app.fastschema import ROW_FIELDS, dump_rows, load_rows
+    from app.models import Data, DataRowSchema, DataSchema
+    from synthetic import make_reading
+
+    rng = random.Random(args.seed)
+    records = [{'statusmod': 'ON', 'data': make_reading(rng, 100000 + index % 1000),
+                'device_id': 1 + index % 1000} for index in range(args.rows)]
+    start = datetime.datetime(2026, 1, 1)
+    objects = [Data(_id=index + 1, statusmod=record['statusmod'], data=record['data'],
+                    device_id=record['device_id'],
+                    posted_at=start + datetime.timedelta(seconds=index))
+               for index, record in enumerate(records)]
+
+    def marshmallow_rows(schema):
+        rows = []
+        for record in records:
+            try:
+                rows.append(schema.load(record))
+            except ValidationError:
+                pass
+        return rows
+
+    fast_rows, _ = load_rows(records)
+    if [dict(zip(ROW_FIELDS, row)) for row in fast_rows] != marshmallow_rows(DataRowSchema()):
+        raise RuntimeError('fastschema.load_rows disagrees with DataRowSchema')
+    if dump_rows(objects) != DataSchema(many=True).dump(objects):
+        raise RuntimeError('fastschema.dump_rows disagrees with DataSchema')
+
+    results = {
+        'load DataSchema (Data objects)': rate(
+            args.rows, lambda: marshmallow_rows(DataSchema()), args.repeat),
+        'load DataRowSchema (dicts)': rate(
+            args.rows, lambda: marshmallow_rows(DataRowSchema()), args.repeat),
+        'load fastschema (tuples)': rate(args.rows, lambda: load_rows(records), args.repeat),
+        'dump DataSchema': rate(
+            args.rows, lambda: DataSchema(many=True).dump(objects), args.repeat),
+        'dump fastschema': rate(args.rows, lambda: dump_rows(objects), args.repeat),
+    }
+    for name, rows_per_second in results.items():
+        print(f'{name:32} {rows_per_second:12.0f} rows/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Data schema benchmark.')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        args.workdir = workdir
+        benchmark(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+""" Benchmarks the Flask ingest and query routes against a synthetic fleet.
+
+A temporary SQLite database is filled by synthetic.generate_fleet and each
+endpoint is then driven through the Flask test client.  Throughput and
+p50/p95/p99 latency are reported per endpoint and can be written to a JSON
+file, and compared with an earlier run:
+
+    python benchmarks/bench_web.py --devices 2000 --rows 1000000 --output new.json
+    python benchmarks/bench_web.py --output new.json --compare old.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def percentile(sorted_values, fraction):
+    """ Nearest-rank percentile of an already sorted list. """
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarise(latencies, total_seconds, rows=None):
+    latencies = sorted(latencies)
+    result = {
+        'requests': len(latencies),
+        'requests_per_second': round(len(latencies) / total_seconds, 1) if total_seconds else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+    }
+    if rows is not None:
+        result['rows_per_second'] = round(rows / total_seconds, 1) if total_seconds else None
+    return result
+
+
+def run(name, requests, call, rows_per_request=None):
+    """ Calls call(i) for i in range(requests) and returns the summary.
+    call must return the response; a status of 400 or more stops the run.
+    """
+    latencies = []
+    start = time.perf_counter()
+    for index in range(requests):
+        begin = time.perf_counter()
+        response = call(index)
+        latencies.append(time.perf_counter() - begin)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{name}: HTTP {response.status_code} {response.data[:200]!r}')
+    total = time.perf_counter() - start
+    rows = requests * rows_per_request if rows_per_request else None
+    return summarise(latencies, total, rows)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(args):
+    # The app reads its database URI at import time, so point it at the
+    # temporary database before importing it.
+    os.environ['DEVELOPMENT_DATABASE_URI'] = f'sqlite:///{os.path.join(args.workdir, "bench.db")}'
+    sys.path.insert(0, ROOT_DIR)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app import app, db
+    from synthetic import generate_fleet, make_reading
+
+    with app.app_context():
+        db.create_all()
+        start = time.perf_counter()
+        fleet = generate_fleet(devices=args.devices, rows=args.rows, days=args.days,
+                               seed=args.seed,
+                               progress=lambda done, total: print(f'  generated {done}/{total}',
+                                                                  file=sys.stderr))
+        fleet['generate_seconds'] = round(time.perf_counter() - start, 3)
+
+    client = app.test_client()
+    rng = random.Random(args.seed)
+    fleet_end = datetime.datetime.fromisoformat(fleet['end'])
+    n = args.requests
+
+    def random_device():
+        return rng.randrange(1, args.devices + 1)
+
+    def random_day():
+        return (fleet_end - datetime.timedelta(days=rng.randrange(1, args.days + 1))).date()
+
+    def batch_body(size):
+        records = []
+        for _ in range(size):
+            device_id = random_device()
+            records.append({'data': make_reading(rng, 100000 + device_id), 'device_id': device_id})
+        return records
+
+    results = {}
+    results['add_new_data'] = run('add_new_data', n, lambda i: client.get('/add_new_data'))
+    results['add_new_data_batch'] = run(
+        'add_new_data_batch', n,
+        lambda i: client.post('/add_new_data/batch', json=batch_body(args.batch_size)),
+        rows_per_request=args.batch_size)
+    results['devicelist'] = run('devicelist', n, lambda i: client.get('/devicelist'))
+    etag = client.get('/devicelist').headers.get('ETag')
+    results['devicelist_304'] = run(
+        'devicelist_304', n, lambda i: client.get('/devicelist', headers={'If-None-Match': etag}))
+    results['device_by_id'] = run('device_by_id', n,
+                                  lambda i: client.get(f'/device/{random_device()}'))
+
+    def range_query(i):
+        day = random_day()
+        return client.get(f'/get_data_by_postdate/result/{day}/{day}?limit=100')
+    results['date_range'] = run('date_range', n, range_query)
+
+    def range_query_device(i):
+        day = random_day()
+        return client.get(f'/get_data_by_postdate/result/{day}/{day}'
+                          f'?device_id={random_device()}&limit=100')
+    results['date_range_device'] = run('date_range_device', n, range_query_device)
+
+    def export_day(i):
+        day = random_day()
+        response = client.get(f'/export/data.ndjson?start={day}&finish={day}')
+        response.get_data()
+        return response
+    results['export_day_ndjson'] = run('export_day_ndjson', max(1, n // 10), export_day)
+
+    def rollup_month(i):
+        finish = fleet_end.date()
+        start = finish - datetime.timedelta(days=args.days)
+        return client.get(f'/rollups/{random_device()}/amperage?start={start}&finish={finish}')
+    results['rollups_range'] = run('rollups_range', n, rollup_month)
+
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {key: value for key, value in vars(args).items()
+                       if key not in ('workdir', 'output', 'compare')},
+        'fleet': fleet,
+        'results': results,
+    }
+
+
+def print_report(report, baseline=None):
+    print(f"commit {report['commit']}  rows {report['fleet']['rows']}  "
+          f"devices {report['fleet']['devices']}")
+    header = f"{'endpoint':<22}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    if baseline:
+        header += f"{'p50 vs base':>14}"
+    print(header)
+    for name, result in report['results'].items():
+        line = (f"{name:<22}{result['requests_per_second']:>10}{result['p50_ms']:>10}"
+                f"{result['p95_ms']:>10}{result['p99_ms']:>10}")
+        if baseline and name in baseline['results']:
+            base = baseline['results'][name]['p50_ms']
+            if base:
+                line += f"{result['p50_ms'] / base:>13.2f}x"
+        if 'rows_per_second' in result:
+            line += f"  ({result['rows_per_second']} rows/s)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', type=int, default=2000)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--requests', type=int, default=200,
+                        help='requests per endpoint')
+    parser.add_argument('--batch-size', type=int, default=100,
+                        help='records per /add_new_data/batch request')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        args.workdir = workdir
+        report = benchmark(args)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
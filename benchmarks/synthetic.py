@@ -0,0 +1,62 @@
+""" Synthetic fleet generator for the benchmarks.
+
+Creates device types, devices and Data readings in the database of the
+currently configured app.  Readings go through the normal ingest path
+(ingest.insert_rows) so packed payloads, partitions and rollups are
+populated the same way as in production.
+"""
+
+import datetime
+import random
+
+from app import db
+from app.ingest import insert_rows
+from app.models import Device, Devicetype
+
+# Layout of the demo reading used by add_new_data.
+METER_LAYOUT = [['amperage', 'H'], ['address', 'I'], ['user', '16s']]
+
+
+def make_reading(rng, address):
+    return {
+        'amperage': rng.randrange(0, 1000),
+        'address': address,
+        'user': f'user{rng.randrange(0, 10000)}',
+    }
+
+
+def generate_fleet(devices=2000, rows=200000, days=30, seed=1, batch_size=10000,
+                   end=None, progress=None):
+    """ Fills the database with a fleet of devices and their readings.
+    Half of the devices use a type with a payload layout (stored packed),
+    the other half a type without one (stored as JSON).
+    Readings are spread evenly over the 'days' days before 'end' and are
+    inserted in time order, batch_size rows per transaction.
+    Returns a dict describing what was generated.
+    """
+    rng = random.Random(seed)
+    end = end or datetime.datetime(2026, 1, 1)
+    start = end - datetime.timedelta(days=days)
+    db.session.add(Devicetype(_id=1, name='meter', payload_layout=METER_LAYOUT))
+    db.session.add(Devicetype(_id=2, name='sensor'))
+    db.session.add_all([
+        Device(_id=device_id, address=100000 + device_id,
+               description=f'device {device_id}', device_type=str(1 + device_id % 2))
+        for device_id in range(1, devices + 1)
+    ])
+    db.session.commit()
+    step = (end - start) / max(rows, 1)
+    batch = []
+    for index in range(rows):
+        device_id = rng.randrange(1, devices + 1)
+        batch.append((None, make_reading(rng, 100000 + device_id), device_id,
+                      start + step * index))
+        if len(batch) >= batch_size:
+            insert_rows(batch)
+            batch = []
+            if progress:
+                progress(index + 1, rows)
+    if batch:
+        insert_rows(batch)
+    return {'devices': devices, 'rows': rows, 'start': start.isoformat(),
+            'end': end.isoformat(), 'seed': seed}
@@ -5,6 +5,61 @@ app_dir = os.path.abspath(os.path.dirname(__file__))
 class BaseConfig:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'A SECRET KEY'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Applied to every new SQLite connection in the engine pool.
+    # WAL lets readers run while the ingest path is writing.
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 64 * 1024 * 1024,
+        'cache_size': -8000,  # Negative values are KiB, so 8MB.
+    }
+    # Rows fetched per round trip by the streaming export endpoints.
+    EXPORT_BATCH_SIZE = 1000
+    # Seconds before the in-memory device registry is reloaded even without
+    # a write through the models (catches writes by other processes).
+    DEVICE_REGISTRY_TTL = 60
+    # Write-behind ingest buffer: flush every N rows or T milliseconds.
+    WRITE_BEHIND_FLUSH_ROWS = 500
+    WRITE_BEHIND_FLUSH_INTERVAL_MS = 200
+    WRITE_BEHIND_QUEUE_SIZE = 10000
+    # Seconds a producer waits for room before the row is rejected.
+    WRITE_BEHIND_PUT_TIMEOUT = 1.0
+    # Rows whose flush failed twice are appended here, one JSON array per
+    # row; None drops them after logging.
+    WRITE_BEHIND_DEAD_LETTER_FILE = os.path.join(app_dir, 'instance',
+                                                 'write-behind-dead-letter.ndjson')
+    # Store new Data rows in one table per month (see app/partitions.py).
+    # Rows already in the data table stay there and are still read, but
+    # retention only removes partitions; after turning this on, run
+    # `flask --app app partition-data` to move them into their partitions.
+    DATA_PARTITIONING = False
+    # Whole months of partitions to keep before the current one; None keeps
+    # everything.  Expired partitions are dropped, or copied to a SQLite file
+    # per partition in DATA_ARCHIVE_DIR first when the action is 'archive'.
+    DATA_RETENTION_MONTHS = None
+    DATA_RETENTION_ACTION = 'drop'
+    DATA_ARCHIVE_DIR = os.path.join(app_dir, 'instance', 'archive')
+    # Radio ingest service (python -m app.radio_ingest).  RADIO_ADDRESS is
+    # our RX address; None for the frequency keeps the radio's power on
+    # channel.  Messages are written every N rows or T milliseconds.
+    RADIO_SPI_BUS = 0
+    RADIO_ADDRESS = 0xe7e7e7e7
+    RADIO_FREQUENCY_MHZ = None
+    RADIO_INGEST_BATCH_ROWS = 500
+    RADIO_INGEST_BATCH_INTERVAL_MS = 200
+    RADIO_INGEST_QUEUE_SIZE = 10000
+    # Messages with the same source and data as one received this many
+    # seconds before are dropped as repeats.  Keep it below the shortest
+    # reporting interval of the devices.
+    RADIO_INGEST_DEDUP_SECONDS = 2.0
+    RADIO_INGEST_DEDUP_ENTRIES = 4096
+    # A message from an address not in the device registry reloads it, at
+    # most once per this many seconds, before the message is dropped.
+    RADIO_INGEST_UNKNOWN_RELOAD_SECONDS = 5.0
+    RADIO_INGEST_HEALTH_SOCKET = os.path.join(app_dir, 'instance', 'radio-ingest.sock')
+    # The service serves the radio metrics here and /metrics adds them;
+    # None turns both off.
+    RADIO_INGEST_METRICS_SOCKET = os.path.join(app_dir, 'instance', 'radio-ingest-metrics.sock')
 
 
 class DevelopementConfig(BaseConfig):
@@ -17,9 +72,13 @@ class TestingConfig(BaseConfig):
     DEBUG = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('TESTING_DATABASE_URI') or \
 			      'sqlite:///DataDevices.db'
+    SQLITE_PRAGMAS = dict(BaseConfig.SQLITE_PRAGMAS, mmap_size=0)
 
 
 class ProductionConfig(BaseConfig):
     DEBUG = False
     SQLALCHEMY_DATABASE_URI = os.environ.get('PRODUCTION_DATABASE_URI') or \
 	'sqlite:///DataDevices.db'
+    SQLITE_PRAGMAS = dict(BaseConfig.SQLITE_PRAGMAS,
+                          mmap_size=256 * 1024 * 1024,
+                          cache_size=-32000)
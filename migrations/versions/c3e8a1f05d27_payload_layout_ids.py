@@ -0,0 +1,69 @@
+"""payload layout ids
+
+Revision ID: c3e8a1f05d27
+Revises: 56f74216ad4e
+Create Date: 2026-10-17 22:17:41.503118
+
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e8a1f05d27'
+down_revision = '56f74216ad4e'
+branch_labels = None
+depends_on = None
+
+
+def partition_names(connection):
+    return [row[0] for row in connection.execute(sa.text('SELECT name FROM data_partitions'))]
+
+
+def upgrade():
+    op.create_table('payload_layouts',
+    sa.Column('_id', sa.Integer(), nullable=False),
+    sa.Column('fields', sa.Text(), nullable=False),
+    sa.PrimaryKeyConstraint('_id'),
+    sa.UniqueConstraint('fields')
+    )
+    with op.batch_alter_table('data', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('layout_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_data_layout_id_payload_layouts', 'payload_layouts',
+                                    ['layout_id'], ['_id'])
+
+    # Packed rows stored so far were packed with the current layout of their
+    # device's type.  The monthly partitions get the column too.
+    connection = op.get_bind()
+    tables = ['data'] + partition_names(connection)
+    for name in tables[1:]:
+        connection.execute(sa.text(f'ALTER TABLE {name} ADD COLUMN layout_id INTEGER'))
+    types = connection.execute(sa.text(
+        'SELECT _id, payload_layout FROM types_of_devices WHERE payload_layout IS NOT NULL'))
+    for type_id, payload_layout in types:
+        fields = json.loads(payload_layout)
+        if not fields:
+            continue
+        definition = json.dumps([[name, code] for name, code in fields])
+        connection.execute(sa.text('INSERT OR IGNORE INTO payload_layouts (fields) VALUES (:fields)'),
+                           {'fields': definition})
+        layout_id = connection.execute(sa.text('SELECT _id FROM payload_layouts WHERE fields = :fields'),
+                                       {'fields': definition}).scalar()
+        for name in tables:
+            connection.execute(sa.text(
+                f'UPDATE {name} SET layout_id = :layout_id WHERE payload IS NOT NULL AND device_id IN '
+                '(SELECT _id FROM devices WHERE device_type = :type_id)'),
+                {'layout_id': layout_id, 'type_id': str(type_id)})
+
+
+def downgrade():
+    connection = op.get_bind()
+    for name in partition_names(connection):
+        connection.execute(sa.text(f'ALTER TABLE {name} DROP COLUMN layout_id'))
+    with op.batch_alter_table('data', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_data_layout_id_payload_layouts', type_='foreignkey')
+        batch_op.drop_column('layout_id')
+
+    op.drop_table('payload_layouts')
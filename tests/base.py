@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from app import app, db
+from app import partitions, payloads
+from app.models import Device, Devicetype
+from app.registry import device_registry
+
+
+class AppTestCase(unittest.TestCase):
+    """ Runs each test against an empty SQLite database created from the
+    models, with a Flask test client in self.client.  Changes a test makes
+    to app.config are undone afterwards.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        patcher = mock.patch.dict(app.config, {
+            'DATA_ARCHIVE_DIR': os.path.join(self.tmp.name, 'archive')})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with app.app_context():
+            db.engine.dispose()
+            path = db.engine.url.database
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            db.create_all()
+        # Caches of rows that went with the old database file.
+        device_registry.invalidate()
+        partitions._known.clear()
+        payloads._layout_ids.clear()
+        payloads._stored_layouts.clear()
+        self.context = app.app_context()
+        self.context.push()
+        self.addCleanup(self.context.pop)
+        self.addCleanup(db.session.remove)
+        self.client = app.test_client()
+
+    def add_devices(self, payload_layout=None):
+        """ Adds device 1 of type 1, with the given payload layout, and
+        device 2 with no type.
+        """
+        db.session.add(Devicetype(_id=1, name='meter', payload_layout=payload_layout))
+        db.session.add(Device(_id=1, address=0x10, description='meter', device_type='1'))
+        db.session.add(Device(_id=2, address=0x20, description='sensor'))
+        db.session.commit()
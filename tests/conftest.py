@@ -0,0 +1,11 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+# The app reads its configuration when it is first imported, so the test
+# database has to be chosen before any test module imports it.
+_tmp = tempfile.mkdtemp(prefix='datadevices-tests-')
+atexit.register(shutil.rmtree, _tmp, ignore_errors=True)
+os.environ['FLASK_ENV'] = 'config.TestingConfig'
+os.environ['TESTING_DATABASE_URI'] = f'sqlite:///{os.path.join(_tmp, "test.db")}'
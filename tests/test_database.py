@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine
+
+from app import app, db
+from app.database import configure_engine
+
+
+def pragma(connection, name):
+    return connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+
+
+class TestConfigureEngine(unittest.TestCase):
+
+    def test_pragmas_on_pooled_connections(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f'sqlite:///{os.path.join(tmp, "pragmas.db")}',
+                                   pool_size=1, max_overflow=0)
+            configure_engine(engine, {'journal_mode': 'WAL', 'foreign_keys': 'ON'})
+            # The second checkout gets the pooled connection back, which
+            # keeps the pragmas set when it was opened.
+            for _ in range(2):
+                with engine.connect() as connection:
+                    self.assertEqual(pragma(connection, 'journal_mode'), 'wal')
+                    self.assertEqual(pragma(connection, 'foreign_keys'), 1)
+            engine.dispose()
+
+    def test_other_databases_left_alone(self):
+        engine = create_engine('sqlite://')
+        configure_engine(engine, {})
+        with engine.connect() as connection:
+            self.assertEqual(pragma(connection, 'journal_mode'), 'memory')
+            self.assertEqual(pragma(connection, 'foreign_keys'), 0)
+
+    def test_app_engine(self):
+        pragmas = app.config['SQLITE_PRAGMAS']
+        with app.app_context():
+            with db.engine.connect() as connection:
+                self.assertEqual(pragma(connection, 'journal_mode'), pragmas['journal_mode'].lower())
+                self.assertEqual(pragma(connection, 'cache_size'), pragmas['cache_size'])
+                self.assertEqual(pragma(connection, 'mmap_size'), pragmas['mmap_size'])
+                # Not configured, so SQLite's default applies.
+                self.assertEqual(pragma(connection, 'foreign_keys'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+import csv
+import datetime
+import io
+import json
+import unittest
+
+from app import app
+from app.ingest import insert_rows
+from base import AppTestCase
+
+
+class TestExport(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.add_devices(payload_layout=[['amperage', 'H']])
+        app.config['EXPORT_BATCH_SIZE'] = 2
+        start = datetime.datetime(2026, 4, 30, 23, 58)
+        rows = [(None, {'amperage': index}, 1, start + datetime.timedelta(minutes=index))
+                for index in range(5)]
+        rows.append(('ON', {'text': 'hello'}, 2, start))
+        # Rows for April stay in the data table, May's go to a partition.
+        insert_rows(rows[:2] + rows[5:])
+        app.config['DATA_PARTITIONING'] = True
+        insert_rows(rows[2:5])
+
+    def export(self, fmt, **args):
+        response = self.client.get(f'/export/data.{fmt}', query_string=args, buffered=False)
+        self.addCleanup(response.close)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        return [chunk.decode() for chunk in response.iter_encoded()]
+
+    def test_ndjson(self):
+        chunks = self.export('ndjson')
+        # One chunk per batch: two from the data table, two from May.
+        self.assertEqual(len(chunks), 4)
+        records = [json.loads(line) for line in ''.join(chunks).splitlines()]
+        self.assertEqual([(record['statusmod'], record['data'], record['device_id'])
+                          for record in records],
+                         [(None, {'amperage': 0}, 1), ('ON', {'text': 'hello'}, 2),
+                          (None, {'amperage': 1}, 1), (None, {'amperage': 2}, 1),
+                          (None, {'amperage': 3}, 1), (None, {'amperage': 4}, 1)])
+        self.assertEqual(records[3]['posted_at'], '2026-05-01T00:00:00')
+
+    def test_csv(self):
+        chunks = self.export('csv', start='2026-05-01', device_id=1)
+        self.assertEqual(chunks[0], '_id,statusmod,data,posted_at,device_id\r\n')
+        rows = list(csv.reader(io.StringIO(''.join(chunks[1:]))))
+        self.assertEqual([(row[2], row[3], row[4]) for row in rows],
+                         [('{"amperage": 2}', '2026-05-01T00:00:00', '1'),
+                          ('{"amperage": 3}', '2026-05-01T00:01:00', '1'),
+                          ('{"amperage": 4}', '2026-05-01T00:02:00', '1')])
+
+    def test_invalid_arguments(self):
+        self.assertEqual(self.client.get('/export/data.xml').status_code, 404)
+        self.assertEqual(self.client.get('/export/data.csv?start=soon').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
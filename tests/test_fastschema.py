@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import datetime
+import time
+import unittest
+
+from marshmallow import ValidationError
+
+from app.fastschema import ROW_FIELDS, dump_rows, load_rows
+from app.ingest import validate_records
+from app.models import Data, DataRowSchema, DataSchema
+from base import AppTestCase
+
+RECORDS = [
+    {'data': {'amperage': 1}, 'device_id': 1},
+    {'statusmod': 'ON', 'data': [1, 2], 'device_id': '7'},
+    {'statusmod': b'OFF', 'data': 'text', 'device_id': 7.0},
+    {'data': 0},
+    {'data': {}, 'device_id': 7.5},
+    {'data': {}, 'device_id': True},
+    {'data': {}, 'device_id': None},
+    {'data': {}, 'device_id': 'seven'},
+    {'data': {}, 'device_id': [1]},
+    {'data': {}, 'device_id': 10 ** 400},
+    {'data': {}, 'device_id': float('inf')},
+    {'data': {}, 'statusmod': None},
+    {'data': {}, 'statusmod': 5},
+    {'data': {}, 'statusmod': b'\xff'},
+    {'data': None},
+    {},
+    {'data': {}, '_id': 5, 'posted_at': '2026-01-01'},
+    {'data': {}, 'colour': 'red', 'size': 2},
+    ['data', 1],
+    'record',
+    None,
+]
+
+
+def schema_rows(records):
+    rows = []
+    errors = {}
+    schema = DataRowSchema()
+    for index, record in enumerate(records):
+        try:
+            rows.append(schema.load(record))
+        except ValidationError as err:
+            errors[index] = err.messages
+    return rows, errors
+
+
+class TestFastSchema(unittest.TestCase):
+
+    def test_load_matches_schema(self):
+        rows, errors = load_rows(RECORDS)
+        expected_rows, expected_errors = schema_rows(RECORDS)
+        # A missing optional field is None in the tuple.
+        self.assertEqual([dict(zip(ROW_FIELDS, row)) for row in rows],
+                         [dict(dict.fromkeys(ROW_FIELDS), **row) for row in expected_rows])
+        self.assertEqual(errors, expected_errors)
+
+    def test_dump_matches_schema(self):
+        objects = [Data(_id=1, statusmod='ON', data={'amperage': 1}, device_id=2,
+                        posted_at=datetime.datetime(2026, 1, 2, 3, 4, 5, 6)),
+                   Data(_id=2, data=[1, 'a'], posted_at=datetime.datetime(2026, 1, 2))]
+        self.assertEqual(dump_rows(objects), DataSchema(many=True).dump(objects))
+
+
+class TestValidateRecords(AppTestCase):
+
+    def test_rows_are_tuples(self):
+        rows, errors = validate_records(RECORDS[:3] + [None])
+        self.assertEqual(rows, [(None, {'amperage': 1}, 1), ('ON', [1, 2], 7),
+                                ('OFF', 'text', 7)])
+        self.assertEqual(list(errors), [3])
+
+    def test_buffered(self):
+        self.add_devices()
+        response = self.client.post('/add_new_data/buffered', json=RECORDS[:2] + ['record'])
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json['queued'], 2)
+        self.assertEqual(list(response.json['errors']), ['2'])
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            body = self.client.get('/get_data_by_postdate', query_string={
+                'start': '2000-01-01', 'finish': '2100-01-01'}).json
+            if len(body['data']) == 2:
+                break
+            time.sleep(0.05)
+        self.assertEqual([(row['statusmod'], row['data'], row['device_id']) for row in body['data']],
+                         [(None, {'amperage': 1}, 1), ('ON', [1, 2], 7)])
+
+
+if __name__ == '__main__':
+    unittest.main()
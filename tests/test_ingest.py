@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from sqlalchemy import select
+
+from app import db
+from app.models import Data
+from base import AppTestCase
+
+
+class TestBatchIngest(AppTestCase):
+
+    def stored(self):
+        return [(row.statusmod, row.reading, row.device_id)
+                for row in db.session.scalars(select(Data).order_by(Data._id))]
+
+    def test_json_array(self):
+        self.add_devices()
+        response = self.client.post('/add_new_data/batch', json=[
+            {'statusmod': 'ON', 'data': {'amperage': 5}, 'device_id': 1},
+            {'data': {'text': 'hello'}, 'device_id': 2},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['received'], 2)
+        self.assertEqual(response.json['inserted'], 2)
+        self.assertEqual(response.json['errors'], {})
+        self.assertEqual(self.stored(), [('ON', {'amperage': 5}, 1), (None, {'text': 'hello'}, 2)])
+
+    def test_record_errors(self):
+        self.add_devices()
+        response = self.client.post('/add_new_data/batch', json=[
+            {'data': {'amperage': 1}, 'device_id': 1},
+            {'device_id': 'one'},
+            'not a record',
+            {'data': {'amperage': 2}, 'device_id': 1, 'colour': 'red'},
+            {'data': {'amperage': 3}, 'device_id': 1},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['received'], 5)
+        self.assertEqual(response.json['inserted'], 2)
+        self.assertEqual(response.json['errors'], {
+            '1': {'data': ['Missing data for required field.'],
+                  'device_id': ['Not a valid integer.']},
+            '2': {'_schema': ['Invalid input type.']},
+            '3': {'colour': ['Unknown field.']},
+        })
+        self.assertEqual(self.stored(), [(None, {'amperage': 1}, 1), (None, {'amperage': 3}, 1)])
+
+    def test_ndjson(self):
+        self.add_devices()
+        body = ('{"data": {"amperage": 1}, "device_id": 1}\n'
+                '\n'
+                '{"data": {"amperage": 2}, "device_id": 1, "statusmod": "OFF"}\n')
+        response = self.client.post('/add_new_data/batch', data=body,
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['inserted'], 2)
+        self.assertEqual(self.stored(), [(None, {'amperage': 1}, 1), ('OFF', {'amperage': 2}, 1)])
+
+    def test_invalid_body(self):
+        response = self.client.post('/add_new_data/batch', data='{"data": 1}\n{oops',
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('line 2', response.json['error'])
+        response = self.client.post('/add_new_data/batch', data='[{"data": 1}',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stored(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+import time
+import unittest
+
+from app.writebehind import write_behind
+from base import AppTestCase
+
+
+class TestMetrics(AppTestCase):
+
+    def metrics(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        samples = {}
+        for line in response.text.splitlines():
+            if line and not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples, response.text.splitlines()
+
+    def test_request_and_query(self):
+        self.add_devices()
+        request = 'http_request_duration_seconds_count{method="GET",endpoint="/devicelist",status="200"}'
+        query = 'db_query_duration_seconds_count{statement="SELECT"}'
+        before, _ = self.metrics()
+        response = self.client.get('/devicelist')
+        self.assertEqual(response.status_code, 200)
+        after, lines = self.metrics()
+        self.assertEqual(after[request] - before.get(request, 0), 1)
+        # The registry loads the devices and their types.
+        self.assertGreaterEqual(after[query] - before[query], 2)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', lines)
+        self.assertIn(
+            'http_request_duration_seconds_bucket{method="GET",endpoint="/devicelist",'
+            'status="200",le="+Inf"} ' + str(int(after[request])), lines)
+
+    def test_write_behind(self):
+        self.add_devices()
+        flushed = write_behind.stats()['flushed_rows']
+        response = self.client.post('/add_new_data/buffered', json=[{'data': {}, 'device_id': 1}])
+        self.assertEqual(response.status_code, 202)
+        deadline = time.monotonic() + 5
+        while write_behind.stats()['flushed_rows'] == flushed and time.monotonic() < deadline:
+            time.sleep(0.01)
+        samples, lines = self.metrics()
+        stats = write_behind.stats()
+        self.assertEqual(samples['write_behind_flushed_rows_total'], flushed + 1)
+        self.assertIn('# TYPE write_behind_queue_rows gauge', lines)
+        self.assertEqual(samples['write_behind_queue_rows'], stats['queue_depth'])
+        for name in ('rejected_rows', 'flushed_rows', 'failed_rows'):
+            self.assertIn(f'# TYPE write_behind_{name}_total counter', lines)
+            self.assertEqual(samples[f'write_behind_{name}_total'], stats[name])
+
+
+if __name__ == '__main__':
+    unittest.main()
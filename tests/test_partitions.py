@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+import datetime
+import os
+import sqlite3
+import unittest
+
+from sqlalchemy import func, inspect, select, text
+
+from app import app, db, partitions
+from app.ingest import insert_rows
+from app.models import Data, DataPartition, Rollup
+from app.partitions import apply_retention, ensure_partition
+from base import AppTestCase
+
+
+def month_rows(*months):
+    return [(None, {'amperage': month}, 1, datetime.datetime(2026, month, 10))
+            for month in months]
+
+
+class TestPartitions(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.add_devices()
+
+    def partitions(self):
+        return db.session.scalars(select(DataPartition.name).order_by(DataPartition.start)).all()
+
+    def readings(self):
+        response = self.client.get('/get_data_by_postdate', query_string={
+            'start': '2026-01-01', 'finish': '2026-12-31'})
+        return [row['data']['amperage'] for row in response.json['data']]
+
+    def test_partition_existing_rows(self):
+        insert_rows(month_rows(1, 2, 2, 3))
+        self.assertEqual(self.partitions(), [])
+        result = app.test_cli_runner().invoke(args=['partition-data'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Moved 2 rows to data_p202602', result.output)
+        self.assertEqual(self.partitions(), ['data_p202601', 'data_p202602', 'data_p202603'])
+        self.assertEqual(db.session.scalar(select(func.count()).select_from(Data)), 0)
+        self.assertEqual(self.readings(), [1, 2, 2, 3])
+        # New rows go on after the moved ones.
+        app.config['DATA_PARTITIONING'] = True
+        insert_rows(month_rows(2))
+        self.assertEqual(self.readings(), [1, 2, 2, 2, 3])
+
+    def test_retention_archive(self):
+        app.config.update(DATA_PARTITIONING=True, DATA_RETENTION_MONTHS=2,
+                          DATA_RETENTION_ACTION='archive')
+        insert_rows(month_rows(1, 1, 2, 3, 4))
+        rollups = db.session.scalar(select(func.count()).select_from(Rollup))
+        self.assertEqual(apply_retention(now=datetime.datetime(2026, 4, 15)), ['data_p202601'])
+        self.assertEqual(self.partitions(), ['data_p202602', 'data_p202603', 'data_p202604'])
+        self.assertFalse(inspect(db.session.connection()).has_table('data_p202601'))
+        self.assertEqual(self.readings(), [2, 3, 4])
+        self.assertEqual(db.session.scalar(select(func.count()).select_from(Rollup)), rollups)
+        path = os.path.join(app.config['DATA_ARCHIVE_DIR'], 'data_p202601.db')
+        with sqlite3.connect(path) as archive:
+            self.assertEqual(archive.execute('SELECT data, device_id FROM data_p202601').fetchall(),
+                             [('{"amperage": 1}', 1), ('{"amperage": 1}', 1)])
+        archive.close()
+        # Nothing more is due until the month after.
+        self.assertEqual(apply_retention(now=datetime.datetime(2026, 4, 30)), [])
+
+    def test_retention_drop(self):
+        app.config.update(DATA_PARTITIONING=True, DATA_RETENTION_MONTHS=1)
+        insert_rows(month_rows(1, 2, 3))
+        result = app.test_cli_runner().invoke(args=['apply-retention'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(result.output.split(),
+                         ['Removed', 'partition', 'data_p202601',
+                          'Removed', 'partition', 'data_p202602',
+                          'Removed', 'partition', 'data_p202603'])
+        self.assertEqual(self.partitions(), [])
+        self.assertFalse(os.path.exists(app.config['DATA_ARCHIVE_DIR']))
+
+    def test_unpartitioned_rows_kept(self):
+        app.config['DATA_RETENTION_MONTHS'] = 1
+        insert_rows(month_rows(1))
+        self.assertEqual(apply_retention(now=datetime.datetime(2026, 6, 1)), [])
+        self.assertEqual(self.readings(), [1])
+
+    def test_ensure_partition_twice(self):
+        # As if another process created the partition after this one last
+        # looked: the second run finds everything there and adds nothing.
+        for _ in range(2):
+            partitions._known.clear()
+            ensure_partition(datetime.datetime(2026, 5, 1))
+            db.session.commit()
+        self.assertEqual(self.partitions(), ['data_p202605'])
+        self.assertEqual(db.session.execute(text(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'data_p202605'")).scalars().all(),
+            [202605 * partitions.PARTITION_ID_SPAN])
+        app.config['DATA_PARTITIONING'] = True
+        insert_rows(month_rows(5))
+        self.assertEqual(db.session.execute(text('SELECT _id FROM data_p202605')).scalar(),
+                         202605 * partitions.PARTITION_ID_SPAN + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+import datetime
+import unittest
+
+from sqlalchemy import select, update
+
+from app import db
+from app.ingest import insert_packed
+from app.models import Data, Device, Devicetype
+from app.payloads import PayloadLayout
+from base import AppTestCase
+
+LAYOUT = [['amperage', 'H'], ['address', 'I'], ['user', '16s']]
+
+
+class TestPackedPayloads(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.add_devices(payload_layout=LAYOUT)
+
+    def post(self, *records):
+        response = self.client.post('/add_new_data/batch', json=list(records))
+        self.assertEqual(response.json['inserted'], len(records))
+
+    def readings(self):
+        response = self.client.get('/get_data_by_postdate', query_string={
+            'start': '2000-01-01', 'finish': '2100-01-01'})
+        return [row['data'] for row in response.json['data']]
+
+    def stored(self):
+        return db.session.execute(select(Data.data, Data.payload, Data.layout_id)
+                                  .order_by(Data._id)).all()
+
+    def test_round_trip(self):
+        reading = {'amperage': 512, 'address': 0xdeadbeef, 'user': 'kitchen'}
+        self.post({'data': reading, 'device_id': 1},
+                  {'data': {'amperage': 512, 'extra': 1}, 'device_id': 1},
+                  {'data': {'amperage': 70000, 'address': 1, 'user': ''}, 'device_id': 1},
+                  {'data': reading, 'device_id': 2})
+        stored = self.stored()
+        # Only the reading that fits the layout of a typed device is packed.
+        self.assertIsNone(stored[0].data)
+        self.assertEqual(len(stored[0].payload), 22)
+        self.assertIsNotNone(stored[0].layout_id)
+        self.assertEqual([row.payload for row in stored[1:]], [None, None, None])
+        self.assertEqual(self.readings(), [
+            reading, {'amperage': 512, 'extra': 1},
+            {'amperage': 70000, 'address': 1, 'user': ''}, reading])
+
+    def test_device_type_changes(self):
+        self.post({'data': {'amperage': 1, 'address': 2, 'user': 'a'}, 'device_id': 1})
+        # The device moves to a type with no layout: its packed row still
+        # decodes and new readings are kept as JSON.
+        db.session.add(Devicetype(_id=2, name='plain'))
+        db.session.execute(update(Device).where(Device._id == 1).values(device_type='2'))
+        db.session.commit()
+        self.post({'data': {'amperage': 3, 'address': 4, 'user': 'b'}, 'device_id': 1})
+        # Back to its old type, whose layout has since been edited.
+        db.session.execute(update(Devicetype).where(Devicetype._id == 1)
+                           .values(payload_layout=[['amperage', 'I']]))
+        db.session.execute(update(Device).where(Device._id == 1).values(device_type='1'))
+        db.session.commit()
+        self.post({'data': {'amperage': 100000}, 'device_id': 1})
+        stored = self.stored()
+        self.assertEqual([row.payload is not None for row in stored], [True, False, True])
+        self.assertNotEqual(stored[0].layout_id, stored[2].layout_id)
+        self.assertEqual(self.readings(), [{'amperage': 1, 'address': 2, 'user': 'a'},
+                                           {'amperage': 3, 'address': 4, 'user': 'b'},
+                                           {'amperage': 100000}])
+
+    def test_unknown_layout(self):
+        self.post({'data': {'amperage': 1, 'address': 2, 'user': 'a'}, 'device_id': 1})
+        db.session.execute(update(Data).values(layout_id=None))
+        db.session.commit()
+        payload = self.stored()[0].payload
+        self.assertEqual(self.readings(), [{'raw': payload.hex()}])
+
+    def test_insert_packed(self):
+        layout = PayloadLayout(LAYOUT)
+        readings = [{'amperage': index, 'address': index * 10, 'user': f'u{index}'}
+                    for index in range(3)]
+        # As radio frames: a 4 byte header, the record and padding.
+        buffer = b''.join(b'head' + layout.pack(reading) + bytes(6) for reading in readings)
+        self.assertEqual(insert_packed(1, layout, buffer, datetime.datetime(2026, 7, 1),
+                                       stride=32, offset=4), 3)
+        db.session.commit()
+        self.assertEqual(self.readings(), readings)
+
+    def test_float_codes(self):
+        layout = PayloadLayout([['volts', 'f'], ['watts', 'd']])
+        self.assertIsNotNone(layout.pack({'volts': 0.5, 'watts': 0.1}))
+        self.assertIsNotNone(layout.pack({'volts': 230, 'watts': 2 ** 53}))
+        # Values a float code would round are left for JSON.
+        self.assertIsNone(layout.pack({'volts': 0.1, 'watts': 1.0}))
+        self.assertIsNone(layout.pack({'volts': 1.0, 'watts': 2 ** 53 + 1}))
+        db.session.execute(update(Devicetype).where(Devicetype._id == 1)
+                           .values(payload_layout=[['volts', 'f']]))
+        db.session.commit()
+        self.post({'data': {'volts': 0.1}, 'device_id': 1}, {'data': {'volts': 0.25}, 'device_id': 1})
+        self.assertEqual([row.payload is not None for row in self.stored()], [False, True])
+        self.assertEqual(self.readings(), [{'volts': 0.1}, {'volts': 0.25}])
+
+
+if __name__ == '__main__':
+    unittest.main()
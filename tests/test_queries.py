@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import datetime
+import json
+import unittest
+
+from app import app
+from app.ingest import insert_rows
+from base import AppTestCase
+
+
+class TestDataRangePages(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.add_devices()
+        start = datetime.datetime(2026, 1, 31, 23, 0)
+        times = [start + datetime.timedelta(minutes=30 * index) for index in range(6)]
+        # Rows from before partitioning stay in the data table, later ones go
+        # to the partitions for January, February and March.
+        insert_rows([(None, {'n': index}, 1 + index % 2, when) for index, when in enumerate(times)])
+        app.config['DATA_PARTITIONING'] = True
+        march = datetime.datetime(2026, 3, 1)
+        insert_rows([(None, {'n': 6 + index}, 1 + index % 2, when) for index, when in
+                     enumerate(times + [march, march, march])])
+
+    def pages(self, path, **args):
+        numbers = []
+        pages = 0
+        while True:
+            response = self.client.get(path, query_string=args)
+            self.assertEqual(response.status_code, 200)
+            body = response.json
+            numbers.extend(row['data']['n'] for row in body['data'])
+            pages += 1
+            if body['next'] is None:
+                return numbers, pages
+            args['cursor'] = body['next']
+
+    def test_pages_across_partitions(self):
+        numbers, pages = self.pages('/get_data_by_postdate', start='2026-01-01',
+                                    finish='2026-03-31', limit=4)
+        # Ordered by posted_at, then by _id, which is lower in the data table
+        # than in any partition.
+        self.assertEqual(numbers, [0, 6, 1, 7, 2, 8, 3, 9, 4, 10, 5, 11, 12, 13, 14])
+        self.assertEqual(pages, 4)
+
+    def test_range_and_device(self):
+        numbers, _ = self.pages('/get_data_by_postdate/result/2026-02-01T00:00:00/2026-03-01',
+                                device_id=2, limit=1)
+        self.assertEqual(numbers, [3, 9, 5, 11, 13])
+        numbers, _ = self.pages('/get_data_by_postdate', start='2026-02-01T00:00:00',
+                                finish='2026-03-01T00:00:00')
+        self.assertEqual(numbers, [2, 8, 3, 9, 4, 10, 5, 11])
+
+    def test_whole_table_without_range(self):
+        response = self.client.get('/get_data_by_postdate')
+        self.assertEqual(response.status_code, 200)
+        rows = response.json
+        self.assertEqual(len(rows), 15)
+        self.assertEqual(rows[0], [1, None, '{"n": 0}', '2026-01-31 23:00:00.000000', 1])
+        self.assertEqual([json.loads(row[2])['n'] for row in rows], list(range(15)))
+
+    def test_form(self):
+        response = self.client.get('/get_data_by_postdate/form')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'action="/verify"', response.data)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/get_data_by_postdate', query_string={
+            'start': '2026-01-01', 'finish': '2026-03-31', 'cursor': 'nonsense'})
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
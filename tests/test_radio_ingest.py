@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+import datetime
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from sqlalchemy import select, text
+
+from app import app, db
+from app.models import Data
+from app.radio_ingest import RadioIngestService, read_health, read_socket
+# radio_ingest puts app/ on sys.path for the radio stack.
+from nrf905.fragments import fragment
+from nrf905.nrf905_hardware import Nrf905Hardware
+from nrf905.pigpio_sim import SimulatedPi
+from base import AppTestCase
+
+LAYOUT = [['amperage', 'H']]
+
+
+class TestRadioIngestService(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.add_devices(payload_layout=LAYOUT)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.health_socket = os.path.join(tmp.name, 'health.sock')
+        self.metrics_socket = os.path.join(tmp.name, 'metrics.sock')
+        self.pi = SimulatedPi()
+        self.radio = self.pi.radio(0)
+        self.service = RadioIngestService(
+            app, Nrf905Hardware(self.pi), 0x12345678, 433.2, batch_interval_ms=20,
+            health_socket=self.health_socket, metrics_socket=self.metrics_socket,
+            unknown_reload_seconds=0)
+        self.service.start()
+        self.addCleanup(self.stop)
+        self.stopped = False
+        self.message_id = 0
+
+    def stop(self):
+        if not self.stopped:
+            self.stopped = True
+            self.service.stop(5)
+
+    def send(self, source, data):
+        self.message_id += 1
+        self.radio.inject(bytes(next(fragment(data, self.message_id, source))))
+        self.pi.wait_idle()
+
+    def wait_for(self, received, handled):
+        """ Waits until the service has received that many messages and has
+        written or counted as unknown that many.
+        """
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            stats = self.service.stats()
+            if (stats['received_messages'] >= received
+                    and stats['written_rows'] + stats['unknown_device_messages'] >= handled):
+                break
+            time.sleep(0.01)
+        return self.service.stats()
+
+    def stored(self):
+        # End the read transaction so rows the writer thread committed show.
+        db.session.rollback()
+        return db.session.execute(select(Data.device_id, Data.data, Data.payload, Data.posted_at)
+                                  .order_by(Data._id)).all()
+
+    def readings(self):
+        response = self.client.get('/get_data_by_postdate', query_string={
+            'start': '2000-01-01', 'finish': '2100-01-01'})
+        return [(row['device_id'], row['data']) for row in response.json['data']]
+
+    def test_rows_stored(self):
+        before = datetime.datetime.utcnow()
+        self.send(0x10, (512).to_bytes(2, 'little'))
+        self.send(0x20, json.dumps({'amperage': 3}).encode())
+        self.send(0x20, b'\xff\x00')
+        after = datetime.datetime.utcnow()
+        self.wait_for(3, 3)
+        stored = self.stored()
+        # The reading that fits the layout of its device type is packed.
+        self.assertEqual([(row.device_id, row.payload is not None) for row in stored],
+                         [(1, True), (2, False), (2, False)])
+        self.assertEqual(self.readings(), [(1, {'amperage': 512}), (2, {'amperage': 3}),
+                                           (2, {'raw': 'ff00'})])
+        # posted_at is when each message came off the air, from its tick.
+        posted = [row.posted_at for row in stored]
+        self.assertEqual(posted, sorted(posted))
+        margin = datetime.timedelta(seconds=1)
+        for posted_at in posted:
+            self.assertTrue(before - margin <= posted_at <= after + margin, posted_at)
+
+    def test_repeat_dropped(self):
+        reading = json.dumps({'amperage': 7}).encode()
+        # The same reading sent again under a new message id.
+        self.send(0x20, reading)
+        self.send(0x20, reading)
+        self.send(0x20, json.dumps({'amperage': 8}).encode())
+        stats = self.wait_for(3, 2)
+        self.assertEqual(stats['duplicate_messages'], 1)
+        self.assertEqual(stats['written_rows'], 2)
+        self.assertEqual(self.readings(), [(2, {'amperage': 7}), (2, {'amperage': 8})])
+
+    def test_unknown_address(self):
+        self.send(0x30, json.dumps({'amperage': 1}).encode())
+        stats = self.wait_for(1, 1)
+        self.assertEqual(stats['unknown_device_messages'], 1)
+        self.assertEqual(self.stored(), [])
+        # Added behind the registry's back, as by another process.
+        db.session.execute(text("INSERT INTO devices (_id, address, description) "
+                                "VALUES (3, 48, 'new')"))
+        db.session.commit()
+        self.send(0x30, json.dumps({'amperage': 2}).encode())
+        stats = self.wait_for(2, 2)
+        self.assertEqual(stats['unknown_device_messages'], 1)
+        self.assertEqual(self.readings(), [(3, {'amperage': 2})])
+
+    def test_health_socket(self):
+        self.send(0x20, b'{}')
+        self.send(0x30, b'{}')
+        self.wait_for(2, 2)
+        health = read_health(self.health_socket)
+        self.assertEqual(health['status'], 'ok')
+        self.assertEqual((health['received_messages'], health['written_rows'],
+                          health['unknown_device_messages'], health['dropped_messages']),
+                         (2, 1, 1, 0))
+        self.assertEqual(health['queue_size'], 10000)
+        self.assertIsNotNone(health['seconds_since_last_message'])
+        self.assertIn('nrf905_rx_frames_total', read_socket(self.metrics_socket).decode())
+        self.stop()
+        self.assertFalse(os.path.exists(self.health_socket))
+        with self.assertRaises(OSError):
+            read_health(self.health_socket)
+
+
+if __name__ == '__main__':
+    unittest.main()
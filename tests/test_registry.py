@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+import threading
+import unittest
+from unittest import mock
+
+from sqlalchemy import insert, text, update
+
+from app import app, db
+from app.models import Device
+from app.registry import device_registry
+from base import AppTestCase
+
+
+class TestDeviceRegistry(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.add_devices()
+
+    def descriptions(self):
+        return [row[2] for row in self.client.get('/devicelist').json]
+
+    def test_etag(self):
+        response = self.client.get('/devicelist')
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        self.assertEqual(response.json, [[1, 16, 'meter', '1'], [2, 32, 'sensor', None]])
+        response = self.client.get('/devicelist', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        response = self.client.get('/device/1', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, [[1, 16, 'meter', '1']])
+        response = self.client.get('/device/1', headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_unknown_device(self):
+        response = self.client.get('/device/99')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, [])
+        self.assertIsNone(device_registry.get_device(99))
+
+    def test_orm_commit(self):
+        etag = self.client.get('/devicelist').headers['ETag']
+        db.session.add(Device(_id=3, address=0x30, description='new'))
+        db.session.commit()
+        response = self.client.get('/devicelist', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row[2] for row in response.json], ['meter', 'sensor', 'new'])
+        self.assertEqual(device_registry.get_device_by_address(0x30)[0], 3)
+
+    def test_core_writes(self):
+        self.assertEqual(self.descriptions(), ['meter', 'sensor'])
+        db.session.execute(update(Device).where(Device._id == 2).values(description='renamed'))
+        db.session.commit()
+        self.assertEqual(self.descriptions(), ['meter', 'renamed'])
+        with db.engine.begin() as connection:
+            connection.execute(insert(Device).values(_id=3, address=0x30, description='core'))
+        self.assertEqual(self.descriptions(), ['meter', 'renamed', 'core'])
+
+    def test_rollback(self):
+        self.assertEqual(device_registry.get_device(2)[2], 'sensor')
+        db.session.execute(update(Device).where(Device._id == 2).values(description='undone'))
+        # Read through the same session, the write shows until it is undone.
+        self.assertEqual(device_registry.get_device(2)[2], 'undone')
+        db.session.rollback()
+        self.assertEqual(device_registry.get_device(2)[2], 'sensor')
+
+    def test_raw_sql_needs_ttl(self):
+        self.assertEqual(self.descriptions(), ['meter', 'sensor'])
+        db.session.execute(text("UPDATE devices SET description = 'raw' WHERE _id = 2"))
+        db.session.commit()
+        self.assertEqual(self.descriptions(), ['meter', 'sensor'])
+        device_registry.refresh(0)
+        self.assertEqual(self.descriptions(), ['meter', 'raw'])
+
+    def test_write_during_load(self):
+        execute = db.session.execute
+        calls = []
+
+        def execute_and_write(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 1:
+                # As if another thread committed a device while loading.
+                device_registry.invalidate()
+            return execute(*args, **kwargs)
+
+        with mock.patch.object(db.session, 'execute', side_effect=execute_and_write):
+            device_registry.get_device(1)
+            self.assertEqual(len(calls), 2)
+            # The load saw an older generation, so the next read loads again.
+            device_registry.get_device(1)
+            self.assertEqual(len(calls), 4)
+            device_registry.get_device(1)
+            self.assertEqual(len(calls), 4)
+
+    def test_readers_wait_for_first_load(self):
+        execute = db.session.execute
+        loading = threading.Event()
+        release = threading.Event()
+
+        def slow_execute(*args, **kwargs):
+            loading.set()
+            release.wait(5)
+            return execute(*args, **kwargs)
+
+        def load():
+            with app.app_context():
+                device_registry.devices_body()
+
+        results = []
+        with mock.patch.object(db.session, 'execute', side_effect=slow_execute):
+            loader = threading.Thread(target=load)
+            loader.start()
+            self.assertTrue(loading.wait(5))
+            reader = threading.Thread(target=lambda: results.append(device_registry.devices_body()))
+            reader.start()
+            reader.join(0.2)
+            # Still waiting for the load, not served an empty list.
+            self.assertEqual(results, [])
+            release.set()
+            loader.join(5)
+            reader.join(5)
+        body, etag = results[0]
+        self.assertIn(b'"meter"', body)
+        self.assertNotEqual(etag, '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+import datetime
+import unittest
+
+from app import app
+from app.ingest import insert_rows
+from app.rollups import DAY, HOUR, MINUTE, bucket_start, choose_resolution
+from base import AppTestCase
+
+START = datetime.datetime(2026, 6, 1)
+
+
+class TestChooseResolution(unittest.TestCase):
+
+    def test_coarsest_with_enough_points(self):
+        hours = datetime.timedelta(hours=1)
+        self.assertEqual(choose_resolution(START, START + 2 * hours), MINUTE)
+        self.assertEqual(choose_resolution(START, START + 23 * hours), MINUTE)
+        self.assertEqual(choose_resolution(START, START + 24 * hours), HOUR)
+        self.assertEqual(choose_resolution(START, START + 23 * 24 * hours), HOUR)
+        self.assertEqual(choose_resolution(START, START + 24 * 24 * hours), DAY)
+        self.assertEqual(choose_resolution(START, START + 365 * 24 * hours), DAY)
+
+
+class TestRollupsEndpoint(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.add_devices()
+        # A reading every 10 minutes for three days.
+        self.readings = [(START + datetime.timedelta(minutes=10 * index), index % 50)
+                         for index in range(3 * 24 * 6)]
+        insert_rows([(None, {'amperage': value, 'state': 'ok'}, 1, when)
+                     for when, value in self.readings])
+
+    def expected(self, start, finish, resolution):
+        """ The buckets as added up from the readings themselves, with the
+        partial bucket at the start reported from the start of the range.
+        """
+        buckets = {}
+        for when, value in self.readings:
+            if start <= when < finish:
+                bucket = max(bucket_start(when, resolution), start)
+                buckets.setdefault(bucket, []).append(value)
+        return [{'bucket': bucket.isoformat(), 'count': len(values), 'sum': sum(values),
+                 'min': min(values), 'max': max(values), 'mean': sum(values) / len(values)}
+                for bucket, values in sorted(buckets.items())]
+
+    def rollups(self, start, finish, **args):
+        response = self.client.get('/rollups/1/amperage', query_string=dict(
+            args, start=start.isoformat(), finish=finish.isoformat()))
+        self.assertEqual(response.status_code, 200)
+        return response.json
+
+    def test_hours_with_partial_ends(self):
+        start = START + datetime.timedelta(hours=5, minutes=30)
+        finish = start + datetime.timedelta(days=1, hours=2)
+        body = self.rollups(start, finish)
+        self.assertEqual(body['resolution'], HOUR)
+        self.assertEqual(body['buckets'], self.expected(start, finish, HOUR))
+        self.assertEqual(len(body['buckets']), 27)
+        self.assertEqual(body['buckets'][0]['count'], 3)
+        self.assertEqual(body['buckets'][-1]['count'], 3)
+
+    def test_days_with_partial_ends(self):
+        start = START + datetime.timedelta(hours=12, minutes=20)
+        finish = START + datetime.timedelta(days=2, hours=7, minutes=40)
+        body = self.rollups(start, finish, resolution='day')
+        self.assertEqual(body['resolution'], DAY)
+        self.assertEqual(body['buckets'], self.expected(start, finish, DAY))
+        self.assertEqual([bucket['count'] for bucket in body['buckets']], [70, 144, 46])
+
+    def test_minutes(self):
+        start = START + datetime.timedelta(hours=1, seconds=30)
+        body = self.rollups(start, start + datetime.timedelta(hours=1))
+        self.assertEqual(body['resolution'], MINUTE)
+        # Narrowed to whole minutes, 01:01 to 02:00, so neither the reading
+        # at 01:00 nor the one at 02:00 is counted.
+        self.assertEqual(body['buckets'],
+                         self.expected(START + datetime.timedelta(hours=1, minutes=1),
+                                       START + datetime.timedelta(hours=2), MINUTE))
+        self.assertEqual(len(body['buckets']), 5)
+        body = self.rollups(start, start + datetime.timedelta(seconds=20))
+        self.assertEqual(body['buckets'], [])
+
+    def test_rebuild(self):
+        start = START + datetime.timedelta(hours=5, minutes=30)
+        finish = start + datetime.timedelta(days=1, hours=2)
+        before = self.rollups(start, finish)
+        result = app.test_cli_runner().invoke(args=['rebuild-rollups'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(self.rollups(start, finish), before)
+
+    def test_unknown_field_and_errors(self):
+        self.assertEqual(self.client.get('/rollups/1/state', query_string={
+            'start': '2026-06-01', 'finish': '2026-06-02'}).json['buckets'], [])
+        self.assertEqual(self.client.get('/rollups/1/amperage', query_string={
+            'start': '2026-06-01', 'finish': '2026-06-02', 'resolution': 'week'}).status_code, 400)
+        self.assertEqual(self.client.get('/rollups/1/amperage?start=2026-06-01').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+import datetime
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from app import app
+from app.writebehind import BufferFull, WriteBehindBuffer
+from base import AppTestCase
+
+
+class Writer:
+    """ A write function for the buffer that records each batch and can be
+    held back or made to fail.
+    """
+
+    def __init__(self, failures=0):
+        self.batches = []
+        self.times = []
+        self.failures = failures
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, rows):
+        self.release.wait(5)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("write failed")
+        self.batches.append(list(rows))
+        self.times.append(time.monotonic())
+        return len(rows)
+
+    def rows(self):
+        return [row for batch in self.batches for row in batch]
+
+    def wait_for(self, count, timeout=5):
+        deadline = time.monotonic() + timeout
+        while len(self.rows()) < count and time.monotonic() < deadline:
+            time.sleep(0.005)
+        return self.rows()
+
+
+class TestWriteBehindBuffer(unittest.TestCase):
+
+    def buffer(self, writer, **kwargs):
+        buffer = WriteBehindBuffer(app, write=writer, **kwargs)
+        self.addCleanup(buffer.stop, 5)
+        return buffer
+
+    def test_flush_by_rows(self):
+        writer = Writer()
+        buffer = self.buffer(writer, flush_rows=3, flush_interval_ms=2000)
+        started = time.monotonic()
+        self.assertEqual(buffer.put_many([(index,) for index in range(7)]), 7)
+        writer.wait_for(6)
+        # Two full batches go at once, without waiting for the interval.
+        self.assertEqual(writer.batches, [[(0,), (1,), (2,)], [(3,), (4,), (5,)]])
+        self.assertLess(writer.times[1] - started, 1.0)
+        buffer.stop(5)
+        self.assertEqual(writer.batches[2:], [[(6,)]])
+        self.assertEqual(buffer.stats()['flushed_rows'], 7)
+        self.assertEqual(buffer.stats()['flushes'], 3)
+
+    def test_flush_by_interval(self):
+        writer = Writer()
+        buffer = self.buffer(writer, flush_rows=100, flush_interval_ms=100)
+        started = time.monotonic()
+        buffer.put_many([(1,), (2,)])
+        self.assertEqual(writer.wait_for(2), [(1,), (2,)])
+        self.assertEqual(len(writer.batches), 1)
+        self.assertGreaterEqual(writer.times[0] - started, 0.09)
+
+    def test_full(self):
+        writer = Writer()
+        writer.release.clear()
+        buffer = self.buffer(writer, flush_rows=1, flush_interval_ms=10,
+                             queue_size=2, put_timeout=0.05)
+        queued = buffer.put_many([(index,) for index in range(6)])
+        # The writer holds at most one row while the queue holds two.
+        self.assertIn(queued, (2, 3))
+        self.assertEqual(buffer.stats()['rejected_rows'], 6 - queued)
+        with self.assertRaises(BufferFull):
+            buffer.put((9,), timeout=0)
+        writer.release.set()
+        buffer.stop(5)
+        self.assertEqual(writer.rows(), [(index,) for index in range(queued)])
+
+    def test_stop_drains_queue(self):
+        writer = Writer()
+        writer.release.clear()
+        buffer = self.buffer(writer, flush_rows=4, flush_interval_ms=50)
+        buffer.put_many([(index,) for index in range(10)])
+        stopper = threading.Thread(target=buffer.stop, args=(5,))
+        stopper.start()
+        writer.release.set()
+        stopper.join(5)
+        self.assertFalse(stopper.is_alive())
+        self.assertEqual(writer.rows(), [(index,) for index in range(10)])
+        self.assertFalse(buffer.stats()['writer_alive'])
+        with self.assertRaises(RuntimeError):
+            buffer.put((10,))
+        with self.assertRaises(RuntimeError):
+            buffer.put_many([(10,)])
+
+    def test_puts_racing_stop(self):
+        writer = Writer()
+        buffer = self.buffer(writer, flush_rows=50, flush_interval_ms=5)
+        accepted = []
+
+        def produce(producer):
+            for index in range(100000):
+                try:
+                    buffer.put((producer, index))
+                except RuntimeError:
+                    return
+                accepted.append((producer, index))
+
+        producers = [threading.Thread(target=produce, args=(producer,)) for producer in range(4)]
+        for producer in producers:
+            producer.start()
+        time.sleep(0.05)
+        buffer.stop(5)
+        for producer in producers:
+            producer.join(5)
+        self.assertTrue(accepted)
+        # Every row a put accepted was written, none after the final drain.
+        self.assertEqual(sorted(writer.rows()), sorted(accepted))
+
+    def test_retry_once(self):
+        writer = Writer(failures=1)
+        buffer = self.buffer(writer, flush_rows=2, flush_interval_ms=10)
+        buffer.put_many([(1,), (2,)])
+        self.assertEqual(writer.wait_for(2), [(1,), (2,)])
+        buffer.stop(5)
+        stats = buffer.stats()
+        self.assertEqual((stats['retried_flushes'], stats['failed_rows']), (1, 0))
+        self.assertFalse(stats['last_flush_failed'])
+
+    def test_dead_letter(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'failed', 'rows.ndjson')
+            writer = Writer(failures=2)
+            buffer = self.buffer(writer, flush_rows=2, flush_interval_ms=10,
+                                 dead_letter_path=path)
+            when = datetime.datetime(2026, 8, 1, 12, 30)
+            with self.assertLogs(app.logger, 'ERROR'):
+                buffer.put_many([(None, {'amperage': 1}, 1, when), (7, b'\x01\xff', when)])
+                buffer.stop(5)
+            stats = buffer.stats()
+            self.assertEqual((stats['failed_rows'], stats['dead_letter_rows']), (2, 2))
+            self.assertTrue(stats['last_flush_failed'])
+            with open(path) as file:
+                self.assertEqual([json.loads(line) for line in file], [
+                    [None, {'amperage': 1}, 1, '2026-08-01T12:30:00'],
+                    [7, '01ff', '2026-08-01T12:30:00']])
+
+
+class TestBufferedEndpoint(AppTestCase):
+
+    def use_buffer(self, writer, **kwargs):
+        buffer = WriteBehindBuffer(app, write=writer, **kwargs)
+        self.addCleanup(buffer.stop, 5)
+        patcher = mock.patch('app.views.write_behind', buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return buffer
+
+    def test_accepted(self):
+        writer = Writer()
+        self.use_buffer(writer, flush_rows=2, flush_interval_ms=20)
+        response = self.client.post('/add_new_data/buffered', json=[
+            {'data': {'amperage': 1}, 'device_id': 1}, {'device_id': 1}])
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json['queued'], 1)
+        self.assertEqual(list(response.json['errors']), ['1'])
+        rows = writer.wait_for(1)
+        self.assertEqual(rows[0][:3], (None, {'amperage': 1}, 1))
+        self.assertIsInstance(rows[0][3], datetime.datetime)
+        stats = self.client.get('/add_new_data/buffer').json
+        self.assertEqual(stats['flushed_rows'], 1)
+        self.assertTrue(stats['writer_alive'])
+
+    def test_full(self):
+        writer = Writer()
+        writer.release.clear()
+        self.use_buffer(writer, flush_rows=1, flush_interval_ms=10,
+                        queue_size=2, put_timeout=0.05)
+        response = self.client.post('/add_new_data/buffered', json=[
+            {'data': {'amperage': index}, 'device_id': 1} for index in range(6)])
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertIn(response.json['queued'], (2, 3))
+        self.assertEqual(self.client.get('/add_new_data/buffer').json['rejected_rows'],
+                         6 - response.json['queued'])
+        writer.release.set()
+
+    def test_stopped(self):
+        buffer = self.use_buffer(Writer())
+        buffer.stop()
+        response = self.client.post('/add_new_data/buffered', json=[
+            {'data': {'amperage': 1}, 'device_id': 1}])
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertIn('stopped', response.json['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()